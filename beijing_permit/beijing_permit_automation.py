@@ -2,21 +2,21 @@
 # -*- coding: utf-8 -*-
 """
 自动办理进京证脚本
-每天定时检查并自动办理进京证
+按进京证到期日期定时检查并自动办理进京证
 """
 
-import requests
+import asyncio
 import json
-import smtplib
 from datetime import datetime, timedelta
-from email.mime.text import MimeText
-from email.mime.multipart import MimeMultipart
-import schedule
-import time
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, List, Dict, Any
 import os
 
+from permit_client import PermitAPIClient, DEFAULT_BASE_URL
+from scheduler import PermitScheduler
+from state_store import PermitStateStore
+from notify_client import NotificationClient
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -29,107 +29,105 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# 剩余天数不超过该值时自动办理新的进京证
+RENEW_DAYS_LEFT = 2
+
+# 每次办理的进京证有效天数
+PERMIT_VALID_DAYS = 7
+
+
 class BeijingPermitAuto:
-    def __init__(self):
-        """初始化配置"""
+    def __init__(self, default_client: bool = True):
+        """初始化配置
+
+        Args:
+            default_client: 是否为环境变量配置的账号创建API客户端（车队模式每个账号单独创建，传 False）
+        """
         # 从环境变量或配置文件读取敏感信息
         self.username = os.getenv('BEIJING_USERNAME')
         self.password = os.getenv('BEIJING_PASSWORD')
         self.phone = os.getenv('BEIJING_PHONE')
         self.car_plate = os.getenv('BEIJING_CAR_PLATE')
 
+        # 本地状态缓存：缓存的进京证仍有效且未过期时不查询远程接口
+        self.state = PermitStateStore()
+        self.state_ttl = float(os.getenv('BEIJING_STATE_TTL', str(2 * 86400)))
+        self.use_cache = True
+
         # API配置（需要通过抓包获取真实API）
-        self.base_url = "https://api.beijing.gov.cn"  # 需要替换为真实API地址
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Linux; Android 10; ...)',  # 需要替换
-            'X-App-Version': '3.2.1',
-            'Content-Type': 'application/json'
-        }
+        self.base_url = os.getenv('BEIJING_API_BASE_URL', DEFAULT_BASE_URL)
+        self.api_timeout = float(os.getenv('BEIJING_API_TIMEOUT', '10'))
+        self.api_max_retries = int(os.getenv('BEIJING_API_MAX_RETRIES', '3'))
+        self.client = self.make_client(self.username, self.password) if default_client else None
 
-        # 邮件配置
-        self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-        self.smtp_port = int(os.getenv('SMTP_PORT', '587'))
-        self.email_user = os.getenv('EMAIL_USER')
-        self.email_password = os.getenv('EMAIL_PASSWORD')
-        self.recipient = os.getenv('RECIPIENT_EMAIL', self.email_user)
+        # 单次检查的总超时，避免请求挂起导致定时任务停滞
+        self.check_timeout = float(os.getenv('BEIJING_CHECK_TIMEOUT', '300'))
 
-        self.session = requests.session()
-        self.token = None
-        self.refresh_token = None
+        # 通知通过通知中心发送，收件人不配置时使用通知中心的默认收件人
+        recipient = os.getenv('RECIPIENT_EMAIL')
+        self.notifier = NotificationClient(recipients=[recipient] if recipient else None)
 
-    def login(self) -> bool:
+    def make_client(self, username: str, password: str) -> PermitAPIClient:
         """
-        登录获取token
-        需要根据实际API实现
+        为账号创建API客户端（每个账号一个客户端，复用连接和token）
         """
-        try:
-            # 示例：需要替换为真实的登录API
-            login_data = {
-                'username': self.username,
-                'password': self.password,
-                'device_id': 'unique_device_id'  # 可能需要设备ID
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/auth/login",
-                headers=self.headers,
-                json=login_data
-            )
+        client = PermitAPIClient(
+            username,
+            password,
+            base_url=self.base_url,
+            timeout=self.api_timeout,
+            max_retries=self.api_max_retries,
+            on_token=lambda c: self.state.save_token(c.username, c.token, c.refresh_token, c.token_expires_at)
+        )
+
+        # 复用重启前保存的token
+        saved = self.state.load_token(username)
+        if saved:
+            client.restore_token(saved['access_token'], saved['refresh_token'], saved['expires_at'])
+        return client
+
+    def cached_permit(self, car_plate: str) -> Optional[Dict[str, Any]]:
+        """
+        缓存中仍然有效、无需办理且未过期的进京证状态，没有时返回 None（需要查询远程接口）
+        """
+        cached = self.state.get_permit(car_plate)
+        if not cached or cached['status'] not in ('valid', 'applied') or not cached['end_date']:
+            return None
 
-            if response.status_code == 200:
-                result = response.json()
-                self.token = result.get('access_token')
-                self.refresh_token = result.get('refresh_token')
-                self.headers['Authorization'] = f'Bearer {self.token}'
-                logger.info("登录成功")
-                return True
-            else:
-                logger.error(f"登录失败: {response.status_code} - {response.text}")
-                return False
+        checked_at = datetime.fromisoformat(cached['checked_at'])
+        if (datetime.now() - checked_at).total_seconds() > self.state_ttl:
+            return None
 
-        except Exception as e:
-            logger.error(f"登录异常: {e}")
-            return False
+        days_left = (datetime.strptime(cached['end_date'], '%Y-%m-%d') - datetime.now()).days
+        if days_left <= RENEW_DAYS_LEFT:
+            return None
+        return {'valid': True, 'end_date': cached['end_date'], 'days_left': days_left}
 
-    def refresh_access_token(self) -> bool:
+    async def login(self) -> bool:
         """
-        刷新token
+        确保已登录：token有效时直接复用，即将过期时刷新，否则重新登录
         """
-        try:
-            refresh_data = {
-                'refresh_token': self.refresh_token
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/auth/refresh",
-                headers=self.headers,
-                json=refresh_data
-            )
+        return await self.client.ensure_token()
 
-            if response.status_code == 200:
-                result = response.json()
-                self.token = result.get('access_token')
-                self.headers['Authorization'] = f'Bearer {self.token}'
-                logger.info("Token刷新成功")
-                return True
-            else:
-                logger.error("Token刷新失败，需要重新登录")
-                return self.login()
-
-        except Exception as e:
-            logger.error(f"Token刷新异常: {e}")
-            return self.login()
+    async def refresh_access_token(self) -> bool:
+        """
+        刷新token，失败时重新登录
+        """
+        return await self.client.refresh_access_token() or await self.client.login()
 
-    def check_current_permit(self) -> Optional[Dict[str, Any]]:
+    async def check_current_permit(self, car_plate: str = None,
+                                   client: PermitAPIClient = None) -> Optional[Dict[str, Any]]:
         """
-        查询当前进京证状态
+        查询当前进京证状态（默认查询环境变量配置的车辆）
         """
+        car_plate = car_plate or self.car_plate
+        client = client or self.client
         try:
             # 示例：需要替换为真实的查询API
-            response = self.session.get(
-                f"{self.base_url}/permit/current",
-                headers=self.headers,
-                params={'car_plate': self.car_plate}
+            response = await client.request(
+                'GET',
+                '/permit/current',
+                params={'car_plate': car_plate}
             )
 
             if response.status_code == 200:
@@ -139,14 +137,14 @@ class BeijingPermitAuto:
                     end_date = datetime.strptime(permit['end_date'], '%Y-%m-%d')
                     days_left = (end_date - datetime.now()).days
 
-                    logger.info(f"当前进京证有效期至: {permit['end_date']}, 剩余{days_left}天")
+                    logger.info(f"{car_plate} 当前进京证有效期至: {permit['end_date']}, 剩余{days_left}天")
                     return {
                         'valid': True,
                         'end_date': permit['end_date'],
                         'days_left': days_left
                     }
                 else:
-                    logger.info("当前无有效进京证")
+                    logger.info(f"{car_plate} 当前无有效进京证")
                     return {'valid': False}
             else:
                 logger.error(f"查询失败: {response.status_code} - {response.text}")
@@ -156,17 +154,19 @@ class BeijingPermitAuto:
             logger.error(f"查询异常: {e}")
             return None
 
-    def apply_permit(self) -> bool:
+    async def apply_permit(self, car_plate: str = None, client: PermitAPIClient = None) -> bool:
         """
-        申请新的进京证
+        申请新的进京证（默认为环境变量配置的车辆申请）
         """
+        car_plate = car_plate or self.car_plate
+        client = client or self.client
         try:
             # 示例：需要替换为真实的申请API
             apply_data = {
-                'car_plate': self.car_plate,
+                'car_plate': car_plate,
                 'car_type': 'private',  # 私家车
                 'entry_date': datetime.now().strftime('%Y-%m-%d'),
-                'exit_date': (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d'),
+                'exit_date': (datetime.now() + timedelta(days=PERMIT_VALID_DAYS)).strftime('%Y-%m-%d'),
                 'reason': '通勤',  # 进京事由
                 'routes': []  # 进京路线
             }
@@ -175,16 +175,12 @@ class BeijingPermitAuto:
             # captcha_id = self.get_captcha()
             # apply_data['captcha_id'] = captcha_id
 
-            response = self.session.post(
-                f"{self.base_url}/permit/apply",
-                headers=self.headers,
-                json=apply_data
-            )
+            response = await client.request('POST', '/permit/apply', idempotent=False, json=apply_data)
 
             if response.status_code == 200:
                 result = response.json()
                 if result.get('success'):
-                    logger.info("进京证申请成功")
+                    logger.info(f"{car_plate} 进京证申请成功")
                     return True
                 else:
                     logger.error(f"申请失败: {result.get('message')}")
@@ -197,107 +193,169 @@ class BeijingPermitAuto:
             logger.error(f"申请异常: {e}")
             return False
 
-    def send_email_notification(self, subject: str, content: str):
+    def send_notification(self, subject: str, content: str, level: str = 'info'):
         """
-        发送邮件通知
+        发送通知（提交到通知中心后台发送，不阻塞检查流程）
         """
-        try:
-            msg = MimeMultipart()
-            msg['From'] = self.email_user
-            msg['To'] = self.recipient
-            msg['Subject'] = subject
-
-            body = MimeText(content, 'plain', 'utf-8')
-            msg.attach(body)
+        self.notifier.notify(subject, content, level)
 
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.email_user, self.email_password)
-                server.send_message(msg)
-
-            logger.info("邮件通知发送成功")
+    async def process_vehicle(self, car_plate: str = None, client: PermitAPIClient = None,
+                              use_cache: bool = None) -> Dict[str, Any]:
+        """
+        检查单辆车的进京证，需要时自动办理，返回处理结果（不发送通知），结果写入本地状态缓存
 
-        except Exception as e:
-            logger.error(f"邮件发送失败: {e}")
+        Args:
+            use_cache: 缓存显示进京证仍然有效时直接返回，不请求远程接口（默认取 self.use_cache）
 
-    def daily_check(self):
+        Returns:
+            Dict: car_plate, status（login_failed/check_failed/valid/applied/apply_failed）,
+                  days_left, end_date, cached
         """
-        每日检查任务
+        car_plate = car_plate or self.car_plate
+        use_cache = self.use_cache if use_cache is None else use_cache
+        cached = self.cached_permit(car_plate) if use_cache else None
+        if cached:
+            logger.info(f"{car_plate} 缓存的进京证仍然有效（剩余{cached['days_left']}天），跳过查询")
+            return {'car_plate': car_plate, 'status': 'valid', 'days_left': cached['days_left'],
+                    'end_date': cached['end_date'], 'cached': True}
+
+        outcome = await self._process_vehicle(car_plate, client or self.client)
+        self.state.save_outcome(outcome)
+        return outcome
+
+    async def _process_vehicle(self, car_plate: str, client: PermitAPIClient) -> Dict[str, Any]:
         """
-        logger.info("开始每日进京证检查...")
+        查询远程接口并在需要时办理
+        """
+        outcome = {'car_plate': car_plate, 'status': None, 'days_left': None, 'end_date': None, 'cached': False}
 
-        # 登录
-        if not self.login():
-            self.send_email_notification(
-                "进京证自动检查-登录失败",
-                "无法登录北京交警APP，请检查账号密码或App是否有更新"
-            )
-            return
+        # 登录（已有有效token时不会发起请求）
+        if not await client.ensure_token():
+            outcome['status'] = 'login_failed'
+            return outcome
 
         # 查询当前进京证状态
-        permit_status = self.check_current_permit()
+        permit_status = await self.check_current_permit(car_plate, client)
 
         if permit_status is None:
-            self.send_email_notification(
-                "进京证自动检查-查询失败",
-                f"无法查询当前进京证状态于{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            )
-            return
+            outcome['status'] = 'check_failed'
+            return outcome
 
         if permit_status.get('valid'):
-            days_left = permit_status['days_left']
-            if days_left <= 2:  # 剩余2天时自动办理
-                logger.info("进京证即将到期，开始办理新的...")
-                if self.apply_permit():
-                    self.send_email_notification(
-                        "进京证自动办理成功",
-                        f"您的车辆{self.car_plate}的新进京证已成功办理。\n"
-                        f"有效期: {datetime.now().strftime('%Y-%m-%d')} - "
-                        f"{(datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')}"
-                    )
-                else:
-                    self.send_email_notification(
-                        "进京证自动办理失败",
-                        f"自动办理{self.car_plate}的进京证失败，请手动办理。\n"
-                        f"当前进京证剩余有效期: {days_left}天"
-                    )
-            else:
-                logger.info(f"进京证仍然有效（剩余{days_left}天），无需办理")
+            outcome['days_left'] = permit_status['days_left']
+            outcome['end_date'] = permit_status['end_date']
+            if permit_status['days_left'] > RENEW_DAYS_LEFT:
+                logger.info(f"{car_plate} 进京证仍然有效（剩余{permit_status['days_left']}天），无需办理")
+                outcome['status'] = 'valid'
+                return outcome
+            logger.info(f"{car_plate} 进京证即将到期，开始办理新的...")
         else:
             # 没有进京证，立即办理
-            logger.info("当前无进京证，开始办理...")
-            if self.apply_permit():
-                self.send_email_notification(
-                    "进京证自动办理成功",
-                    f"您的车辆{self.car_plate}的进京证已成功办理。\n"
-                    f"有效期: {datetime.now().strftime('%Y-%m-%d')} - "
-                    f"{(datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')}"
-                )
-            else:
-                self.send_email_notification(
-                    "进京证自动办理失败",
-                    f"自动办理{self.car_plate}的进京证失败，请手动办理。"
-                )
+            logger.info(f"{car_plate} 当前无进京证，开始办理...")
 
-    def run(self):
+        if await self.apply_permit(car_plate, client):
+            outcome['status'] = 'applied'
+            outcome['days_left'] = PERMIT_VALID_DAYS
+            outcome['end_date'] = (datetime.now() + timedelta(days=PERMIT_VALID_DAYS)).strftime('%Y-%m-%d')
+        else:
+            outcome['status'] = 'apply_failed'
+        return outcome
+
+    def notify_outcome(self, outcome: Dict[str, Any]):
         """
-        运行自动化脚本
+        根据单辆车的处理结果发送通知
         """
-        logger.info("启动进京证自动办理脚本")
+        car_plate = outcome['car_plate']
+        status = outcome['status']
 
-        # 每天早上8点检查
-        schedule.every().day.at("08:00").do(self.daily_check)
+        if status == 'login_failed':
+            self.send_notification(
+                "进京证自动检查-登录失败",
+                "无法登录北京交警APP，请检查账号密码或App是否有更新",
+                level='error'
+            )
+        elif status == 'check_failed':
+            self.send_notification(
+                "进京证自动检查-查询失败",
+                f"无法查询当前进京证状态于{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                level='error'
+            )
+        elif status == 'applied':
+            self.send_notification(
+                "进京证自动办理成功",
+                f"您的车辆{car_plate}的进京证已成功办理。\n"
+                f"有效期: {datetime.now().strftime('%Y-%m-%d')} - {outcome['end_date']}",
+                level='success'
+            )
+        elif status == 'apply_failed':
+            content = f"自动办理{car_plate}的进京证失败，请手动办理。"
+            if outcome['days_left'] is not None:
+                content += f"\n当前进京证剩余有效期: {outcome['days_left']}天"
+            self.send_notification("进京证自动办理失败", content, level='error')
 
-        # 也可以设置其他时间检查
-        # schedule.every().day.at("20:00").do(self.daily_check)
+    def vehicle_plates(self) -> List[str]:
+        """
+        需要管理的车牌列表
+        """
+        return [self.car_plate]
 
-        # 启动时先检查一次
-        self.daily_check()
+    async def check_vehicles(self, car_plates: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        检查指定车辆（默认全部）并发送通知，返回每辆车的处理结果
+        """
+        outcomes = []
+        for car_plate in self.vehicle_plates():
+            if car_plates is not None and car_plate not in car_plates:
+                continue
+            outcome = await self.process_vehicle(car_plate)
+            self.notify_outcome(outcome)
+            outcomes.append(outcome)
+        return outcomes
+
+    async def daily_check(self):
+        """
+        每日检查任务
+        """
+        logger.info("开始每日进京证检查...")
+        return await self.check_vehicles()
 
-        # 保持运行
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # 每分钟检查一次
+    async def close(self):
+        """
+        释放连接
+        """
+        if self.client is not None:
+            await self.client.close()
+        await self.notifier.close()
+        self.state.close()
+
+    async def run_check(self):
+        """
+        执行一次检查，超时后放弃本次检查而不阻塞后续调度
+        """
+        try:
+            await asyncio.wait_for(self.daily_check(), timeout=self.check_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"进京证检查超时（{self.check_timeout}秒），等待下次调度")
+        except Exception as e:
+            logger.error(f"进京证检查异常: {e}")
+
+    async def run_forever(self):
+        """
+        运行自动化脚本：按到期日期调度检查（连接池和token在多次检查间复用）
+        """
+        logger.info("启动进京证自动办理脚本")
+
+        scheduler = PermitScheduler(self, renew_days_left=RENEW_DAYS_LEFT)
+        try:
+            await scheduler.run_forever()
+        finally:
+            await self.close()
+
+    def run(self):
+        """
+        运行自动化脚本
+        """
+        asyncio.run(self.run_forever())
 
 
 if __name__ == "__main__":
@@ -308,12 +366,42 @@ if __name__ == "__main__":
     BEIJING_PASSWORD=your_password
     BEIJING_PHONE=your_phone
     BEIJING_CAR_PLATE=京AXXXXX
-    EMAIL_USER=your_email@gmail.com
-    EMAIL_PASSWORD=your_email_password
-    SMTP_SERVER=smtp.gmail.com
-    SMTP_PORT=587
+    BEIJING_API_BASE_URL=https://api.beijing.gov.cn
+    BEIJING_API_TIMEOUT=10
+    BEIJING_API_MAX_RETRIES=3
+    BEIJING_CHECK_TIMEOUT=300
+    BEIJING_CHECK_TIME=08:00
+    BEIJING_SCHEDULE_FILE=logs/permit_schedule.json
+    BEIJING_STATE_DB=logs/permit_state.db
+    BEIJING_STATE_TTL=172800
+    NOTIFICATION_SERVICE_URL=http://notification-center:8000
     RECIPIENT_EMAIL=recipient@email.com
+    BEIJING_FLEET_CONFIG=fleet.json
+    BEIJING_FLEET_CONCURRENCY=5
     """
-
-    auto_permit = BeijingPermitAuto()
-    auto_permit.run()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='进京证自动办理')
+    parser.add_argument('--fleet', default=os.getenv('BEIJING_FLEET_CONFIG'),
+                        help='车队配置文件（JSON），指定后批量处理多辆车')
+    parser.add_argument('--once', action='store_true', help='只检查一次后退出')
+    parser.add_argument('--no-cache', action='store_true', help='忽略本地状态缓存，强制查询远程接口')
+    args = parser.parse_args()
+
+    if args.fleet:
+        from fleet import FleetPermitAuto, load_fleet_config
+        auto_permit = FleetPermitAuto(load_fleet_config(args.fleet))
+    else:
+        auto_permit = BeijingPermitAuto()
+    auto_permit.use_cache = not args.no_cache
+
+    if args.once:
+        async def run_once():
+            try:
+                await auto_permit.run_check()
+            finally:
+                await auto_permit.close()
+
+        asyncio.run(run_once())
+    else:
+        auto_permit.run()
\ No newline at end of file
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进京证自动化端到端性能测试
+在本地启动模拟服务，用车队模式检查 N 辆模拟车辆，统计耗时、请求数和重试次数
+
+用法：
+    python benchmark.py --vehicles 50 --accounts 5 --concurrency 10 --latency 0.05 --fail-rate 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from mock_server import MockPermitService, start_server
+
+
+def run_benchmark(vehicles: int, accounts: int, concurrency: int, latency: float, latency_jitter: float,
+                  token_ttl: int, fail_rate: float, runs: int, seed: int = None, verbose: bool = False) -> list:
+    """
+    启动模拟服务并执行多轮检查，第一轮不使用本地缓存，之后各轮使用缓存
+
+    Returns:
+        list: 每轮的统计结果
+    """
+    service = MockPermitService(latency, latency_jitter, token_ttl, fail_rate, seed=seed)
+    server = start_server(service)
+    workdir = tempfile.mkdtemp(prefix='permit_bench_')
+
+    # 在创建实例前设置，状态库、暂存文件等都写到临时目录
+    os.environ.update({
+        'BEIJING_API_BASE_URL': f"http://127.0.0.1:{server.server_port}",
+        'NOTIFICATION_SERVICE_URL': f"http://127.0.0.1:{server.server_port}",
+        'BEIJING_STATE_DB': os.path.join(workdir, 'permit_state.db'),
+        'NOTIFY_SPOOL_FILE': os.path.join(workdir, 'notify_spool.jsonl'),
+    })
+
+    from fleet import FleetPermitAuto
+
+    # 自动化脚本导入时会配置日志，默认只保留警告以上，避免刷屏
+    if not verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    fleet = [{'car_plate': f"京A{i:05d}", 'username': f"account_{i % accounts}", 'password': 'secret'}
+             for i in range(vehicles)]
+
+    async def bench():
+        auto = FleetPermitAuto(fleet, concurrency=concurrency)
+        results = []
+        try:
+            for run in range(runs):
+                auto.use_cache = run > 0
+                service.stats.clear()
+                before = {key: sum(c.stats[key] for c in auto.clients.values())
+                          for key in ('requests', 'retries', 'logins', 'refreshes')}
+
+                started = time.perf_counter()
+                outcomes = await auto.daily_check()
+                elapsed = time.perf_counter() - started
+
+                client_stats = {key: sum(c.stats[key] for c in auto.clients.values()) - before[key]
+                                for key in before}
+                statuses = {}
+                for outcome in outcomes:
+                    statuses[outcome['status']] = statuses.get(outcome['status'], 0) + 1
+
+                results.append({
+                    'run': run + 1,
+                    'cache': auto.use_cache,
+                    'wall_time': elapsed,
+                    'per_vehicle_ms': elapsed / vehicles * 1000,
+                    'client': client_stats,
+                    'server': dict(service.stats),
+                    'statuses': statuses,
+                })
+        finally:
+            await auto.close()
+        return results
+
+    try:
+        return asyncio.run(bench())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def print_report(results: list, vehicles: int, accounts: int, concurrency: int):
+    print(f"\n车辆 {vehicles}，账号 {accounts}，并发 {concurrency}")
+    print(f"{'轮次':<4} {'缓存':<4} {'总耗时(s)':>10} {'每车(ms)':>9} {'请求':>6} {'重试':>6} "
+          f"{'登录':>6} {'刷新':>6}  结果")
+    for r in results:
+        statuses = ', '.join(f"{k}={v}" for k, v in sorted(r['statuses'].items()))
+        print(f"{r['run']:<6} {'是' if r['cache'] else '否':<5} {r['wall_time']:>10.3f} {r['per_vehicle_ms']:>9.1f} "
+              f"{r['client']['requests']:>6} {r['client']['retries']:>6} {r['client']['logins']:>6} "
+              f"{r['client']['refreshes']:>6}  {statuses}")
+    for r in results:
+        server = ', '.join(f"{k}={v}" for k, v in sorted(r['server'].items()))
+        print(f"第{r['run']}轮服务端请求: {server}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='进京证自动化端到端性能测试')
+    parser.add_argument('--vehicles', type=int, default=50, help='模拟车辆数')
+    parser.add_argument('--accounts', type=int, default=5, help='账号数（车辆平均分配到各账号）')
+    parser.add_argument('--concurrency', type=int, default=10, help='并发处理的车辆数')
+    parser.add_argument('--latency', type=float, default=0.05, help='模拟服务每个请求的延迟（秒）')
+    parser.add_argument('--latency-jitter', type=float, default=0.02, help='延迟的随机浮动（秒）')
+    parser.add_argument('--token-ttl', type=int, default=7200, help='token有效期（秒）')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='随机返回503的比例')
+    parser.add_argument('--runs', type=int, default=2, help='检查轮数（第一轮不使用缓存）')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子')
+    parser.add_argument('--verbose', action='store_true', help='输出检查日志')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.vehicles, args.accounts, args.concurrency, args.latency, args.latency_jitter,
+                            args.token_ttl, args.fail_rate, args.runs, args.seed, args.verbose)
+    print_report(results, args.vehicles, args.accounts, args.concurrency)
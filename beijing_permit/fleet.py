@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+车队模式：批量检查并办理多辆车的进京证
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import List, Dict, Any
+
+from beijing_permit_automation import BeijingPermitAuto
+from permit_client import PermitAPIClient
+
+logger = logging.getLogger(__name__)
+
+# 同时处理的车辆数上限
+DEFAULT_CONCURRENCY = 5
+
+# 汇总报告中的状态说明
+STATUS_LABELS = {
+    'login_failed': '登录失败',
+    'check_failed': '查询失败',
+    'apply_failed': '办理失败',
+    'applied': '办理成功',
+    'valid': '有效',
+    'error': '检查异常',
+}
+
+
+def load_fleet_config(path: str) -> List[Dict[str, str]]:
+    """
+    读取车队配置文件（JSON数组）
+
+    每项包含 car_plate、username，以及 password 或 password_env（从该环境变量读取密码）：
+        [{"car_plate": "京AXXXXX", "username": "user1", "password_env": "USER1_PASSWORD"}]
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+
+    vehicles = []
+    for record in records:
+        if not record.get('car_plate') or not record.get('username'):
+            raise ValueError(f"车队配置缺少 car_plate 或 username: {record}")
+        password = record.get('password')
+        if password is None and record.get('password_env'):
+            password = os.getenv(record['password_env'])
+        if password is None:
+            raise ValueError(f"车辆 {record['car_plate']} 未配置密码")
+        vehicles.append({
+            'car_plate': record['car_plate'],
+            'username': record['username'],
+            'password': password
+        })
+    return vehicles
+
+
+class FleetPermitAuto(BeijingPermitAuto):
+    """车队模式的进京证自动办理
+
+    - 所有车辆并发检查，同时处理的车辆数受 concurrency 限制
+    - 同一账号下的车辆共用一个 API 客户端（连接池和 token），账号只登录一次
+    - 所有车辆的处理结果汇总为一条通知，全部有效时不发送
+    """
+
+    def __init__(self, vehicles: List[Dict[str, str]], concurrency: int = None):
+        super().__init__(default_client=False)
+        self.vehicles = vehicles
+        self.concurrency = concurrency or int(os.getenv('BEIJING_FLEET_CONCURRENCY', DEFAULT_CONCURRENCY))
+
+        # 每个账号一个客户端，跨多次检查复用
+        self.clients: Dict[str, PermitAPIClient] = {}
+        for vehicle in vehicles:
+            if vehicle['username'] not in self.clients:
+                self.clients[vehicle['username']] = self.make_client(vehicle['username'], vehicle['password'])
+
+    def vehicle_plates(self) -> List[str]:
+        """
+        车队中的所有车牌
+        """
+        return [vehicle['car_plate'] for vehicle in self.vehicles]
+
+    async def check_vehicles(self, car_plates: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        并发处理指定车辆（默认全部），汇总发送一次通知
+        """
+        vehicles = [v for v in self.vehicles if car_plates is None or v['car_plate'] in car_plates]
+        logger.info(f"开始检查 {len(vehicles)} 辆车的进京证，"
+                    f"{len(self.clients)} 个账号，并发数 {self.concurrency}")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def process(vehicle: Dict[str, str]) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await self.process_vehicle(vehicle['car_plate'], self.clients[vehicle['username']])
+                except Exception as e:
+                    logger.error(f"{vehicle['car_plate']} 检查异常: {e}")
+                    return {'car_plate': vehicle['car_plate'], 'status': 'error',
+                            'days_left': None, 'end_date': None}
+
+        outcomes = await asyncio.gather(*(process(vehicle) for vehicle in vehicles))
+
+        counts = {}
+        for outcome in outcomes:
+            counts[outcome['status']] = counts.get(outcome['status'], 0) + 1
+        logger.info("车队检查完成: " + ", ".join(f"{STATUS_LABELS[s]} {n}" for s, n in counts.items()))
+
+        # 只有发生办理或失败时才发送汇总报告
+        if any(outcome['status'] != 'valid' for outcome in outcomes):
+            failed = sum(n for s, n in counts.items() if s not in ('valid', 'applied'))
+            subject = f"进京证车队检查报告（{len(outcomes)}辆，失败{failed}辆）"
+            self.send_notification(subject, self.format_report(outcomes), level='error' if failed else 'success')
+
+        return outcomes
+
+    def format_report(self, outcomes: List[Dict[str, Any]]) -> str:
+        """
+        生成汇总报告，需要处理的车辆排在前面
+        """
+        order = list(STATUS_LABELS)
+        lines = [f"检查时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ""]
+        for outcome in sorted(outcomes, key=lambda o: (order.index(o['status']), o['car_plate'])):
+            line = f"{outcome['car_plate']}: {STATUS_LABELS[outcome['status']]}"
+            if outcome['end_date']:
+                line += f"，有效期至 {outcome['end_date']}（剩余{outcome['days_left']}天）"
+            if outcome.get('cached'):
+                line += "（本地缓存）"
+            lines.append(line)
+
+        if any(o['status'] in ('apply_failed', 'login_failed', 'check_failed', 'error') for o in outcomes):
+            lines += ["", "办理失败的车辆请手动办理；登录失败请检查账号密码或App是否有更新。"]
+        return "\n".join(lines)
+
+    async def close(self):
+        """
+        释放所有账号的连接
+        """
+        await asyncio.gather(*(client.close() for client in self.clients.values()))
+        await self.notifier.close()
+        self.state.close()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟进京证服务
+实现 /auth/login、/auth/refresh、/permit/current、/permit/apply（以及通知中心的 /notify），
+可配置响应延迟、token有效期和随机故障率，用于联调和性能测试
+
+用法：
+    python mock_server.py --port 8080 --latency 0.05 --fail-rate 0.05
+    BEIJING_API_BASE_URL=http://127.0.0.1:8080 python beijing_permit_automation.py --once
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+
+class MockPermitService:
+    """模拟服务的状态：已发放的token、每辆车的进京证、请求统计"""
+
+    def __init__(self, latency: float = 0.0, latency_jitter: float = 0.0, token_ttl: int = 7200,
+                 fail_rate: float = 0.0, permit_days=(-1, 7), seed: int = None):
+        """
+        Args:
+            latency: 每个请求的基础延迟（秒）
+            latency_jitter: 延迟的随机浮动（秒）
+            token_ttl: token有效期（秒）
+            fail_rate: 随机返回 503 的比例
+            permit_days: 首次查询的车辆随机分配的剩余天数范围，小于0表示没有进京证
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.token_ttl = token_ttl
+        self.fail_rate = fail_rate
+        self.permit_days = permit_days
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.tokens = {}          # access_token -> 过期时间
+        self.refresh_tokens = {}  # refresh_token -> 用户名
+        self.permits = {}         # 车牌 -> 到期日期（None 表示没有进京证）
+        self.stats = Counter()
+
+    def reset(self):
+        with self.lock:
+            self.tokens.clear()
+            self.refresh_tokens.clear()
+            self.permits.clear()
+            self.stats.clear()
+
+    def issue_token(self, username: str) -> dict:
+        access_token = uuid.uuid4().hex
+        refresh_token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens[access_token] = time.time() + self.token_ttl
+            self.refresh_tokens[refresh_token] = username
+        return {'access_token': access_token, 'refresh_token': refresh_token, 'expires_in': self.token_ttl}
+
+    def token_valid(self, authorization: str) -> bool:
+        token = (authorization or '').replace('Bearer ', '', 1)
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def current_permit(self, car_plate: str):
+        with self.lock:
+            if car_plate not in self.permits:
+                days = self.random.randint(*self.permit_days)
+                self.permits[car_plate] = (
+                    (datetime.now() + timedelta(days=days + 1)).strftime('%Y-%m-%d') if days >= 0 else None
+                )
+            return self.permits[car_plate]
+
+    def apply(self, car_plate: str, exit_date: str):
+        with self.lock:
+            self.permits[car_plate] = exit_date
+
+
+def make_handler(service: MockPermitService):
+    """创建绑定到指定服务状态的请求处理类"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # 支持长连接
+
+        def do_GET(self):
+            self.dispatch('GET')
+
+        def do_POST(self):
+            self.dispatch('POST')
+
+        def dispatch(self, method: str):
+            url = urlparse(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+            # 统计和控制接口不计延迟和故障
+            if url.path == '/__stats':
+                with service.lock:
+                    return self.reply(200, dict(service.stats))
+            if url.path == '/__reset':
+                service.reset()
+                return self.reply(200, {'success': True})
+
+            with service.lock:
+                service.stats[f"{method} {url.path}"] += 1
+
+            delay = service.latency + service.random.uniform(0, service.latency_jitter)
+            if delay > 0:
+                time.sleep(delay)
+
+            if url.path != '/notify' and service.random.random() < service.fail_rate:
+                with service.lock:
+                    service.stats['injected_failures'] += 1
+                return self.reply(503, {'message': 'service unavailable'})
+
+            route = ROUTES.get((method, url.path))
+            if route is None:
+                return self.reply(404, {'message': 'not found'})
+            status, payload = route(self, body, query)
+            self.reply(status, payload)
+
+        def login(self, body, query):
+            if not body.get('username') or not body.get('password'):
+                return 401, {'message': 'invalid credentials'}
+            return 200, service.issue_token(body['username'])
+
+        def refresh(self, body, query):
+            with service.lock:
+                username = service.refresh_tokens.pop(body.get('refresh_token'), None)
+            if username is None:
+                return 401, {'message': 'invalid refresh token'}
+            return 200, service.issue_token(username)
+
+        def permit_current(self, body, query):
+            if not service.token_valid(self.headers.get('Authorization')):
+                return 401, {'message': 'token expired'}
+            end_date = service.current_permit(query.get('car_plate'))
+            return 200, {'data': {'end_date': end_date} if end_date else None}
+
+        def permit_apply(self, body, query):
+            if not service.token_valid(self.headers.get('Authorization')):
+                return 401, {'message': 'token expired'}
+            service.apply(body.get('car_plate'), body.get('exit_date'))
+            return 200, {'success': True}
+
+        def notify(self, body, query):
+            return 200, {'success': True, 'message': '通知正在发送'}
+
+        def reply(self, status: int, payload: dict):
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    ROUTES = {
+        ('POST', '/auth/login'): Handler.login,
+        ('POST', '/auth/refresh'): Handler.refresh,
+        ('GET', '/permit/current'): Handler.permit_current,
+        ('POST', '/permit/apply'): Handler.permit_apply,
+        ('POST', '/notify'): Handler.notify,
+    }
+    return Handler
+
+
+def start_server(service: MockPermitService, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程启动模拟服务，port 为 0 时自动分配端口"""
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地模拟进京证服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的基础延迟（秒）')
+    parser.add_argument('--latency-jitter', type=float, default=0.02, help='延迟的随机浮动（秒）')
+    parser.add_argument('--token-ttl', type=int, default=7200, help='token有效期（秒）')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='随机返回503的比例')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    service = MockPermitService(args.latency, args.latency_jitter, args.token_ttl, args.fail_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    logger.info(f"模拟进京证服务已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+通知中心客户端
+通过 notification-center 的 /notify 接口发送通知，后台发送不阻塞检查流程，
+通知中心不可用时先写入本地暂存文件，恢复后补发
+每条通知带固定的幂等键，超时重试或补发已提交过的通知时，通知中心不会重复发送
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NOTIFICATION_URL = "http://localhost:8000"
+
+# 通知来源（已在通知中心的 notification_sources 中初始化）
+NOTIFY_SOURCE = "beijing_permit"
+
+
+class NotificationClient:
+    """通知中心异步客户端
+
+    - notify() 只把通知放入队列立即返回，由后台任务逐条发送
+    - 发送失败的通知追加到 JSONL 暂存文件，之后每隔 retry_interval 秒重试补发
+    - close() 会等待队列中的通知发送（或暂存）完毕
+    """
+
+    def __init__(self, base_url: str = None, source: str = NOTIFY_SOURCE,
+                 recipients: Optional[List[str]] = None, spool_file: str = None,
+                 timeout: float = 10.0, retry_interval: float = 300.0):
+        self.base_url = (base_url or os.getenv('NOTIFICATION_SERVICE_URL', DEFAULT_NOTIFICATION_URL)).rstrip('/')
+        self.source = source
+        self.recipients = recipients
+        self.spool_file = spool_file or os.getenv('NOTIFY_SPOOL_FILE', 'logs/notify_spool.jsonl')
+        self.retry_interval = retry_interval
+
+        self.client = httpx.AsyncClient(base_url=self.base_url, timeout=httpx.Timeout(timeout))
+        self._queue = None  # 在事件循环中首次使用时创建
+        self._worker = None
+
+    def notify(self, subject: str, message: str, level: str = 'info'):
+        """提交一条通知（不等待发送结果）"""
+        payload = {
+            'source': self.source,
+            'subject': subject,
+            'message': message,
+            'level': level,
+            'recipients': self.recipients,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            # 暂存和补发时保持不变
+            'idempotency_key': uuid.uuid4().hex
+        }
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中，无法后台发送，直接暂存等待补发
+            self._spool([payload])
+            return
+
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+        self._queue.put_nowait(payload)
+
+    async def _run(self):
+        """后台发送任务：发送队列中的通知，空闲时定期补发暂存的通知"""
+        await self.flush_spool()
+        while True:
+            try:
+                payload = await asyncio.wait_for(self._queue.get(), timeout=self.retry_interval)
+            except asyncio.TimeoutError:
+                await self.flush_spool()
+                continue
+
+            try:
+                if not await self._send(payload):
+                    self._spool([payload])
+            except asyncio.CancelledError:
+                # 关闭时仍在发送，暂存起来下次补发
+                self._spool([payload])
+                raise
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, payload: Dict[str, Any]) -> bool:
+        """调用 /notify 接口，成功返回 True"""
+        try:
+            headers = {'Idempotency-Key': payload['idempotency_key']} if payload.get('idempotency_key') else None
+            response = await self.client.post('/notify', json=payload, headers=headers)
+            if response.status_code == 200:
+                logger.info(f"通知已提交: {payload['subject']}")
+                return True
+            logger.error(f"通知提交失败: {response.status_code} - {response.text}")
+        except httpx.HTTPError as e:
+            logger.error(f"通知中心不可用: {type(e).__name__}: {e}")
+        return False
+
+    def _spool(self, payloads: List[Dict[str, Any]]):
+        """把发送失败的通知追加到暂存文件"""
+        directory = os.path.dirname(self.spool_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.spool_file, 'a', encoding='utf-8') as f:
+            for payload in payloads:
+                f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+        logger.warning(f"{len(payloads)} 条通知已暂存到 {self.spool_file}，稍后补发")
+
+    async def flush_spool(self) -> int:
+        """补发暂存的通知，遇到失败即停止，未发送的保留在暂存文件中
+
+        Returns:
+            int: 补发成功的条数
+        """
+        if not os.path.exists(self.spool_file):
+            return 0
+
+        with open(self.spool_file, 'r', encoding='utf-8') as f:
+            pending = [json.loads(line) for line in f if line.strip()]
+
+        sent = 0
+        for payload in pending:
+            if not await self._send(payload):
+                break
+            sent += 1
+
+        # 先写临时文件再替换，补发过程中崩溃也不会丢失或重复整批通知
+        remaining = pending[sent:]
+        if remaining:
+            tmp_file = f"{self.spool_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for payload in remaining:
+                    f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+            os.replace(tmp_file, self.spool_file)
+        else:
+            os.remove(self.spool_file)
+
+        if sent:
+            logger.info(f"已补发 {sent} 条暂存通知，剩余 {len(remaining)} 条")
+        return sent
+
+    async def close(self, timeout: float = 30.0):
+        """等待队列中的通知处理完毕后关闭连接"""
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pending = []
+                while not self._queue.empty():
+                    pending.append(self._queue.get_nowait())
+                if pending:
+                    self._spool(pending)
+
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+        await self.client.aclose()
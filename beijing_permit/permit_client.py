@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进京证API异步客户端
+连接池复用、请求超时、指数退避重试、token复用与到期前自动刷新
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Optional, Callable, Dict, Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# API配置（需要通过抓包获取真实API）
+DEFAULT_BASE_URL = "https://api.beijing.gov.cn"  # 需要替换为真实API地址
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Linux; Android 10; ...)',  # 需要替换
+    'X-App-Version': '3.2.1',
+    'Content-Type': 'application/json'
+}
+
+# 需要重试的HTTP状态码
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# 非幂等请求（如提交申请）只在请求确定未被服务端处理时重试：连接失败、等待连接池超时、429限流
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+NON_IDEMPOTENT_RETRY_STATUS_CODES = {429}
+
+
+class PermitAPIError(Exception):
+    """API请求在重试后仍然失败"""
+
+
+class PermitAuthError(PermitAPIError):
+    """登录或刷新token失败"""
+
+
+class PermitAPIClient:
+    """进京证API客户端
+
+    - 所有请求共用一个 httpx.AsyncClient，保持长连接
+    - 每个请求有独立超时，网络错误和 429/5xx 按带抖动的指数退避重试
+    - token 在有效期内复用，距离过期不足 refresh_margin 秒时提前刷新，刷新失败再重新登录
+    """
+
+    def __init__(self, username: str, password: str, base_url: str = DEFAULT_BASE_URL,
+                 headers: Optional[Dict[str, str]] = None, timeout: float = 10.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 token_ttl: int = 7200, refresh_margin: int = 300, max_connections: int = 10,
+                 on_token: Optional[Callable[['PermitAPIClient'], None]] = None):
+        self.username = username
+        self.password = password
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.token_ttl = token_ttl
+        self.refresh_margin = refresh_margin
+
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers or DEFAULT_HEADERS,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections)
+        )
+
+        self.token = None
+        self.refresh_token = None
+        self.token_expires_at = 0.0
+        self._auth_lock = None  # 在事件循环中首次使用时创建
+        self.on_token = on_token  # 获取到新token后回调，用于持久化
+
+        # 请求统计
+        self.stats = {'requests': 0, 'retries': 0, 'logins': 0, 'refreshes': 0}
+
+    @property
+    def token_valid(self) -> bool:
+        """token是否在有效期内且无需提前刷新"""
+        return bool(self.token) and time.time() < self.token_expires_at - self.refresh_margin
+
+    async def ensure_token(self) -> bool:
+        """确保持有可用的token：有效则直接复用，即将过期则刷新，否则登录"""
+        if self.token_valid:
+            return True
+
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        async with self._auth_lock:
+            # 等锁期间可能已被其他请求刷新
+            if self.token_valid:
+                return True
+            if self.refresh_token and await self.refresh_access_token():
+                return True
+            return await self.login()
+
+    async def login(self) -> bool:
+        """
+        登录获取token
+        需要根据实际API实现
+        """
+        try:
+            # 示例：需要替换为真实的登录API
+            login_data = {
+                'username': self.username,
+                'password': self.password,
+                'device_id': 'unique_device_id'  # 可能需要设备ID
+            }
+
+            self.stats['logins'] += 1
+            response = await self.request('POST', '/auth/login', auth=False, json=login_data)
+
+            if response.status_code == 200:
+                self._set_token(response.json())
+                logger.info("登录成功")
+                return True
+            else:
+                logger.error(f"登录失败: {response.status_code} - {response.text}")
+                return False
+
+        except Exception as e:
+            logger.error(f"登录异常: {e}")
+            return False
+
+    async def refresh_access_token(self) -> bool:
+        """
+        刷新token，失败时返回 False（由调用方决定是否重新登录）
+        """
+        try:
+            self.stats['refreshes'] += 1
+            response = await self.request('POST', '/auth/refresh', auth=False,
+                                          json={'refresh_token': self.refresh_token})
+
+            if response.status_code == 200:
+                self._set_token(response.json())
+                logger.info("Token刷新成功")
+                return True
+            else:
+                logger.warning("Token刷新失败，需要重新登录")
+                self.refresh_token = None
+                return False
+
+        except Exception as e:
+            logger.warning(f"Token刷新异常: {e}")
+            return False
+
+    async def request(self, method: str, path: str, auth: bool = True, idempotent: bool = True,
+                      **kwargs) -> httpx.Response:
+        """发送请求，网络错误和 429/5xx 自动重试
+
+        Args:
+            method: HTTP方法
+            path: API路径
+            auth: 是否需要携带token（会先确保token可用）
+            idempotent: 请求能否安全地重复发送。为 False 时（如提交申请）只在请求未发出（连接失败）
+                        或被限流（429）时重试；读超时、5xx 时服务端可能已经处理，不再重试，避免重复提交
+
+        Returns:
+            httpx.Response: 最终的响应（非重试状态码）
+
+        Raises:
+            PermitAuthError: 无法获取token
+            PermitAPIError: 重试次数用尽仍失败
+        """
+        reauthenticated = False
+        attempt = 0
+        retry_errors = httpx.TransportError if idempotent else UNSENT_ERRORS
+        retry_status_codes = RETRY_STATUS_CODES if idempotent else NON_IDEMPOTENT_RETRY_STATUS_CODES
+
+        while True:
+            if auth and not await self.ensure_token():
+                raise PermitAuthError("无法获取有效token")
+
+            retry_after = None
+            try:
+                self.stats['requests'] += 1
+                response = await self.client.request(method, path, headers=self._auth_headers(auth), **kwargs)
+            except retry_errors as e:
+                error = f"{type(e).__name__}: {e}"
+            except httpx.TransportError as e:
+                raise PermitAPIError(f"{method} {path} 请求失败（服务端可能已处理，不重试）: "
+                                     f"{type(e).__name__}: {e}") from e
+            else:
+                # token被服务端提前作废，重新认证后立即重试一次
+                if auth and response.status_code == 401 and not reauthenticated:
+                    reauthenticated = True
+                    self.token_expires_at = 0.0
+                    continue
+                if response.status_code not in retry_status_codes:
+                    return response
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt >= self.max_retries:
+                raise PermitAPIError(f"{method} {path} 请求失败（已重试{attempt}次）: {error}")
+
+            delay = self._backoff_delay(attempt, retry_after)
+            attempt += 1
+            self.stats['retries'] += 1
+            logger.warning(f"{method} {path} 请求失败: {error}，{delay:.2f}秒后第{attempt}次重试")
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        """关闭连接池"""
+        await self.client.aclose()
+
+    def restore_token(self, access_token: str, refresh_token: Optional[str], expires_at: float):
+        """恢复之前保存的token（如重启前持久化的token）"""
+        self.token = access_token
+        self.refresh_token = refresh_token
+        self.token_expires_at = float(expires_at or 0.0)
+
+    def _set_token(self, result: Dict[str, Any]):
+        """保存登录/刷新接口返回的token"""
+        self.token = result.get('access_token')
+        self.refresh_token = result.get('refresh_token') or self.refresh_token
+        self.token_expires_at = time.time() + float(result.get('expires_in') or self.token_ttl)
+        if self.on_token:
+            try:
+                self.on_token(self)
+            except Exception as e:
+                logger.warning(f"Token保存失败: {e}")
+
+    def _auth_headers(self, auth: bool) -> Optional[Dict[str, str]]:
+        """请求携带的认证头"""
+        return {'Authorization': f'Bearer {self.token}'} if auth else None
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """带随机抖动的指数退避时间，服务端给出 Retry-After 时优先使用"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
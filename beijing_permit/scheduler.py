@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进京证检查调度器
+根据每辆车进京证的到期日期计算下次检查时间，睡眠到最早的到期时间再唤醒
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from typing import List, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# 检查失败（登录/查询/办理失败）后需要重试的状态
+RETRY_STATUSES = {'login_failed', 'check_failed', 'apply_failed', 'error'}
+
+
+class PermitScheduler:
+    """按车辆到期日期调度的检查计划
+
+    - 进京证有效的车辆，下次检查时间为到期前 renew_days_left 天的 check_time，再加上随机抖动
+    - 检查失败的车辆按带抖动的指数退避重试，直到成功
+    - 两次检查的间隔不超过 max_interval，避免进京证被注销等情况长期无人发现
+    - 调度计划保存到 JSON 文件，重启后继续按原计划执行，错过的检查在启动时立即补上
+    - 到期时间相近（batch_window 内）的车辆合并为一次检查，车队模式下只发一份汇总报告
+    """
+
+    def __init__(self, auto, plan_file: str = None, check_time: str = None,
+                 renew_days_left: int = 2, jitter: float = None, retry_base: float = None,
+                 retry_max: float = None, max_interval: float = None, batch_window: float = None):
+        """
+        Args:
+            auto: BeijingPermitAuto 或 FleetPermitAuto 实例
+            plan_file: 调度计划文件
+            check_time: 每天的检查时间 HH:MM
+            renew_days_left: 剩余天数不超过该值时办理新证
+            jitter: 计划时间的最大随机延后（秒）
+            retry_base/retry_max: 失败重试的初始/最大间隔（秒）
+            max_interval: 两次检查的最大间隔（秒）
+            batch_window: 合并检查的时间窗口（秒）
+        """
+        self.auto = auto
+        self.plan_file = plan_file or os.getenv('BEIJING_SCHEDULE_FILE', 'logs/permit_schedule.json')
+        self.check_time = datetime.strptime(check_time or os.getenv('BEIJING_CHECK_TIME', '08:00'), '%H:%M').time()
+        self.renew_days_left = renew_days_left
+        self.jitter = jitter if jitter is not None else float(os.getenv('BEIJING_SCHEDULE_JITTER', '600'))
+        self.retry_base = retry_base if retry_base is not None else float(os.getenv('BEIJING_RETRY_BASE', '300'))
+        self.retry_max = retry_max if retry_max is not None else float(os.getenv('BEIJING_RETRY_MAX', '7200'))
+        self.max_interval = (max_interval if max_interval is not None
+                             else float(os.getenv('BEIJING_MAX_CHECK_INTERVAL', str(3 * 86400))))
+        self.batch_window = batch_window if batch_window is not None else self.jitter
+
+        self.plan: Dict[str, Dict[str, Any]] = {}
+
+    def load_plan(self):
+        """读取调度计划，新增的车辆立即检查，已移除的车辆从计划中删除"""
+        saved = {}
+        if os.path.exists(self.plan_file):
+            try:
+                with open(self.plan_file, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"调度计划读取失败，重新开始: {e}")
+
+        now = datetime.now()
+        self.plan = {}
+        for plate in self.auto.vehicle_plates():
+            entry = saved.get(plate)
+            if entry:
+                entry['next_due'] = datetime.fromisoformat(entry['next_due'])
+            else:
+                entry = {'next_due': now, 'status': None, 'end_date': None, 'attempts': 0}
+            self.plan[plate] = entry
+
+        logger.info(f"已加载 {len(self.plan)} 辆车的调度计划")
+
+    def save_plan(self):
+        """原子写入调度计划（先写临时文件再替换）"""
+        directory = os.path.dirname(self.plan_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        data = {plate: dict(entry, next_due=entry['next_due'].isoformat(timespec='seconds'))
+                for plate, entry in self.plan.items()}
+        tmp_file = f"{self.plan_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.plan_file)
+
+    def next_due(self, outcome: Dict[str, Any], attempts: int, now: datetime) -> datetime:
+        """根据检查结果计算下次检查时间"""
+        if outcome['status'] in RETRY_STATUSES:
+            delay = min(self.retry_max, self.retry_base * 2 ** max(attempts - 1, 0))
+            return now + timedelta(seconds=random.uniform(delay / 2, delay))
+
+        latest = now + timedelta(seconds=self.max_interval)
+        if not outcome.get('end_date'):
+            return latest
+
+        end_date = datetime.strptime(outcome['end_date'], '%Y-%m-%d')
+        renew_day = (end_date - timedelta(days=self.renew_days_left)).date()
+        due = datetime.combine(renew_day, self.check_time) + timedelta(seconds=random.uniform(0, self.jitter))
+        return min(max(due, now), latest)
+
+    def update_plan(self, outcomes: List[Dict[str, Any]]):
+        """用检查结果更新调度计划"""
+        now = datetime.now()
+        for outcome in outcomes:
+            entry = self.plan.get(outcome['car_plate'])
+            if entry is None:
+                continue
+            attempts = entry['attempts'] + 1 if outcome['status'] in RETRY_STATUSES else 0
+            entry.update({
+                'status': outcome['status'],
+                'end_date': outcome.get('end_date') or entry['end_date'],
+                'attempts': attempts,
+                'next_due': self.next_due(outcome, attempts, now)
+            })
+            logger.info(f"{outcome['car_plate']} 下次检查时间: {entry['next_due']:%Y-%m-%d %H:%M:%S}")
+        self.save_plan()
+
+    def due_plates(self, now: datetime) -> List[str]:
+        """到期（含合并窗口内即将到期）的车辆"""
+        horizon = now + timedelta(seconds=self.batch_window)
+        if not any(entry['next_due'] <= now for entry in self.plan.values()):
+            return []
+        return [plate for plate, entry in self.plan.items() if entry['next_due'] <= horizon]
+
+    async def run_due(self) -> List[Dict[str, Any]]:
+        """检查到期的车辆并更新计划，整体超时的车辆按失败处理"""
+        plates = self.due_plates(datetime.now())
+        if not plates:
+            return []
+
+        try:
+            outcomes = await asyncio.wait_for(self.auto.check_vehicles(plates), timeout=self.auto.check_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"进京证检查超时（{self.auto.check_timeout}秒），稍后重试")
+            outcomes = [{'car_plate': plate, 'status': 'error'} for plate in plates]
+        except Exception as e:
+            logger.error(f"进京证检查异常: {e}")
+            outcomes = [{'car_plate': plate, 'status': 'error'} for plate in plates]
+
+        self.update_plan(outcomes)
+        return outcomes
+
+    async def run_forever(self):
+        """睡眠到最早的计划时间，醒来后检查到期的车辆"""
+        self.load_plan()
+        if not self.plan:
+            logger.error("没有需要检查的车辆")
+            return
+
+        while True:
+            await self.run_due()
+
+            wake_at = min(entry['next_due'] for entry in self.plan.values())
+            delay = max((wake_at - datetime.now()).total_seconds(), 0)
+            if delay > 0:
+                logger.info(f"下次检查时间: {wake_at:%Y-%m-%d %H:%M:%S}（{delay / 3600:.1f}小时后）")
+                await asyncio.sleep(delay)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进京证状态缓存
+记录每辆车最近一次查询到的进京证状态和办理记录、每个账号的token，跨重启保留
+"""
+
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# 查询成功、可以写入到期日期的状态
+CHECKED_STATUSES = {'valid', 'applied', 'apply_failed'}
+
+
+class PermitStateStore:
+    """基于 SQLite 的本地状态库
+
+    - permit_state: 每辆车最近的状态、到期日期、最后一次远程查询时间、办理次数
+    - account_tokens: 每个账号的 token 及过期时间，重启后可直接复用，不必重新登录
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or os.getenv('BEIJING_STATE_DB', 'logs/permit_state.db')
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.create_tables()
+
+    def create_tables(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS permit_state (
+                    car_plate TEXT PRIMARY KEY,
+                    status TEXT,
+                    end_date TEXT,
+                    checked_at TIMESTAMP,
+                    apply_attempts INTEGER DEFAULT 0,
+                    last_apply_at TIMESTAMP,
+                    updated_at TIMESTAMP
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS account_tokens (
+                    username TEXT PRIMARY KEY,
+                    access_token TEXT,
+                    refresh_token TEXT,
+                    expires_at REAL,
+                    updated_at TIMESTAMP
+                )
+            """)
+
+    def get_permit(self, car_plate: str) -> Optional[Dict[str, Any]]:
+        """读取车辆的缓存状态"""
+        row = self.conn.execute("SELECT * FROM permit_state WHERE car_plate = ?", (car_plate,)).fetchone()
+        return dict(row) if row else None
+
+    def save_outcome(self, outcome: Dict[str, Any]):
+        """
+        记录一次处理结果
+
+        查询成功时更新到期日期和查询时间；查询/登录失败只更新状态，保留上次的到期日期。
+        办理失败累计办理次数，办理成功后清零。
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        status = outcome['status']
+        checked = status in CHECKED_STATUSES
+        applied = status in ('applied', 'apply_failed')
+
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO permit_state (car_plate, status, end_date, checked_at, apply_attempts,
+                                          last_apply_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(car_plate) DO UPDATE SET
+                    status = excluded.status,
+                    end_date = CASE WHEN ? THEN excluded.end_date ELSE end_date END,
+                    checked_at = COALESCE(excluded.checked_at, checked_at),
+                    apply_attempts = CASE excluded.status
+                        WHEN 'applied' THEN 0
+                        WHEN 'apply_failed' THEN apply_attempts + 1
+                        ELSE apply_attempts END,
+                    last_apply_at = COALESCE(excluded.last_apply_at, last_apply_at),
+                    updated_at = excluded.updated_at
+            """, (outcome['car_plate'], status, outcome.get('end_date'), now if checked else None,
+                  1 if status == 'apply_failed' else 0, now if applied else None, now, checked))
+
+    def load_token(self, username: str) -> Optional[Dict[str, Any]]:
+        """读取账号缓存的token"""
+        row = self.conn.execute(
+            "SELECT access_token, refresh_token, expires_at FROM account_tokens WHERE username = ?",
+            (username,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def save_token(self, username: str, access_token: str, refresh_token: str, expires_at: float):
+        """保存账号的token"""
+        with self.conn:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO account_tokens (username, access_token, refresh_token, expires_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (username, access_token, refresh_token, expires_at, datetime.now().isoformat(timespec='seconds')))
+
+    def close(self):
+        self.conn.close()
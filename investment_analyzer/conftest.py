@@ -0,0 +1 @@
+# 让测试可以按 src.xxx 导入项目模块
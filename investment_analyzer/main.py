@@ -15,13 +15,25 @@ logger = logging.getLogger(__name__)
 
 def main():
     parser = argparse.ArgumentParser(description="投资分析系统")
-    parser.add_argument('--command', choices=['update', 'export', 'add'], required=True,
+    parser.add_argument('--command', choices=['update', 'export', 'export-all', 'add', 'fx-import'], required=True,
                        help='选择要执行的命令')
     parser.add_argument('--code', help='股票代码')
-    parser.add_argument('--days', type=int, default=365, help='获取数据天数')
+    parser.add_argument('--days', type=int, help='获取数据天数（默认365天，分钟线默认取该周期的保留天数）')
     parser.add_argument('--name', help='股票名称')
+    parser.add_argument('--ktype', choices=['K_DAY', 'K_1M', 'K_5M', 'K_60M', 'K_WEEK'],
+                       default='K_DAY', help='K线周期，默认日线')
+    parser.add_argument('--stream', action='store_true',
+                       help='流式导出（分块读取数据库，内存占用固定，适合大数据量导出）')
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx',
+                       help='流式导出/批量导出的文件格式')
+    parser.add_argument('--layout', choices=['sheets', 'files'], default='sheets',
+                       help='批量导出布局：sheets 每个标的一个工作表（仅支持xlsx），files 每个标的一个文件')
+    parser.add_argument('--workers', type=int, help='批量导出的并行进程数，默认为CPU核数')
+    parser.add_argument('--output', help='批量导出的输出文件（sheets）或目录（files）')
+    parser.add_argument('--file', help='导入汇率的CSV文件（列为 date,currency,rate）')
 
     args = parser.parse_args()
+    days = args.days or 365
 
     with InvestmentManager() as manager:
         if args.command == 'add':
@@ -39,10 +51,27 @@ def main():
         elif args.command == 'update':
             # 更新K线数据
             if manager.connect_futu():
-                if args.code:
+                if args.ktype != 'K_DAY':
+                    # 更新分钟/小时/周K线（--days 未指定时按该周期的保留天数获取）
+                    if args.code:
+                        logger.info(f"正在更新 {args.code} 的{args.ktype}K线数据...")
+                        result = manager.update_target_intraday_klines(args.code, args.ktype, args.days)
+                        if result['success']:
+                            logger.info(result['message'])
+                        else:
+                            logger.error(result['message'])
+                    else:
+                        logger.info(f"正在批量更新所有标的的{args.ktype}K线数据...")
+                        results = manager.update_all_targets_intraday_klines(args.ktype, args.days)
+                        for r in results:
+                            if r['success']:
+                                logger.info(f"✅ {r['code']}: {r['message']}")
+                            else:
+                                logger.error(f"❌ {r['code']}: {r.get('message', 'Unknown error')}")
+                elif args.code:
                     # 更新单个标的
                     logger.info(f"正在更新 {args.code} 的K线数据...")
-                    result = manager.update_target_klines(args.code, args.days)
+                    result = manager.update_target_klines(args.code, days)
                     if result['success']:
                         logger.info(result['message'])
                     else:
@@ -50,7 +79,7 @@ def main():
                 else:
                     # 更新所有标的
                     logger.info("正在批量更新所有标的...")
-                    results = manager.update_all_targets_klines(args.days)
+                    results = manager.update_all_targets_klines(days)
                     for r in results:
                         if r['success']:
                             logger.info(f"✅ {r['code']}: {r['message']}")
@@ -63,11 +92,22 @@ def main():
             # 导出报表
             exporter = ExportManager()
 
-            if args.code:
+            if args.stream:
+                # 流式导出：K线数据或交易记录按块写出
+                start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+                if args.code:
+                    filename = exporter.export_kline_stream(args.code, start_date=start_date,
+                                                            fmt=args.format)
+                    logger.info(f"K线数据已导出到: {filename}")
+                else:
+                    filename = exporter.export_transactions_stream(start_date=start_date,
+                                                                   fmt=args.format)
+                    logger.info(f"交易记录已导出到: {filename}")
+            elif args.code:
                 # 导出特定标的的K线数据
                 filename = exporter.export_kline_to_excel(
                     args.code,
-                    start_date=(datetime.now() - timedelta(days=args.days)).strftime('%Y-%m-%d')
+                    start_date=(datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
                 )
                 logger.info(f"K线数据已导出到: {filename}")
             else:
@@ -79,5 +119,29 @@ def main():
                 logger.info(f"持仓数据已导出到: {pos_file}")
                 logger.info(f"交易记录已导出到: {trans_file}")
 
+        elif args.command == 'fx-import':
+            # 导入汇率
+            if not args.file:
+                logger.error("导入汇率需要提供 --file 参数")
+                return
+
+            count = manager.fx.import_csv(args.file)
+            logger.info(f"成功导入 {count} 条汇率数据")
+
+        elif args.command == 'export-all':
+            # 批量导出所有关注标的的K线数据
+            if args.layout == 'sheets' and args.format != 'xlsx':
+                parser.error(f"--layout sheets 只支持xlsx格式，导出 {args.format} 请使用 --layout files")
+            exporter = ExportManager()
+            files = exporter.export_all_klines(
+                start_date=(datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d'),
+                layout=args.layout,
+                fmt=args.format,
+                output=args.output,
+                workers=args.workers
+            )
+            for filename in files:
+                logger.info(f"K线数据已导出到: {filename}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
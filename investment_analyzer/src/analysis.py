@@ -1,18 +1,22 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterator
 from datetime import datetime, timedelta
-from src.database import InvestmentDB
+from src.database import InvestmentDB, INTRADAY_KLINE_TABLES, KLINE_RETENTION_DAYS
 from src.futu_api import FutuAPIWrapper
+from src.lots import LotEngine
+from src.fx import FxRateTable, BASE_CURRENCY, MARKET_CURRENCY
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class InvestmentManager:
-    def __init__(self, db_path: str = "data/investment.db"):
+    def __init__(self, db_path: str = "data/investment.db", read_only: bool = False):
         """投资管理主类"""
-        self.db = InvestmentDB(db_path)
+        self.db = InvestmentDB(db_path, read_only=read_only)
+        self.lots = LotEngine(self.db.conn)
+        self.fx = FxRateTable(self.db.conn)
         self.futu_api = None
 
     def connect_futu(self, host='127.0.0.1', port=11111) -> bool:
@@ -133,9 +137,143 @@ class InvestmentManager:
 
         return results
 
+    def update_target_intraday_klines(self, code: str, ktype: str = 'K_5M',
+                                      days_back: int = None) -> Dict:
+        """更新单个标的的分钟/小时/周K线数据
+
+        Args:
+            code: 标的代码
+            ktype: K线周期（K_1M/K_5M/K_60M/K_WEEK）
+            days_back: 向前获取的天数，默认取该周期的保留天数
+        """
+        if not self.futu_api:
+            raise ConnectionError("未连接富途API")
+
+        table = intraday_kline_table(ktype)
+        if days_back is None:
+            days_back = KLINE_RETENTION_DAYS[ktype] or 365 * 5
+
+        result = self.futu_api.update_klines(code, ktype, days_back)
+
+        if not result['success']:
+            return result
+
+        df = result['data']
+
+        # 整列转换后一次性批量写入，避免逐行 iterrows
+        bar_times = pd.to_datetime(df['time_key']).astype('int64') // 10**9
+        turnover = df['turnover'] if 'turnover' in df.columns else pd.Series(0.0, index=df.index)
+        rows = list(zip(
+            [code] * len(df),
+            bar_times.tolist(),
+            df['open'].astype(float).tolist(),
+            df['high'].astype(float).tolist(),
+            df['low'].astype(float).tolist(),
+            df['close'].astype(float).tolist(),
+            df['volume'].astype('int64').tolist(),
+            turnover.astype(float).tolist()
+        ))
+
+        with self.db.conn:
+            self.db.conn.executemany(f"""
+                INSERT OR REPLACE INTO {table}
+                (target_code, bar_time, open, high, low, close, volume, turnover)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+        return {
+            'success': True,
+            'updated_count': len(rows),
+            'message': f"成功更新 {len(rows)} 条{ktype}K线数据"
+        }
+
+    def update_all_targets_intraday_klines(self, ktype: str = 'K_5M', days_back: int = None):
+        """更新所有标的的分钟/小时/周K线数据，并清理该周期的过期数据"""
+        targets = self.get_active_targets()
+        results = []
+
+        for target in targets:
+            logger.info(f"正在更新 {target['code']} 的{ktype}K线数据...")
+            try:
+                result = self.update_target_intraday_klines(target['code'], ktype, days_back)
+                result['code'] = target['code']
+                result['name'] = target['name']
+                results.append(result)
+            except Exception as e:
+                results.append({
+                    'code': target['code'],
+                    'name': target['name'],
+                    'success': False,
+                    'message': str(e)
+                })
+
+        self.purge_expired_klines(ktype)
+        return results
+
+    def purge_expired_klines(self, ktype: str = None) -> Dict[str, int]:
+        """按各周期的保留策略删除过期的K线数据
+
+        Args:
+            ktype: 只清理指定周期，默认清理所有周期
+
+        Returns:
+            Dict: 各周期删除的条数
+        """
+        ktypes = [ktype] if ktype else list(INTRADAY_KLINE_TABLES)
+        deleted = {}
+
+        with self.db.conn:
+            for kt in ktypes:
+                table = intraday_kline_table(kt)
+                retention_days = KLINE_RETENTION_DAYS.get(kt)
+                if not retention_days:
+                    continue
+
+                cutoff = to_bar_time(datetime.now() - timedelta(days=retention_days))
+                cur = self.db.conn.execute(f"DELETE FROM {table} WHERE bar_time < ?", (cutoff,))
+                deleted[kt] = cur.rowcount
+                if cur.rowcount:
+                    logger.info(f"已清理 {cur.rowcount} 条过期的{kt}K线数据")
+
+        return deleted
+
+    def get_intraday_kline_data(self, code: str, ktype: str = 'K_5M',
+                                start: str = None, end: str = None) -> pd.DataFrame:
+        """获取分钟/小时/周K线数据
+
+        Args:
+            code: 标的代码
+            ktype: K线周期
+            start: 开始时间，'YYYY-MM-DD' 或 'YYYY-MM-DD HH:MM:SS'
+            end: 结束时间，只给日期时包含当天所有K线
+        """
+        table = intraday_kline_table(ktype)
+        sql = f"SELECT * FROM {table} WHERE target_code = ?"
+        params = [code]
+
+        if start:
+            sql += " AND bar_time >= ?"
+            params.append(to_bar_time(start))
+        if end:
+            end_ts = pd.Timestamp(end)
+            if len(end) <= 10:
+                end_ts += pd.Timedelta(days=1)
+                sql += " AND bar_time < ?"
+            else:
+                sql += " AND bar_time <= ?"
+            params.append(to_bar_time(end_ts))
+
+        sql += " ORDER BY bar_time"
+
+        df = pd.read_sql_query(sql, self.db.conn, params=params)
+        if not df.empty:
+            df.insert(1, 'time_key', pd.to_datetime(df['bar_time'], unit='s'))
+        return df
+
     def add_transaction(self, code: str, direction: str, quantity: int,
                         price: float, trade_date: str = None,
-                        commission: float = 0, trade_id: str = None):
+                        commission: float = 0, trade_id: str = None,
+                        exchange_rate: float = None):
         """添加交易记录
 
         Args:
@@ -146,6 +284,7 @@ class InvestmentManager:
             trade_date: 交易日期（默认今天）
             commission: 手续费
             trade_id: 交易ID
+            exchange_rate: 成交日汇率（1单位交易货币折合人民币），默认从汇率表查询，查不到时保存为空
         """
         if not trade_date:
             trade_date = datetime.now().strftime('%Y-%m-%d')
@@ -159,18 +298,21 @@ class InvestmentManager:
             raise ValueError(f"未找到标的: {code}")
 
         # 根据市场确定货币
-        market_to_currency = {'HK': 'HKD', 'US': 'USD', 'CN': 'CNY'}
-        currency = market_to_currency[target['market']]
+        currency = MARKET_CURRENCY[target['market']]
+        if exchange_rate is None:
+            exchange_rate = self.fx.rate(currency, trade_date)
+            if exchange_rate is None:
+                logger.warning(f"缺少 {currency} 在 {trade_date} 的汇率，交易记录的汇率保存为空")
 
         sql = """
         INSERT INTO transactions
         (target_code, trade_date, direction, quantity, price,
-         commission, currency, trade_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+         commission, currency, exchange_rate, trade_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
         self.db.conn.execute(sql, (
             code, trade_date, direction.upper(), quantity,
-            price, commission, currency, trade_id
+            price, commission, currency, exchange_rate, trade_id
         ))
         self.db.conn.commit()
         logger.info(f"添加交易记录: {direction} {code} {quantity}股@{price}")
@@ -178,6 +320,19 @@ class InvestmentManager:
     def get_transactions(self, code: str = None, start_date: str = None,
                         end_date: str = None) -> List[Dict]:
         """获取交易记录"""
+        sql, params = self._transactions_query(code, start_date, end_date)
+        cur = self.db.conn.execute(sql, params)
+        return [dict(row) for row in cur.fetchall()]
+
+    def iter_transaction_chunks(self, code: str = None, start_date: str = None,
+                                end_date: str = None, chunksize: int = 50000) -> Iterator[pd.DataFrame]:
+        """按块读取交易记录，每次只在内存中保留 chunksize 行"""
+        sql, params = self._transactions_query(code, start_date, end_date)
+        yield from pd.read_sql_query(sql, self.db.conn, params=params, chunksize=chunksize)
+
+    def _transactions_query(self, code: str = None, start_date: str = None,
+                            end_date: str = None) -> Tuple[str, List]:
+        """构造交易记录查询语句"""
         sql = """
         SELECT t.*, tr.name
         FROM transactions t
@@ -197,39 +352,133 @@ class InvestmentManager:
             params.append(end_date)
 
         sql += " ORDER BY t.trade_date DESC"
+        return sql, params
 
-        cur = self.db.conn.execute(sql, params)
-        return [dict(row) for row in cur.fetchall()]
+    def get_holding_positions(self, date: str = None, method: str = 'FIFO',
+                              base_currency: str = BASE_CURRENCY) -> List[Dict]:
+        """获取持仓情况
+
+        持仓数量和成本来自持仓批次：查询当前持仓时先增量更新批次再读取，
+        查询历史日期时在内存中按截至该日的交易重新匹配。
+        *_base 列为按汇率换算到基准货币后的金额，可直接跨市场加总。
 
-    def get_holding_positions(self, date: str = None) -> List[Dict]:
-        """获取持仓情况"""
-        if not date:
-            date = datetime.now().strftime('%Y-%m-%d')
+        Args:
+            date: 截至日期，默认今天
+            method: 成本计算方式 FIFO/AVG
+            base_currency: 基准货币
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        if not date or date >= today:
+            date = today
+            self.lots.update(method=method)
+            lots = pd.read_sql_query(
+                "SELECT target_code, quantity, unit_cost FROM position_lots WHERE method = ?",
+                self.db.conn, params=[method]
+            )
+            realized = pd.read_sql_query(
+                "SELECT target_code, close_date, pnl FROM realized_pnl WHERE method = ?",
+                self.db.conn, params=[method]
+            )
+        else:
+            matched = self.lots.match_as_of(date, method)
+            lots = pd.concat(
+                [open_lots.assign(target_code=code) for code, (open_lots, _) in matched.items()],
+                ignore_index=True
+            ) if matched else pd.DataFrame(columns=['target_code', 'quantity', 'unit_cost'])
+            realized = pd.concat(
+                [pnl.assign(target_code=code) for code, (_, pnl) in matched.items()],
+                ignore_index=True
+            ) if matched else pd.DataFrame(columns=['target_code', 'close_date', 'pnl'])
+
+        if lots.empty and realized.empty:
+            return []
+
+        lots['total_cost'] = lots['quantity'].astype(float) * lots['unit_cost'].astype(float)
+        positions = lots.groupby('target_code', as_index=False)[['quantity', 'total_cost']].sum()
+
+        targets = pd.read_sql_query("SELECT code AS target_code, name, market FROM targets", self.db.conn)
+        targets['currency'] = targets['market'].map(MARKET_CURRENCY)
+
+        # 已实现盈亏按平仓日汇率换算后再按标的汇总
+        realized = realized.merge(targets[['target_code', 'currency']], on='target_code')
+        realized['pnl_base'] = self.fx.convert(realized['pnl'], realized['currency'],
+                                               realized['close_date'], base_currency)
+        # 任一笔缺少汇率时，该标的换算后的已实现盈亏为空（不当作0加总）
+        missing_fx = realized['pnl_base'].isna().groupby(realized['target_code']).any()
+        realized = realized.groupby('target_code')[['pnl', 'pnl_base']].sum()
+        realized['pnl_base'] = realized['pnl_base'].where(~missing_fx)
+        realized = (realized.reset_index()
+                            .rename(columns={'pnl': 'realized_pnl', 'pnl_base': 'realized_pnl_base'}))
+
+        # 已全部平仓的标的也保留一行（数量为0），已实现盈亏才能计入汇总
+        positions = (positions
+                     .merge(realized, on='target_code', how='outer')
+                     .merge(targets, on='target_code')
+                     .merge(self.get_latest_prices(date), on='target_code', how='left'))
+        positions['quantity'] = positions['quantity'].astype(float).fillna(0)
+        positions['total_cost'] = positions['total_cost'].astype(float).fillna(0)
+        positions['avg_cost'] = positions['total_cost'] / positions['quantity'].where(positions['quantity'] > 0)
+
+        positions['market_value'] = (positions['quantity'] * positions['latest_price']).fillna(0)
+        positions['unrealized_pnl'] = positions['quantity'] * positions['latest_price'] - positions['total_cost']
+        # 没有平仓记录的标的已实现盈亏为0；有记录但缺少汇率的保持为空
+        no_realized = positions['realized_pnl'].isna()
+        positions['realized_pnl'] = positions['realized_pnl'].fillna(0)
+        positions.loc[no_realized, 'realized_pnl_base'] = 0.0
+
+        # 市值、成本按估值日汇率整列换算为基准货币
+        positions['base_currency'] = base_currency
+        positions['fx_rate'] = self.fx.convert(1.0, positions['currency'], date, base_currency)
+        positions['market_value_base'] = positions['market_value'] * positions['fx_rate']
+        positions['total_cost_base'] = positions['total_cost'] * positions['fx_rate']
+        positions['unrealized_pnl_base'] = positions['unrealized_pnl'] * positions['fx_rate']
+
+        # 缺少汇率时 *_base 列为 None
+        positions = positions.sort_values('target_code')
+        return positions.astype(object).where(positions.notna(), None).to_dict('records')
+
+    def update_lots(self, code: str = None, method: str = 'FIFO', rebuild: bool = False) -> Dict[str, int]:
+        """增量更新持仓批次和已实现盈亏（修改或删除历史交易后需 rebuild=True）"""
+        return self.lots.update(code, method=method, rebuild=rebuild)
+
+    def get_realized_pnl(self, code: str = None, start_date: str = None,
+                         end_date: str = None, method: str = 'FIFO') -> List[Dict]:
+        """获取已实现盈亏明细（按平仓日期筛选）"""
+        self.lots.update(code, method=method)
 
-        # 计算每个标的的持仓
         sql = """
-        SELECT
-            target_code,
-            name,
-            market,
-            SUM(CASE WHEN direction = 'BUY' THEN quantity ELSE -quantity END) as quantity,
-            AVG(CASE WHEN direction = 'BUY' THEN quantity ELSE -quantity END) as avg_cost
-        FROM transactions t
-        JOIN targets tr ON t.target_code = tr.code
-        WHERE trade_date <= ?
-        GROUP BY target_code, name, market
-        HAVING quantity > 0
+        SELECT r.*, tr.name
+        FROM realized_pnl r
+        JOIN targets tr ON r.target_code = tr.code
+        WHERE r.method = ?
         """
-        cur = self.db.conn.execute(sql, (date,))
-        positions = [dict(row) for row in cur.fetchall()]
+        params = [method]
 
-        # 获取最新价格
-        for pos in positions:
-            latest_price = self.get_latest_price(pos['target_code'])
-            pos['latest_price'] = latest_price
-            pos['market_value'] = pos['quantity'] * latest_price if latest_price else 0
+        if code:
+            sql += " AND r.target_code = ?"
+            params.append(code)
+        if start_date:
+            sql += " AND r.close_date >= ?"
+            params.append(start_date)
+        if end_date:
+            sql += " AND r.close_date <= ?"
+            params.append(end_date)
+
+        sql += " ORDER BY r.close_date DESC, r.id DESC"
+
+        cur = self.db.conn.execute(sql, params)
+        return [dict(row) for row in cur.fetchall()]
+
+    def get_latest_prices(self, date: str = None) -> pd.DataFrame:
+        """获取所有标的截至某日的最新收盘价（一次查询）"""
+        sql = "SELECT target_code, close AS latest_price, MAX(trade_date) AS price_date FROM daily_klines"
+        params = []
+        if date:
+            sql += " WHERE trade_date < date(?, '+1 day')"
+            params.append(date)
+        sql += " GROUP BY target_code"
 
-        return positions
+        return pd.read_sql_query(sql, self.db.conn, params=params)[['target_code', 'latest_price']]
 
     def get_latest_price(self, code: str) -> Optional[float]:
         """获取最新收盘价"""
@@ -243,6 +492,23 @@ class InvestmentManager:
     def get_kline_data(self, code: str, start_date: str = None,
                       end_date: str = None) -> pd.DataFrame:
         """获取K线数据"""
+        sql, params = self._kline_query(code, start_date, end_date)
+        df = pd.read_sql_query(sql, self.db.conn, params=params)
+        if not df.empty:
+            df['trade_date'] = pd.to_datetime(df['trade_date'])
+        return df
+
+    def iter_kline_chunks(self, code: str, start_date: str = None, end_date: str = None,
+                          chunksize: int = 50000) -> Iterator[pd.DataFrame]:
+        """按块读取日K线数据，每次只在内存中保留 chunksize 行"""
+        sql, params = self._kline_query(code, start_date, end_date)
+        for chunk in pd.read_sql_query(sql, self.db.conn, params=params, chunksize=chunksize):
+            chunk['trade_date'] = pd.to_datetime(chunk['trade_date'])
+            yield chunk
+
+    def _kline_query(self, code: str, start_date: str = None,
+                     end_date: str = None) -> Tuple[str, List]:
+        """构造日K线查询语句"""
         sql = """
         SELECT * FROM daily_klines
         WHERE target_code = ?
@@ -257,11 +523,7 @@ class InvestmentManager:
             params.append(end_date)
 
         sql += " ORDER BY trade_date"
-
-        df = pd.read_sql_query(sql, self.db.conn, params=params)
-        if not df.empty:
-            df['trade_date'] = pd.to_datetime(df['trade_date'])
-        return df
+        return sql, params
 
     def calculate_returns(self, code: str, period: int = 30) -> Dict:
         """计算指定期间的收益率"""
@@ -300,4 +562,16 @@ class InvestmentManager:
 
 def col_exists(row: pd.Series, col: str) -> bool:
     """检查列是否存在"""
-    return col in row
\ No newline at end of file
+    return col in row
+
+
+def intraday_kline_table(ktype: str) -> str:
+    """获取K线周期对应的数据表名"""
+    if ktype not in INTRADAY_KLINE_TABLES:
+        raise ValueError(f"不支持的K线周期: {ktype}")
+    return INTRADAY_KLINE_TABLES[ktype]
+
+
+def to_bar_time(value) -> int:
+    """将日期时间转换为K线表使用的秒级时间戳"""
+    return int(pd.Timestamp(value).value // 10**9)
@@ -3,10 +3,38 @@ import os
 from datetime import datetime
 from typing import List, Dict, Optional
 
+# 分钟/小时/周K线按周期拆分到独立的表中，单表只存一种周期，
+# 既方便按周期清理过期数据，也让范围查询只扫描对应周期的数据
+INTRADAY_KLINE_TABLES = {
+    'K_1M': 'klines_1m',
+    'K_5M': 'klines_5m',
+    'K_60M': 'klines_60m',
+    'K_WEEK': 'klines_week',
+}
+
+# 各周期K线的保留天数（None表示永久保留）
+KLINE_RETENTION_DAYS = {
+    'K_1M': 30,
+    'K_5M': 180,
+    'K_60M': 730,
+    'K_WEEK': None,
+}
+
+
 class InvestmentDB:
-    def __init__(self, db_path: str = "data/investment.db"):
-        """初始化数据库连接"""
+    def __init__(self, db_path: str = "data/investment.db", read_only: bool = False):
+        """初始化数据库连接
+
+        Args:
+            db_path: 数据库文件路径
+            read_only: 以只读方式打开（用于并行导出等多进程只读场景，不建表）
+        """
         self.db_path = db_path
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            return
+
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
@@ -52,6 +80,23 @@ class InvestmentDB:
                 )
             """)
 
+            # 多周期K线表：bar_time为K线时间（市场本地时间）的秒级时间戳，
+            # 以 (target_code, bar_time) 作为聚簇主键，按标的+时间范围查询直接走主键
+            for table in INTRADAY_KLINE_TABLES.values():
+                self.conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        target_code TEXT NOT NULL,
+                        bar_time INTEGER NOT NULL,
+                        open REAL,
+                        high REAL,
+                        low REAL,
+                        close REAL,
+                        volume INTEGER,
+                        turnover REAL,
+                        PRIMARY KEY (target_code, bar_time)
+                    ) WITHOUT ROWID
+                """)
+
             # 交易记录表
             self.conn.execute("""
                 CREATE TABLE IF NOT EXISTS transactions (
@@ -70,6 +115,63 @@ class InvestmentDB:
                 )
             """)
 
+            # 未平仓批次表：FIFO方式每个开仓交易一行，AVG方式每个标的一行
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS position_lots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    target_code TEXT NOT NULL,
+                    method TEXT NOT NULL,  -- FIFO/AVG
+                    transaction_id INTEGER,  -- 开仓交易ID（AVG方式为空）
+                    open_date DATE NOT NULL,
+                    quantity REAL NOT NULL,  -- 剩余数量
+                    unit_cost REAL NOT NULL,  -- 含手续费的单位成本
+                    FOREIGN KEY (target_code) REFERENCES targets(code)
+                )
+            """)
+
+            # 已实现盈亏表：每次卖出与开仓批次的一次配对为一行
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS realized_pnl (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    target_code TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    buy_transaction_id INTEGER,
+                    sell_transaction_id INTEGER NOT NULL,
+                    open_date DATE,
+                    close_date DATE NOT NULL,
+                    quantity REAL NOT NULL,
+                    cost REAL NOT NULL,
+                    proceeds REAL NOT NULL,
+                    pnl REAL NOT NULL,
+                    holding_days INTEGER,
+                    FOREIGN KEY (target_code) REFERENCES targets(code)
+                )
+            """)
+
+            # 批次匹配进度表：记录每个标的已处理到的交易，新交易只做增量匹配
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS lot_state (
+                    target_code TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    last_transaction_id INTEGER NOT NULL,
+                    last_trade_date DATE NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (target_code, method)
+                )
+            """)
+
+            # 汇率表：每种货币每天一个汇率，rate_to_cny 为1单位该货币折合的人民币
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS fx_rates (
+                    currency TEXT NOT NULL,  -- HKD/USD/...
+                    rate_date DATE NOT NULL,
+                    rate_to_cny REAL NOT NULL,
+                    source TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (currency, rate_date)
+                ) WITHOUT ROWID
+            """)
+
             # 资金账户表
             self.conn.execute("""
                 CREATE TABLE IF NOT EXISTS accounts (
@@ -118,6 +220,8 @@ class InvestmentDB:
             self.conn.execute("CREATE INDEX IF NOT EXISTS idx_klines_target_date ON daily_klines(target_code, trade_date)")
             self.conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_target_date ON transactions(target_code, trade_date)")
             self.conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_target_date ON ai_analysis(target_code, analysis_date)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_lots_target_method ON position_lots(target_code, method)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_realized_target_date ON realized_pnl(target_code, method, close_date)")
 
     def close(self):
         """关闭数据库连接"""
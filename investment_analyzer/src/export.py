@@ -1,7 +1,205 @@
 import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from analysis import InvestmentManager
+from typing import Iterable, Iterator, List, Tuple
+from openpyxl import Workbook
+from src.analysis import InvestmentManager
+import logging
 import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 导出Parquet时才需要
+    pa = None
+    pq = None
+
+# 单个Excel工作表的最大行数（含表头）
+EXCEL_MAX_ROWS = 1048576
+
+# 流式导出时每次从数据库读取的行数
+DEFAULT_CHUNKSIZE = 50000
+
+# 导出格式对应的文件扩展名
+EXPORT_FORMATS = {'xlsx': 'xlsx', 'csv': 'csv', 'parquet': 'parquet'}
+
+
+class StreamingTableWriter:
+    """按块写入表格数据，内存占用只与单个数据块大小有关
+
+    xlsx 使用 openpyxl 的 write_only 模式逐行写出，超过单表行数上限时自动续写到新工作表；
+    csv 以追加方式写出；parquet 使用 pyarrow 逐个 row group 写出。
+    """
+
+    def __init__(self, filename: str, fmt: str = 'xlsx', sheet_name: str = 'Sheet1'):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+        if fmt == 'parquet' and pq is None:
+            raise ImportError("导出Parquet需要安装 pyarrow")
+
+        self.filename = filename
+        self.fmt = fmt
+        self.sheet_name = sheet_name
+        self.rows_written = 0
+
+        self._workbook = Workbook(write_only=True) if fmt == 'xlsx' else None
+        self._sheet = None
+        self._sheet_rows = 0
+        self._sheet_count = 0
+        self._columns = None
+        self._parquet_writer = None
+        self._parquet_schema = None
+
+    def write(self, chunk: pd.DataFrame):
+        """写入一个数据块"""
+        if chunk.empty:
+            return
+
+        if self.fmt == 'xlsx':
+            self._write_xlsx(chunk)
+        elif self.fmt == 'csv':
+            chunk.to_csv(self.filename, mode='a' if self.rows_written else 'w',
+                         header=not self.rows_written, index=False, encoding='utf-8-sig')
+        else:
+            table = pa.Table.from_pandas(chunk, schema=self._parquet_schema, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_schema = table.schema
+                self._parquet_writer = pq.ParquetWriter(self.filename, table.schema)
+            self._parquet_writer.write_table(table)
+
+        self.rows_written += len(chunk)
+
+    def add_sheet(self, sheet_name: str, df: pd.DataFrame):
+        """追加一个独立的小表（如汇总数据），仅xlsx格式支持"""
+        if self.fmt != 'xlsx':
+            raise ValueError("只有xlsx格式支持多个工作表")
+        sheet = self._workbook.create_sheet(sheet_name)
+        append_frame(sheet, df, header=True)
+
+    def close(self) -> str:
+        """完成写入并关闭文件"""
+        if self.fmt == 'xlsx':
+            if self._sheet is None:
+                self._workbook.create_sheet(self.sheet_name)
+            self._workbook.save(self.filename)
+        elif self.fmt == 'csv' and not self.rows_written:
+            open(self.filename, 'w').close()
+        elif self.fmt == 'parquet' and self._parquet_writer:
+            self._parquet_writer.close()
+        return self.filename
+
+    def _write_xlsx(self, chunk: pd.DataFrame):
+        """写入xlsx，当前工作表写满时续写到下一个工作表"""
+        if self._columns is None:
+            self._columns = list(chunk.columns)
+
+        start = 0
+        while start < len(chunk):
+            if self._sheet is None or self._sheet_rows >= EXCEL_MAX_ROWS:
+                self._sheet_count += 1
+                name = self.sheet_name if self._sheet_count == 1 else f"{self.sheet_name}_{self._sheet_count}"
+                self._sheet = self._workbook.create_sheet(name)
+                self._sheet.append(self._columns)
+                self._sheet_rows = 1
+
+            end = start + EXCEL_MAX_ROWS - self._sheet_rows
+            part = chunk.iloc[start:end]
+            append_frame(self._sheet, part, header=False)
+            self._sheet_rows += len(part)
+            start = end
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        """写入中途出错时关闭已打开的文件并删除写了一半的文件（xlsx 在 close 时才落盘，只需关闭工作表）"""
+        if self._workbook is not None:
+            for sheet in self._workbook.worksheets:
+                sheet.close()
+            self._workbook = None
+        if self._parquet_writer is not None:
+            try:
+                self._parquet_writer.close()
+            except Exception as e:
+                logger.warning(f"关闭Parquet文件失败: {e}")
+            self._parquet_writer = None
+        if self.fmt != 'xlsx' and os.path.exists(self.filename):
+            os.remove(self.filename)
+            logger.info(f"导出失败，已删除未写完的文件: {self.filename}")
+
+
+def append_frame(sheet, df: pd.DataFrame, header: bool = True):
+    """将DataFrame逐行追加到 write_only 工作表"""
+    if header:
+        sheet.append(list(df.columns))
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        sheet.append(row)
+
+
+def add_kline_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    """为K线数据添加均线等技术指标"""
+    if not df.empty:
+        df['ma5'] = df['close'].rolling(5).mean()
+        df['ma20'] = df['close'].rolling(20).mean()
+        df['ma60'] = df['close'].rolling(60).mean()
+    return df
+
+
+def compute_target_klines(db_path: str, code: str, start_date: str = None,
+                          end_date: str = None) -> Tuple[str, pd.DataFrame]:
+    """在工作进程中读取单个标的的K线并计算技术指标（只读打开数据库）"""
+    with InvestmentManager(db_path, read_only=True) as manager:
+        df = manager.get_kline_data(code, start_date, end_date)
+    return code, add_kline_indicators(df)
+
+
+def sheet_title(name: str) -> str:
+    """转换为合法的Excel工作表名（去掉非法字符，最长31个字符）"""
+    return re.sub(r'[\\/*?:\[\]]', '_', name)[:31]
+
+
+def summarize_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """按标的汇总交易（可逐块汇总后相加），net_quantity 为买入减卖出的净数量"""
+    net_quantity = np.where(df['direction'] == 'BUY', df['quantity'], -df['quantity'])
+    return (df.assign(net_quantity=net_quantity)
+              .groupby('target_code')[['quantity', 'net_quantity', 'amount', 'commission']]
+              .sum())
+
+
+def label_net_direction(summary: pd.DataFrame) -> pd.DataFrame:
+    """根据净数量标注净买入/净卖出"""
+    summary['type'] = np.select(
+        [summary['net_quantity'] > 0, summary['net_quantity'] < 0],
+        ['净买入', '净卖出'],
+        default='持平'
+    )
+    return summary
+
+
+def add_moving_averages(chunks: Iterable[pd.DataFrame], windows=(5, 20, 60)) -> Iterator[pd.DataFrame]:
+    """为按时间排序的K线数据块计算均线，块与块之间衔接前一块末尾的收盘价"""
+    tail = pd.Series(dtype=float)
+    history = max(windows) - 1
+
+    for chunk in chunks:
+        closes = pd.concat([tail, chunk['close'].astype(float)], ignore_index=True)
+        for window in windows:
+            chunk[f'ma{window}'] = closes.rolling(window).mean().iloc[len(tail):].to_numpy()
+        tail = closes.iloc[-history:]
+        yield chunk
+
 
 class ExportManager:
     def __init__(self, db_path: str = "data/investment.db"):
@@ -19,24 +217,31 @@ class ExportManager:
         if positions:
             df = pd.DataFrame(positions)
 
-            # 计算更多指标
-            df['total_cost'] = df['avg_cost'] * df['quantity']
-            df['market_value'] = df['latest_price'] * df['quantity']
+            # 缺少汇率时 *_base 为 None，转为 NaN 后加总时跳过
+            base_columns = ['market_value_base', 'total_cost_base', 'unrealized_pnl_base', 'realized_pnl_base']
+            df[base_columns] = df[base_columns].astype(float)
+
+            # 计算更多指标（已平仓的标的成本为0，不计算盈亏比例）
             df['profit_loss'] = df['market_value'] - df['total_cost']
-            df['profit_loss_pct'] = (df['profit_loss'] / df['total_cost']) * 100
+            df['profit_loss_pct'] = df['profit_loss'] / df['total_cost'].where(df['total_cost'] > 0) * 100
 
             # 导出到Excel
             with pd.ExcelWriter(filename, engine='openpyxl') as writer:
                 df.to_excel(writer, sheet_name='持仓明细', index=False)
 
-                # 汇总数据
+                # 汇总数据（换算为基准货币后加总，缺少汇率的标的不计入，单独列出）
+                missing_fx = df.loc[df['fx_rate'].isna() | df['realized_pnl_base'].isna(), 'target_code']
+                total_cost_base = df['total_cost_base'].sum()
                 summary = pd.DataFrame({
-                    '指标': ['总市值', '总成本', '总盈亏', '盈亏比例(%)'],
+                    '指标': ['总市值', '总成本', '总盈亏', '盈亏比例(%)', '已实现盈亏', '基准货币', '缺少汇率的标的'],
                     '数值': [
-                        df['market_value'].sum(),
-                        df['total_cost'].sum(),
-                        df['profit_loss'].sum(),
-                        (df['profit_loss'].sum() / df['total_cost'].sum()) * 100
+                        df['market_value_base'].sum(),
+                        total_cost_base,
+                        df['unrealized_pnl_base'].sum(),
+                        df['unrealized_pnl_base'].sum() / total_cost_base * 100 if total_cost_base else None,
+                        df['realized_pnl_base'].sum(),
+                        df['base_currency'].iloc[0],
+                        ', '.join(missing_fx) or '无'
                     ]
                 })
                 summary.to_excel(writer, sheet_name='汇总', index=False)
@@ -65,17 +270,14 @@ class ExportManager:
 
                 # 按标的汇总
                 if not df.empty:
-                    summary_by_target = df.groupby('target_code').agg({
-                        'quantity': 'sum',
-                        'amount': 'sum',
-                        'commission': 'sum'
-                    }).reset_index()
-                    summary_by_target['type'] = summary_by_target.apply(
-                        lambda x: '买入' if x['quantity'] > 0 else '卖出',
-                        axis=1
-                    )
+                    summary_by_target = label_net_direction(summarize_transactions(df).reset_index())
                     summary_by_target.to_excel(writer, sheet_name='按标的汇总', index=False)
 
+                # 已实现盈亏（FIFO）
+                realized = self.manager.get_realized_pnl(start_date=start_date, end_date=end_date)
+                if realized:
+                    pd.DataFrame(realized).to_excel(writer, sheet_name='已实现盈亏', index=False)
+
         return filename
 
     def export_kline_to_excel(self, code: str, start_date: str = None,
@@ -90,10 +292,134 @@ class ExportManager:
 
         if not df.empty:
             # 添加技术指标
-            df['ma5'] = df['close'].rolling(5).mean()
-            df['ma20'] = df['close'].rolling(20).mean()
-            df['ma60'] = df['close'].rolling(60).mean()
+            add_kline_indicators(df)
 
             df.to_excel(filename, index=False)
 
-        return filename
\ No newline at end of file
+        return filename
+
+    def export_kline_stream(self, code: str, start_date: str = None, end_date: str = None,
+                            filename: str = None, fmt: str = 'xlsx',
+                            chunksize: int = DEFAULT_CHUNKSIZE) -> str:
+        """流式导出K线数据，适用于多年、大量数据的导出
+
+        Args:
+            code: 标的代码
+            start_date: 开始日期
+            end_date: 结束日期
+            filename: 输出文件名
+            fmt: 导出格式 xlsx/csv/parquet
+            chunksize: 每次从数据库读取的行数
+        """
+        if not filename:
+            filename = f"reports/kline_{code}_{datetime.now().strftime('%Y%m%d')}.{EXPORT_FORMATS[fmt]}"
+
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        chunks = self.manager.iter_kline_chunks(code, start_date, end_date, chunksize=chunksize)
+        with StreamingTableWriter(filename, fmt, sheet_name='K线数据') as writer:
+            for chunk in add_moving_averages(chunks):
+                writer.write(chunk)
+
+        return filename
+
+    def export_transactions_stream(self, start_date: str = None, end_date: str = None,
+                                   filename: str = None, fmt: str = 'xlsx',
+                                   chunksize: int = DEFAULT_CHUNKSIZE) -> str:
+        """流式导出交易记录，按标的汇总在读取过程中累加
+
+        xlsx格式的汇总写在“按标的汇总”工作表中，csv/parquet格式写到同目录的 *_by_target 文件中。
+        """
+        if not filename:
+            filename = f"reports/transactions_{datetime.now().strftime('%Y%m%d')}.{EXPORT_FORMATS[fmt]}"
+
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        summary = None
+        chunks = self.manager.iter_transaction_chunks(start_date=start_date, end_date=end_date,
+                                                      chunksize=chunksize)
+        with StreamingTableWriter(filename, fmt, sheet_name='交易记录') as writer:
+            for chunk in chunks:
+                chunk['amount'] = chunk['quantity'] * chunk['price']
+                writer.write(chunk)
+
+                chunk_summary = summarize_transactions(chunk)
+                summary = chunk_summary if summary is None else summary.add(chunk_summary, fill_value=0)
+
+            if summary is not None:
+                summary = label_net_direction(summary.reset_index())
+                if fmt == 'xlsx':
+                    writer.add_sheet('按标的汇总', summary)
+                else:
+                    stem, ext = os.path.splitext(filename)
+                    with StreamingTableWriter(f"{stem}_by_target{ext}", fmt) as summary_writer:
+                        summary_writer.write(summary)
+
+        return filename
+
+    def export_all_klines(self, start_date: str = None, end_date: str = None,
+                          layout: str = 'sheets', fmt: str = 'xlsx',
+                          output: str = None, workers: int = None) -> List[str]:
+        """批量导出所有关注标的的K线数据
+
+        各标的的数据读取和指标计算在进程池中并行完成，结果按标的顺序交给主进程，
+        由主进程串行写出，避免多个进程同时写同一个文件。
+
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            layout: sheets - 所有标的写入同一个Excel，每个标的一个工作表；
+                    files - 每个标的一个文件
+            fmt: 文件格式 xlsx/csv/parquet，sheets 布局只支持 xlsx
+            output: sheets 模式下为输出文件名，files 模式下为输出目录
+            workers: 进程数，默认为CPU核数
+
+        Returns:
+            List[str]: 生成的文件列表
+        """
+        if layout not in ('sheets', 'files'):
+            raise ValueError(f"不支持的导出布局: {layout}")
+        if layout == 'sheets' and fmt != 'xlsx':
+            raise ValueError(f"sheets 布局只支持xlsx格式，导出 {fmt} 请使用 files 布局")
+
+        today = datetime.now().strftime('%Y%m%d')
+        if layout == 'sheets':
+            output = output or f"reports/klines_all_{today}.xlsx"
+            if os.path.dirname(output):
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+        else:
+            output = output or f"reports/klines_{today}"
+            os.makedirs(output, exist_ok=True)
+
+        codes = [t['code'] for t in self.manager.get_active_targets()]
+        db_path = self.manager.db.db_path
+        files = []
+        started = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(compute_target_klines, db_path, code, start_date, end_date)
+                for code in codes
+            ]
+
+            if layout == 'sheets':
+                workbook = Workbook(write_only=True)
+                for future in futures:
+                    code, df = future.result()
+                    append_frame(workbook.create_sheet(sheet_title(code)), df)
+                if not codes:
+                    workbook.create_sheet('K线数据')
+                workbook.save(output)
+                files.append(output)
+            else:
+                for future in futures:
+                    code, df = future.result()
+                    filename = os.path.join(output, f"kline_{code}_{today}.{EXPORT_FORMATS[fmt]}")
+                    with StreamingTableWriter(filename, fmt, sheet_name=sheet_title(code)) as writer:
+                        writer.write(df)
+                    files.append(filename)
+
+        logger.info(f"已导出 {len(codes)} 个标的的K线数据，耗时 {time.perf_counter() - started:.2f} 秒")
+        return files
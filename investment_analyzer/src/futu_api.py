@@ -102,6 +102,50 @@ class FutuAPIWrapper:
             logging.error(f"获取K线数据失败 [{code}]: {data}")
             return pd.DataFrame()
 
+    def get_kline_data_paged(self, code: str, start_date: str, end_date: str,
+                             ktype=KLType.K_1M, page_size: int = 1000) -> pd.DataFrame:
+        """分页获取K线数据（分钟/小时线单次请求最多返回 page_size 条）
+
+        Args:
+            code: 股票代码
+            start_date: 开始日期，格式 'YYYY-MM-DD'
+            end_date: 结束日期，格式 'YYYY-MM-DD'
+            ktype: K线类型
+            page_size: 每页条数
+
+        Returns:
+            DataFrame: 所有分页拼接后的K线数据
+        """
+        if not self.is_connected:
+            raise ConnectionError("未连接到富途API")
+
+        market_config = self.get_market_config(code)
+        pages = []
+        page_req_key = None
+
+        while True:
+            ret, data, page_req_key = self.quote_ctx.request_history_kline(
+                code=code,
+                start=start_date,
+                end=end_date,
+                ktype=ktype,
+                autype=AuType.Qfq,
+                max_count=page_size,
+                page_req_key=page_req_key
+            )
+            if ret != RET_OK:
+                logging.error(f"分页获取K线数据失败 [{code}]: {data}")
+                return pd.DataFrame()
+
+            pages.append(data)
+            if page_req_key is None:
+                break
+
+        data = pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
+        if not data.empty:
+            data['currency'] = market_config['currency']
+        return data
+
     def batch_get_quotes(self, code_list: List[str]) -> pd.DataFrame:
         """批量获取实时行情"""
         if not self.is_connected:
@@ -177,6 +221,38 @@ class FutuAPIWrapper:
             logging.error(f"更新日线数据时发生错误: {str(e)}")
             return {'success': False, 'message': str(e)}
 
+    def update_klines(self, code: str, ktype: str, days_back: int) -> Dict:
+        """更新指定周期的K线数据
+
+        Args:
+            code: 股票代码
+            ktype: K线周期，如 'K_1M', 'K_5M', 'K_60M', 'K_WEEK'
+            days_back: 向前获取的天数
+
+        Returns:
+            Dict: 包含更新结果信息
+        """
+        try:
+            end_date = datetime.now().strftime('%Y-%m-%d')
+            start_date = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
+
+            data = self.get_kline_data_paged(code, start_date, end_date, ktype=getattr(KLType, ktype))
+
+            if data.empty:
+                return {'success': False, 'message': '未获取到数据'}
+
+            return {
+                'success': True,
+                'data': data,
+                'start_date': start_date,
+                'end_date': end_date,
+                'count': len(data)
+            }
+
+        except Exception as e:
+            logging.error(f"更新{ktype}K线数据时发生错误: {str(e)}")
+            return {'success': False, 'message': str(e)}
+
     def __enter__(self):
         return self
 
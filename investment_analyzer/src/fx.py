@@ -0,0 +1,119 @@
+import sqlite3
+import pandas as pd
+import numpy as np
+from typing import List, Dict, Optional, Tuple, Iterable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 汇率表以人民币为基准存储
+BASE_CURRENCY = 'CNY'
+
+# 市场对应的交易货币
+MARKET_CURRENCY = {'HK': 'HKD', 'US': 'USD', 'CN': 'CNY'}
+
+
+class FxRateTable:
+    """汇率表及其内存索引
+
+    fx_rates 表按日保存各货币对人民币的汇率。查询时把整张表按货币加载成有序的
+    (日期数组, 汇率数组)，用 searchsorted 一次完成一批金额的“截至某日最近汇率”查找，
+    估值时按货币分组整列换算，不需要逐行查询数据库。
+    汇率表有写入（包括其他进程写入）后，下次查询时自动重新加载索引。
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._index: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._stamp = None
+
+    def upsert_rates(self, rates: Iterable[Tuple[str, str, float]], source: str = 'manual') -> int:
+        """批量写入汇率
+
+        Args:
+            rates: (货币, 日期 YYYY-MM-DD, 1单位该货币折合人民币) 的列表
+            source: 汇率来源
+
+        Returns:
+            int: 写入条数
+        """
+        rows = [(currency.upper(), rate_date, float(rate), source) for currency, rate_date, rate in rates]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO fx_rates (currency, rate_date, rate_to_cny, source)
+                VALUES (?, ?, ?, ?)
+            """, rows)
+        self._stamp = None
+        return len(rows)
+
+    def import_csv(self, path: str, source: str = 'csv') -> int:
+        """从CSV导入汇率，列为 date,currency,rate（rate 为1单位该货币折合人民币）"""
+        df = pd.read_csv(path, dtype={'currency': str})
+        df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+        return self.upsert_rates(df[['currency', 'date', 'rate']].itertuples(index=False, name=None), source)
+
+    def rates_as_of(self, currencies, dates) -> np.ndarray:
+        """批量查询各货币截至对应日期的最近汇率（折合人民币），查不到时为 NaN
+
+        Args:
+            currencies: 货币代码数组
+            dates: 日期数组，或单个日期（对所有货币使用同一日期）
+        """
+        self._ensure_index()
+
+        currencies = np.asarray(currencies, dtype=object)
+        if np.ndim(dates) == 0:
+            dates = np.full(len(currencies), np.datetime64(pd.Timestamp(dates).date(), 'D'))
+        else:
+            dates = pd.to_datetime(np.asarray(dates)).to_numpy().astype('datetime64[D]')
+
+        result = np.full(len(currencies), np.nan)
+        for currency in pd.unique(currencies):
+            mask = currencies == currency
+            if currency == BASE_CURRENCY:
+                result[mask] = 1.0
+                continue
+            if currency not in self._index:
+                continue
+
+            rate_dates, rates = self._index[currency]
+            pos = np.searchsorted(rate_dates, dates[mask], side='right') - 1
+            result[mask] = np.where(pos >= 0, rates[np.maximum(pos, 0)], np.nan)
+
+        missing = pd.unique(currencies[np.isnan(result)])
+        if len(missing):
+            logger.warning(f"缺少汇率数据: {', '.join(map(str, missing))}")
+        return result
+
+    def convert(self, amounts, currencies, dates, base_currency: str = BASE_CURRENCY) -> np.ndarray:
+        """把一批金额从各自货币换算为基准货币"""
+        rates = self.rates_as_of(currencies, dates)
+        if base_currency != BASE_CURRENCY:
+            rates = rates / self.rates_as_of([base_currency] * len(rates), dates)
+        return np.asarray(amounts, dtype=float) * rates
+
+    def rate(self, currency: str, date: str, base_currency: str = BASE_CURRENCY) -> Optional[float]:
+        """查询单个汇率（1单位 currency 折合 base_currency）"""
+        value = self.convert([1.0], [currency], date, base_currency)[0]
+        return None if np.isnan(value) else float(value)
+
+    def _ensure_index(self):
+        """汇率表有变化时重新加载内存索引"""
+        stamp = tuple(self.conn.execute(
+            "SELECT COUNT(*), MAX(created_at) FROM fx_rates"
+        ).fetchone())
+        if stamp == self._stamp:
+            return
+
+        df = pd.read_sql_query(
+            "SELECT currency, rate_date, rate_to_cny FROM fx_rates ORDER BY currency, rate_date",
+            self.conn
+        )
+        self._index = {
+            currency: (
+                pd.to_datetime(group['rate_date']).to_numpy().astype('datetime64[D]'),
+                group['rate_to_cny'].to_numpy(dtype=float)
+            )
+            for currency, group in df.groupby('currency', sort=False)
+        }
+        self._stamp = stamp
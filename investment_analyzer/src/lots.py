@@ -0,0 +1,286 @@
+import sqlite3
+import pandas as pd
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 支持的成本计算方式：先进先出 / 移动加权平均
+LOT_METHODS = ('FIFO', 'AVG')
+
+LOT_COLUMNS = ['transaction_id', 'open_date', 'quantity', 'unit_cost']
+REALIZED_COLUMNS = ['buy_transaction_id', 'sell_transaction_id', 'open_date', 'close_date',
+                    'quantity', 'cost', 'proceeds', 'pnl', 'holding_days']
+
+
+def match_fifo(lots: pd.DataFrame, trades: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """按先进先出匹配买卖批次（向量化实现）
+
+    把所有开仓批次和卖出分别按顺序排成两条累计数量轴，两条轴上所有分界点切出的每一段
+    就是一次“某批次 × 某笔卖出”的配对，用 searchsorted 一次定位所有配对，不需要逐笔循环。
+    每笔卖出只能匹配在卖出日或之前开仓的批次，超过当时持仓的部分直接丢弃（不与之后的买入配对）。
+
+    Args:
+        lots: 已有的未平仓批次，列为 LOT_COLUMNS，按开仓顺序排列
+        trades: 新增交易，按 (trade_date, id) 排序，
+                列为 id/trade_date/direction/quantity/price/commission
+
+    Returns:
+        (剩余未平仓批次, 本次产生的已实现盈亏明细)
+    """
+    buys = trades[trades['direction'] == 'BUY']
+    sells = trades[trades['direction'] == 'SELL']
+
+    new_lots = pd.DataFrame({
+        'transaction_id': buys['id'].to_numpy(),
+        'open_date': buys['trade_date'].to_numpy(),
+        'quantity': buys['quantity'].to_numpy(dtype=float),
+        'unit_cost': (buys['price'] * buys['quantity'] + buys['commission']).to_numpy(dtype=float)
+                     / buys['quantity'].to_numpy(dtype=float),
+    })
+    all_lots = pd.concat([lots[LOT_COLUMNS], new_lots], ignore_index=True)
+
+    lot_qty = all_lots['quantity'].to_numpy(dtype=float)
+    sell_qty = sells['quantity'].to_numpy(dtype=float)
+    lot_edges = np.cumsum(lot_qty)
+
+    # 每笔卖出时可用的累计持仓：已有批次 + 卖出日及之前的买入
+    buy_dates = pd.to_datetime(buys['trade_date']).to_numpy()
+    sell_dates = pd.to_datetime(sells['trade_date']).to_numpy()
+    existing_qty = float(lots['quantity'].sum()) if not lots.empty else 0.0
+    buy_edges = np.concatenate([[0.0], np.cumsum(buys['quantity'].to_numpy(dtype=float))])
+    available = existing_qty + buy_edges[np.searchsorted(buy_dates, sell_dates, side='right')]
+
+    # 实际匹配的累计卖出量 c[k] = min(c[k-1] + 卖出量[k], 可用持仓[k])，
+    # 展开后为 累计卖出量 + min(0, 前缀最小值(可用持仓 - 累计卖出量))
+    sold_edges = np.cumsum(sell_qty)
+    sell_edges = sold_edges + np.minimum(np.minimum.accumulate(available - sold_edges), 0.0)
+    matched = sell_edges[-1] if len(sell_edges) else 0.0
+
+    total_sold = sold_edges[-1] if len(sold_edges) else 0.0
+    if total_sold > matched:
+        logger.warning(f"卖出数量超过持仓 {total_sold - matched:g}，超出部分未参与盈亏计算")
+
+    # 两条累计轴的所有分界点，切出的每一段对应一次批次与卖出的配对
+    edges = np.unique(np.concatenate([[0.0], lot_edges, sell_edges]))
+    edges = edges[edges <= matched]
+    seg_start = edges[:-1]
+    seg_qty = np.diff(edges)
+
+    lot_idx = np.searchsorted(lot_edges, seg_start, side='right')
+    sell_idx = np.searchsorted(sell_edges, seg_start, side='right')
+
+    sell_unit = ((sells['price'] * sells['quantity'] - sells['commission']).to_numpy(dtype=float)
+                 / np.where(sell_qty > 0, sell_qty, 1.0))
+    open_dates = pd.to_datetime(all_lots['open_date'].to_numpy()[lot_idx])
+    close_dates = pd.to_datetime(sells['trade_date'].to_numpy()[sell_idx])
+    cost = seg_qty * all_lots['unit_cost'].to_numpy(dtype=float)[lot_idx]
+    proceeds = seg_qty * sell_unit[sell_idx]
+
+    realized = pd.DataFrame({
+        'buy_transaction_id': all_lots['transaction_id'].to_numpy()[lot_idx],
+        'sell_transaction_id': sells['id'].to_numpy()[sell_idx],
+        'open_date': open_dates.strftime('%Y-%m-%d'),
+        'close_date': close_dates.strftime('%Y-%m-%d'),
+        'quantity': seg_qty,
+        'cost': cost,
+        'proceeds': proceeds,
+        'pnl': proceeds - cost,
+        'holding_days': (close_dates - open_dates).days,
+    }, columns=REALIZED_COLUMNS)
+
+    # 每个批次剩余数量 = 批次累计终点超出已匹配总量的部分（不超过批次本身数量）
+    remaining = np.minimum(lot_qty, np.maximum(lot_edges - matched, 0.0))
+    open_lots = all_lots.assign(quantity=remaining)
+    open_lots = open_lots[open_lots['quantity'] > 0].reset_index(drop=True)
+
+    return open_lots, realized
+
+
+def match_average(lots: pd.DataFrame, trades: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """按移动加权平均成本计算已实现盈亏
+
+    平均成本依赖于交易发生的先后顺序，只能顺序累加；这里直接在 numpy 数组上循环，
+    每个标的最多只保留一个汇总批次。
+    """
+    quantity = float(lots['quantity'].sum()) if not lots.empty else 0.0
+    total_cost = float((lots['quantity'] * lots['unit_cost']).sum()) if not lots.empty else 0.0
+    open_date = lots['open_date'].iloc[0] if not lots.empty else None
+
+    ids = trades['id'].to_numpy()
+    dates = trades['trade_date'].to_numpy()
+    directions = trades['direction'].to_numpy()
+    quantities = trades['quantity'].to_numpy(dtype=float)
+    prices = trades['price'].to_numpy(dtype=float)
+    commissions = trades['commission'].to_numpy(dtype=float)
+
+    realized = []
+    for i in range(len(trades)):
+        q = quantities[i]
+        if directions[i] == 'BUY':
+            if quantity <= 0:
+                open_date = dates[i]
+            quantity += q
+            total_cost += q * prices[i] + commissions[i]
+            continue
+
+        matched = min(q, quantity)
+        if q > quantity:
+            logger.warning(f"卖出数量超过持仓 {q - quantity:g}，超出部分未参与盈亏计算")
+        if matched <= 0:
+            continue
+
+        cost = total_cost / quantity * matched
+        proceeds = matched * prices[i] - commissions[i] * matched / q
+        realized.append((None, ids[i], open_date, dates[i], matched, cost, proceeds,
+                         proceeds - cost, None))
+        quantity -= matched
+        total_cost -= cost
+
+    open_lots = pd.DataFrame(columns=LOT_COLUMNS)
+    if quantity > 0:
+        open_lots = pd.DataFrame([(None, open_date, quantity, total_cost / quantity)],
+                                 columns=LOT_COLUMNS)
+
+    return open_lots, pd.DataFrame(realized, columns=REALIZED_COLUMNS)
+
+
+LOT_MATCHERS = {
+    'FIFO': match_fifo,
+    'AVG': match_average,
+}
+
+
+class LotEngine:
+    """持仓批次引擎：基于 transactions 表维护未平仓批次和已实现盈亏
+
+    每个标的记录已处理到的最后一笔交易，新增交易只在已有未平仓批次的基础上增量匹配；
+    如果新交易的日期早于已处理的交易（补录历史交易），则该标的自动全量重算。
+    修改或删除已处理的交易后需要调用 update(rebuild=True)。
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def update(self, code: str = None, method: str = 'FIFO', rebuild: bool = False) -> Dict[str, int]:
+        """增量更新持仓批次
+
+        Args:
+            code: 标的代码，默认更新所有有交易记录的标的
+            method: 成本计算方式 FIFO/AVG
+            rebuild: 是否忽略已有状态全量重算
+
+        Returns:
+            Dict: 每个标的本次处理的交易笔数
+        """
+        check_method(method)
+        if code:
+            codes = [code]
+        else:
+            cur = self.conn.execute("SELECT DISTINCT target_code FROM transactions")
+            codes = [row['target_code'] for row in cur.fetchall()]
+
+        return {c: self._update_target(c, method, rebuild) for c in codes}
+
+    def _update_target(self, code: str, method: str, rebuild: bool) -> int:
+        """增量更新单个标的的持仓批次"""
+        state = None if rebuild else self.conn.execute(
+            "SELECT last_transaction_id, last_trade_date FROM lot_state WHERE target_code = ? AND method = ?",
+            (code, method)
+        ).fetchone()
+
+        last_id = state['last_transaction_id'] if state else 0
+        trades = self._load_trades(code, last_id)
+        if trades.empty and not rebuild:
+            return 0
+
+        # 补录了早于已处理日期的交易，增量结果不再正确，改为全量重算
+        if state and trades['trade_date'].min() < state['last_trade_date']:
+            logger.info(f"{code} 存在补录的历史交易，重新计算全部持仓批次")
+            state = None
+            trades = self._load_trades(code, 0)
+
+        lots = self._load_lots(code, method) if state else pd.DataFrame(columns=LOT_COLUMNS)
+        open_lots, realized = LOT_MATCHERS[method](lots, trades)
+
+        with self.conn:
+            self.conn.execute("DELETE FROM position_lots WHERE target_code = ? AND method = ?", (code, method))
+            if not state:
+                self.conn.execute("DELETE FROM realized_pnl WHERE target_code = ? AND method = ?", (code, method))
+                self.conn.execute("DELETE FROM lot_state WHERE target_code = ? AND method = ?", (code, method))
+
+            self.conn.executemany("""
+                INSERT INTO position_lots (target_code, method, transaction_id, open_date, quantity, unit_cost)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(code, method, *to_db_row(row)) for row in open_lots[LOT_COLUMNS].itertuples(index=False)])
+
+            self.conn.executemany("""
+                INSERT INTO realized_pnl
+                (target_code, method, buy_transaction_id, sell_transaction_id, open_date, close_date,
+                 quantity, cost, proceeds, pnl, holding_days)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(code, method, *to_db_row(row)) for row in realized[REALIZED_COLUMNS].itertuples(index=False)])
+
+            if not trades.empty:
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO lot_state
+                    (target_code, method, last_transaction_id, last_trade_date, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (code, method, int(trades['id'].max()), trades['trade_date'].max(), datetime.now()))
+
+        return len(trades)
+
+    def match_as_of(self, date: str, method: str = 'FIFO') -> Dict[str, Tuple[pd.DataFrame, pd.DataFrame]]:
+        """在内存中计算截至某日的持仓批次（不写入数据库），用于查询历史持仓
+
+        Returns:
+            Dict: 标的代码 -> (未平仓批次, 已实现盈亏明细)
+        """
+        check_method(method)
+        trades = pd.read_sql_query("""
+            SELECT id, target_code, trade_date, direction, quantity, price, commission
+            FROM transactions
+            WHERE trade_date <= ?
+            ORDER BY target_code, trade_date, id
+        """, self.conn, params=[date])
+
+        empty_lots = pd.DataFrame(columns=LOT_COLUMNS)
+        return {
+            code: LOT_MATCHERS[method](empty_lots, group)
+            for code, group in trades.groupby('target_code', sort=False)
+        }
+
+    def _load_trades(self, code: str, after_id: int) -> pd.DataFrame:
+        """读取标的在指定交易ID之后的交易，按成交顺序排列"""
+        return pd.read_sql_query("""
+            SELECT id, trade_date, direction, quantity, price, commission
+            FROM transactions
+            WHERE target_code = ? AND id > ?
+            ORDER BY trade_date, id
+        """, self.conn, params=[code, after_id])
+
+    def _load_lots(self, code: str, method: str) -> pd.DataFrame:
+        """读取标的当前的未平仓批次"""
+        return pd.read_sql_query("""
+            SELECT transaction_id, open_date, quantity, unit_cost
+            FROM position_lots
+            WHERE target_code = ? AND method = ?
+            ORDER BY id
+        """, self.conn, params=[code, method])
+
+
+def check_method(method: str):
+    """检查成本计算方式是否受支持"""
+    if method not in LOT_METHODS:
+        raise ValueError(f"不支持的成本计算方式: {method}")
+
+
+def to_db_row(row: tuple) -> tuple:
+    """将 numpy 标量转换为 sqlite 可写入的 Python 类型"""
+    return tuple(
+        None if v is None or (isinstance(v, float) and np.isnan(v))
+        else v.item() if isinstance(v, np.generic) else v
+        for v in row
+    )
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from src.database import InvestmentDB
+from src.fx import FxRateTable
+
+
+@pytest.fixture
+def fx(tmp_path):
+    with InvestmentDB(str(tmp_path / 'data' / 'investment.db')) as db:
+        fx = FxRateTable(db.conn)
+        fx.upsert_rates([
+            ('HKD', '2024-01-02', 0.90),
+            ('HKD', '2024-01-05', 0.92),
+            ('usd', '2024-01-02', 7.10),
+        ])
+        yield fx
+
+
+def test_rates_as_of_uses_latest_rate_on_or_before_date(fx):
+    rates = fx.rates_as_of(
+        ['HKD', 'HKD', 'HKD', 'HKD', 'CNY', 'USD'],
+        ['2024-01-01', '2024-01-02', '2024-01-04', '2024-02-01', '2024-01-01', '2024-01-03']
+    )
+    np.testing.assert_allclose(rates, [np.nan, 0.90, 0.90, 0.92, 1.0, 7.10])
+
+
+def test_rates_as_of_single_date(fx):
+    np.testing.assert_allclose(fx.rates_as_of(['HKD', 'USD', 'JPY'], '2024-01-05'), [0.92, 7.10, np.nan])
+
+
+def test_convert_to_other_base_currency(fx):
+    amounts = fx.convert([100.0, 710.0], ['HKD', 'CNY'], '2024-01-03', base_currency='USD')
+    np.testing.assert_allclose(amounts, [100 * 0.90 / 7.10, 100.0])
+
+
+def test_rate_missing_returns_none(fx):
+    assert fx.rate('HKD', '2024-01-01') is None
+    assert fx.rate('HKD', '2024-01-03') == pytest.approx(0.90)
+
+
+def test_index_reloads_after_write(fx):
+    assert fx.rate('JPY', '2024-01-03') is None
+    fx.upsert_rates([('JPY', '2024-01-02', 0.05)])
+    assert fx.rate('JPY', '2024-01-03') == pytest.approx(0.05)
+    # 不经过 upsert_rates 直接写表（如其他进程写入）后同样生效
+    with fx.conn:
+        fx.conn.execute("INSERT INTO fx_rates (currency, rate_date, rate_to_cny) VALUES ('HKD', '2024-01-03', 0.91)")
+    assert fx.rate('HKD', '2024-01-04') == pytest.approx(0.91)
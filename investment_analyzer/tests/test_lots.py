@@ -0,0 +1,201 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from src.database import InvestmentDB
+from src.lots import LOT_COLUMNS, LotEngine, match_average, match_fifo
+
+TRADE_COLUMNS = ['id', 'trade_date', 'direction', 'quantity', 'price', 'commission']
+
+
+def make_trades(*rows) -> pd.DataFrame:
+    """按 (id, 日期, 方向, 数量, 价格[, 手续费]) 构造交易"""
+    return pd.DataFrame([row if len(row) == 6 else (*row, 0.0) for row in rows], columns=TRADE_COLUMNS)
+
+
+EMPTY_LOTS = pd.DataFrame(columns=LOT_COLUMNS)
+
+
+class TestMatchFifo:
+    def test_partial_sell_spans_lots(self):
+        trades = make_trades(
+            (1, '2024-01-02', 'BUY', 100, 10.0),
+            (2, '2024-01-03', 'BUY', 100, 12.0),
+            (3, '2024-01-04', 'SELL', 150, 15.0),
+        )
+        lots, realized = match_fifo(EMPTY_LOTS, trades)
+
+        assert realized['buy_transaction_id'].tolist() == [1, 2]
+        assert realized['quantity'].tolist() == [100, 50]
+        assert realized['cost'].tolist() == pytest.approx([1000, 600])
+        assert realized['proceeds'].tolist() == pytest.approx([1500, 750])
+        assert realized['holding_days'].tolist() == [2, 1]
+        assert lots['transaction_id'].tolist() == [2]
+        assert lots['quantity'].tolist() == [50]
+
+    def test_commission_in_cost_and_proceeds(self):
+        trades = make_trades(
+            (1, '2024-01-02', 'BUY', 100, 10.0, 5.0),
+            (2, '2024-01-03', 'SELL', 100, 11.0, 5.0),
+        )
+        lots, realized = match_fifo(EMPTY_LOTS, trades)
+
+        assert lots.empty
+        assert realized['cost'].iloc[0] == pytest.approx(1005)
+        assert realized['proceeds'].iloc[0] == pytest.approx(1095)
+        assert realized['pnl'].iloc[0] == pytest.approx(90)
+
+    def test_same_day_buy_is_available(self):
+        trades = make_trades(
+            (1, '2024-01-02', 'BUY', 100, 10.0),
+            (2, '2024-01-02', 'SELL', 100, 11.0),
+        )
+        lots, realized = match_fifo(EMPTY_LOTS, trades)
+
+        assert lots.empty
+        assert realized['quantity'].tolist() == [100]
+        assert realized['holding_days'].tolist() == [0]
+
+    def test_oversell_does_not_match_later_buys(self):
+        trades = make_trades(
+            (1, '2024-01-02', 'BUY', 100, 10.0),
+            (2, '2024-01-03', 'SELL', 150, 11.0),
+            (3, '2024-01-04', 'BUY', 100, 12.0),
+            (4, '2024-01-05', 'SELL', 30, 13.0),
+        )
+        lots, realized = match_fifo(EMPTY_LOTS, trades)
+
+        assert realized['sell_transaction_id'].tolist() == [2, 4]
+        assert realized['buy_transaction_id'].tolist() == [1, 3]
+        assert realized['quantity'].tolist() == [100, 30]
+        assert (realized['holding_days'] >= 0).all()
+        assert lots['transaction_id'].tolist() == [3]
+        assert lots['quantity'].tolist() == [70]
+
+    def test_incremental_matches_full(self):
+        trades = make_trades(
+            (1, '2024-01-02', 'BUY', 100, 10.0),
+            (2, '2024-01-03', 'BUY', 50, 11.0),
+            (3, '2024-01-04', 'SELL', 120, 12.0),
+            (4, '2024-01-05', 'BUY', 80, 9.0),
+            (5, '2024-01-08', 'SELL', 60, 13.0),
+        )
+        full_lots, full_realized = match_fifo(EMPTY_LOTS, trades)
+
+        lots, first = match_fifo(EMPTY_LOTS, trades.iloc[:3])
+        lots, second = match_fifo(lots, trades.iloc[3:])
+
+        realized = pd.concat([first, second], ignore_index=True)
+        pd.testing.assert_frame_equal(realized, full_realized, check_dtype=False)
+        pd.testing.assert_frame_equal(lots, full_lots, check_dtype=False)
+
+
+class TestMatchAverage:
+    def test_average_cost(self):
+        trades = make_trades(
+            (1, '2024-01-02', 'BUY', 100, 10.0),
+            (2, '2024-01-03', 'BUY', 100, 20.0),
+            (3, '2024-01-04', 'SELL', 100, 30.0),
+        )
+        lots, realized = match_average(EMPTY_LOTS, trades)
+
+        assert realized['cost'].tolist() == pytest.approx([1500])
+        assert realized['proceeds'].tolist() == pytest.approx([3000])
+        assert lots['quantity'].tolist() == [100]
+        assert lots['unit_cost'].tolist() == pytest.approx([15])
+        assert lots['open_date'].tolist() == ['2024-01-02']
+
+    def test_oversell_and_reopen(self):
+        trades = make_trades(
+            (1, '2024-01-02', 'BUY', 100, 10.0),
+            (2, '2024-01-03', 'SELL', 150, 12.0, 3.0),
+            (3, '2024-01-04', 'BUY', 10, 20.0),
+        )
+        lots, realized = match_average(EMPTY_LOTS, trades)
+
+        # 手续费按匹配数量分摊
+        assert realized['quantity'].tolist() == [100]
+        assert realized['proceeds'].tolist() == pytest.approx([1198])
+        assert lots['open_date'].tolist() == ['2024-01-04']
+        assert lots['unit_cost'].tolist() == pytest.approx([20])
+
+
+@pytest.fixture
+def db(tmp_path):
+    with InvestmentDB(str(tmp_path / 'data' / 'investment.db')) as db:
+        yield db
+
+
+def add_trade(conn: sqlite3.Connection, trade_date: str, direction: str, quantity: int, price: float,
+              code: str = 'HK.00700'):
+    with conn:
+        conn.execute("""
+            INSERT INTO transactions (target_code, trade_date, direction, quantity, price, commission, currency)
+            VALUES (?, ?, ?, ?, ?, 0, 'HKD')
+        """, (code, trade_date, direction, quantity, price))
+
+
+def stored(conn: sqlite3.Connection, method: str = 'FIFO'):
+    lots = conn.execute(
+        "SELECT transaction_id, open_date, quantity, unit_cost FROM position_lots WHERE method = ? ORDER BY id",
+        (method,)
+    ).fetchall()
+    realized = conn.execute(
+        "SELECT buy_transaction_id, sell_transaction_id, quantity, pnl FROM realized_pnl "
+        "WHERE method = ? ORDER BY sell_transaction_id, buy_transaction_id", (method,)
+    ).fetchall()
+    return [tuple(row) for row in lots], [tuple(row) for row in realized]
+
+
+class TestLotEngine:
+    @pytest.mark.parametrize('method', ['FIFO', 'AVG'])
+    def test_incremental_update(self, db, method):
+        engine = LotEngine(db.conn)
+        add_trade(db.conn, '2024-01-02', 'BUY', 100, 10.0)
+        add_trade(db.conn, '2024-01-03', 'SELL', 40, 12.0)
+        assert engine.update(method=method) == {'HK.00700': 2}
+        assert engine.update(method=method) == {'HK.00700': 0}
+
+        add_trade(db.conn, '2024-01-04', 'SELL', 20, 13.0)
+        assert engine.update(method=method) == {'HK.00700': 1}
+
+        incremental = stored(db.conn, method)
+        engine.update(method=method, rebuild=True)
+        assert stored(db.conn, method) == incremental
+        assert [lot[2] for lot in incremental[0]] == [40]
+
+    def test_backdated_trade_rebuilds(self, db):
+        engine = LotEngine(db.conn)
+        add_trade(db.conn, '2024-01-03', 'BUY', 100, 12.0)
+        add_trade(db.conn, '2024-01-05', 'SELL', 100, 15.0)
+        engine.update()
+
+        # 补录一笔更早的买入：卖出应改为匹配这笔买入，全部已实现盈亏重新计算
+        add_trade(db.conn, '2024-01-02', 'BUY', 100, 10.0)
+        assert engine.update() == {'HK.00700': 3}
+
+        lots, realized = stored(db.conn)
+        assert realized == [(3, 2, 100, 500)]
+        assert lots == [(1, '2024-01-03', 100, 12.0)]
+
+    def test_match_as_of(self, db):
+        engine = LotEngine(db.conn)
+        add_trade(db.conn, '2024-01-02', 'BUY', 100, 10.0)
+        add_trade(db.conn, '2024-01-05', 'SELL', 100, 15.0)
+        add_trade(db.conn, '2024-01-03', 'BUY', 50, 20.0, code='US.AAPL')
+
+        lots, realized = engine.match_as_of('2024-01-04')['HK.00700']
+        assert realized.empty
+        assert lots['quantity'].tolist() == [100]
+
+        matched = engine.match_as_of('2024-01-05')
+        assert matched['HK.00700'][0].empty
+        assert matched['HK.00700'][1]['pnl'].tolist() == pytest.approx([500])
+        assert matched['US.AAPL'][0]['quantity'].tolist() == [50]
+        # 只在内存中计算，不写入数据库
+        assert stored(db.conn) == ([], [])
+
+    def test_unknown_method(self, db):
+        with pytest.raises(ValueError):
+            LotEngine(db.conn).update(method='LIFO')
@@ -294,18 +294,24 @@ def show_portfolio_analysis():
         st.subheader("持仓汇总")
 
         df = pd.DataFrame(positions)
-        df['profit_loss'] = (df['latest_price'] * df['quantity']) - (df['avg_cost'] * df['quantity'])
-        df['profit_loss_pct'] = (df['profit_loss'] / (df['avg_cost'] * df['quantity'])) * 100
-
-        # 应用颜色样式
+        # 缺少汇率时 *_base 为 None，转为 NaN 后加总时跳过
+        base_columns = ['market_value_base', 'total_cost_base', 'unrealized_pnl_base', 'realized_pnl_base']
+        df[base_columns] = df[base_columns].astype(float)
+        df['profit_loss'] = df['unrealized_pnl']
+        # 已平仓的标的成本为0，不计算盈亏比例
+        df['profit_loss_pct'] = df['profit_loss'] / df['total_cost'].where(df['total_cost'] > 0) * 100
+
+        # 应用颜色样式（空值不着色）
         def style_profit(val):
+            if val is None or pd.isna(val):
+                return ''
             color = 'lightcoral' if val < 0 else 'lightgreen'
             return f'background-color: {color}'
 
-        styled_df = df.style.applymap(style_profit, subset=['profit_loss', 'profit_loss_pct'])
+        styled_df = df.style.applymap(style_profit, subset=['profit_loss', 'profit_loss_pct', 'realized_pnl'])
 
-        st.dataframe(styled_df[['name', 'code', 'quantity', 'avg_cost', 'latest_price',
-                                'market_value', 'profit_loss','profit_loss_pct']],
+        st.dataframe(styled_df[['name', 'target_code', 'currency', 'quantity', 'avg_cost', 'latest_price',
+                                'market_value', 'profit_loss', 'profit_loss_pct', 'realized_pnl']],
                     use_container_width=True)
 
         # 持仓结构饼图
@@ -313,7 +319,7 @@ def show_portfolio_analysis():
 
         fig = go.Figure(data=[go.Pie(
             labels=df['name'],
-            values=df['market_value'],
+            values=df['market_value_base'],
             textinfo='label+percent',
             textposition='auto'
         )])
@@ -321,19 +327,39 @@ def show_portfolio_analysis():
         st.plotly_chart(fig, use_container_width=True)
 
         # 盈亏分布
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
 
+        # 各标的以交易货币计价，汇总时使用换算为人民币后的金额
         with col1:
-            total_value = df['market_value'].sum()
+            total_value = df['market_value_base'].sum()
             st.metric("总市值", f"{total_value:,.2f} CNY")
 
         with col2:
-            total_profit = df['profit_loss'].sum()
-            st.metric("总盈亏", f"{total_profit:,.2f} CNY")
+            total_profit = df['unrealized_pnl_base'].sum()
+            st.metric("浮动盈亏", f"{total_profit:,.2f} CNY")
 
         with col3:
-            profit_rate = (total_profit / (total_value - total_profit)) * 100
-            st.metric("总收益率", f"{profit_rate:.2f}%")
+            total_cost_base = df['total_cost_base'].sum()
+            if total_cost_base:
+                st.metric("浮动收益率", f"{total_profit / total_cost_base * 100:.2f}%")
+            else:
+                st.metric("浮动收益率", "-")
+
+        with col4:
+            total_realized = df['realized_pnl_base'].sum()
+            st.metric("已实现盈亏", f"{total_realized:,.2f} CNY")
+
+        missing_fx = df.loc[df['fx_rate'].isna() | df['realized_pnl_base'].isna(), 'target_code']
+        if not missing_fx.empty:
+            st.warning(f"缺少汇率数据，以下标的未计入汇总: {', '.join(missing_fx)}")
+
+        # 已实现盈亏明细
+        realized = st.session_state.manager.get_realized_pnl()
+        if realized:
+            with st.expander("已实现盈亏明细（先进先出）"):
+                st.dataframe(pd.DataFrame(realized)[['close_date', 'target_code', 'name', 'quantity',
+                                                     'open_date', 'holding_days', 'cost', 'proceeds', 'pnl']],
+                             use_container_width=True)
 
     else:
         st.info("暂无持仓")
@@ -0,0 +1,50 @@
+"""notification history indexes
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# 索引名 -> 列（与 models.Notification.__table_args__ 保持一致）
+INDEXES = {
+    "ix_notifications_created_id": ["created_at", "id"],
+    "ix_notifications_source_created_id": ["source_name", "created_at", "id"],
+    "ix_notifications_channel_created_id": ["channel_type", "created_at", "id"],
+    "ix_notifications_status_created_id": ["status", "created_at", "id"],
+}
+
+
+def _existing_indexes():
+    inspector = sa.inspect(op.get_bind())
+    return {index["name"] for index in inspector.get_indexes("notifications")}
+
+
+def upgrade():
+    # 通过 init_db.py（create_all）建的表已经带有这些索引
+    existing = _existing_indexes()
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, "notifications", columns)
+
+
+def downgrade():
+    existing = _existing_indexes()
+    # MySQL 会用 source_name 开头的组合索引支撑外键，删除前先补一个单列索引
+    if "ix_notifications_source_created_id" in existing and not any(
+        index["column_names"][:1] == ["source_name"] and index["name"] != "ix_notifications_source_created_id"
+        for index in sa.inspect(op.get_bind()).get_indexes("notifications")
+    ):
+        op.create_index("ix_notifications_source_name", "notifications", ["source_name"])
+    for name in INDEXES:
+        if name in existing:
+            op.drop_index(name, table_name="notifications")
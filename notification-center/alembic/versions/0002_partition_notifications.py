@@ -0,0 +1,76 @@
+"""partition notifications by month
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 14:00:00
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# 预建的未来月份数（之后由 src/retention.py 的后台任务继续预建）
+PREMAKE_MONTHS = 3
+
+
+def _month(value: date, offset: int = 0) -> date:
+    month = value.year * 12 + value.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _is_partitioned(bind) -> bool:
+    return bind.execute(sa.text(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'notifications' AND PARTITION_NAME IS NOT NULL"
+    )).scalar() > 0
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "mysql" or _is_partitioned(bind):
+        return
+    inspector = sa.inspect(bind)
+
+    # 分区表不支持外键
+    for fk in inspector.get_foreign_keys("notifications"):
+        op.drop_constraint(fk["name"], "notifications", type_="foreignkey")
+
+    # 分区列必须包含在主键中，且不能为空
+    op.execute("UPDATE notifications SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    op.alter_column("notifications", "created_at", existing_type=sa.TIMESTAMP(), nullable=False,
+                    server_default=sa.text("CURRENT_TIMESTAMP"))
+    if inspector.get_pk_constraint("notifications")["constrained_columns"] != ["id", "created_at"]:
+        op.execute("ALTER TABLE notifications DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)")
+
+    # 从最早一条记录所在月份开始按月分区，另预建几个月和一个兜底分区
+    oldest = bind.execute(sa.text("SELECT MIN(created_at) FROM notifications")).scalar()
+    first = _month(oldest.date() if oldest else date.today())
+    last = _month(date.today(), PREMAKE_MONTHS)
+    partitions = []
+    month = first
+    while month <= last:
+        partitions.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN "
+                          f"(UNIX_TIMESTAMP('{_month(month, 1):%Y-%m-%d} 00:00:00'))")
+        month = _month(month, 1)
+    partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+    op.execute(f"ALTER TABLE notifications PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) "
+               f"({', '.join(partitions)})")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "mysql" or not _is_partitioned(bind):
+        return
+
+    op.execute("ALTER TABLE notifications REMOVE PARTITIONING")
+    op.execute("ALTER TABLE notifications DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+    op.create_foreign_key(None, "notifications", "notification_sources", ["source_name"], ["source_name"])
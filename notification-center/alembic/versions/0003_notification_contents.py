@@ -0,0 +1,74 @@
+"""deduplicated notification contents
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# 回填时每批处理的通知记录 id 范围
+BACKFILL_BATCH = 10000
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if "notification_contents" not in inspector.get_table_names():
+        op.create_table(
+            "notification_contents",
+            sa.Column("id", sa.BIGINT(), primary_key=True, autoincrement=True),
+            sa.Column("content_hash", sa.String(64), nullable=False),
+            sa.Column("content", sa.Text(), nullable=False),
+            sa.Column("content_length", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP")),
+            sa.Column("last_used_at", sa.TIMESTAMP(), server_default=sa.text("CURRENT_TIMESTAMP")),
+            sa.UniqueConstraint("content_hash"),
+        )
+        op.create_index("ix_notification_contents_last_used_at", "notification_contents", ["last_used_at"])
+
+    columns = {column["name"] for column in inspector.get_columns("notifications")}
+    if "content_id" not in columns:
+        op.add_column("notifications", sa.Column("content_id", sa.BIGINT()))
+        op.create_index("ix_notifications_content_id", "notifications", ["content_id"])
+    op.alter_column("notifications", "content", existing_type=sa.Text(), nullable=True)
+
+    # 把已有记录的正文搬到 notification_contents（相同正文只插入一次），分批执行避免长事务
+    min_id, max_id = bind.execute(sa.text(
+        "SELECT MIN(id), MAX(id) FROM notifications WHERE content_id IS NULL AND content IS NOT NULL"
+    )).one()
+    if min_id is None:
+        return
+    for start in range(min_id, max_id + 1, BACKFILL_BATCH):
+        params = {"start": start, "end": start + BACKFILL_BATCH}
+        bind.execute(sa.text(
+            "INSERT IGNORE INTO notification_contents (content_hash, content, content_length) "
+            "SELECT SHA2(content, 256), content, CHAR_LENGTH(content) FROM notifications "
+            "WHERE id >= :start AND id < :end AND content_id IS NULL AND content IS NOT NULL"
+        ), params)
+        bind.execute(sa.text(
+            "UPDATE notifications n JOIN notification_contents c ON c.content_hash = SHA2(n.content, 256) "
+            "SET n.content_id = c.id, n.content = NULL "
+            "WHERE n.id >= :start AND n.id < :end AND n.content_id IS NULL AND n.content IS NOT NULL"
+        ), params)
+
+
+def downgrade():
+    op.execute(
+        "UPDATE notifications n JOIN notification_contents c ON c.id = n.content_id "
+        "SET n.content = c.content WHERE n.content IS NULL"
+    )
+    op.execute("UPDATE notifications SET content = '' WHERE content IS NULL")
+    op.alter_column("notifications", "content", existing_type=sa.Text(), nullable=False)
+    op.drop_index("ix_notifications_content_id", table_name="notifications")
+    op.drop_column("notifications", "content_id")
+    op.drop_table("notification_contents")
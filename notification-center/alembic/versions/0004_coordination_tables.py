@@ -0,0 +1,55 @@
+"""cross-process coordination tables
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "coordination_leases" not in tables:
+        op.create_table(
+            "coordination_leases",
+            sa.Column("name", sa.String(50), primary_key=True),
+            sa.Column("owner", sa.String(100)),
+            sa.Column("expires_at", sa.TIMESTAMP(), nullable=True),
+        )
+
+    if "rate_budget_slots" not in tables:
+        op.create_table(
+            "rate_budget_slots",
+            sa.Column("budget", sa.String(100), primary_key=True),
+            sa.Column("slot", sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column("window_start", sa.BIGINT(), nullable=False, server_default="0"),
+            sa.Column("remaining", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+    if "idempotency_keys" not in tables:
+        op.create_table(
+            "idempotency_keys",
+            sa.Column("scope", sa.String(50), primary_key=True),
+            sa.Column("idempotency_key", sa.String(200), primary_key=True),
+            sa.Column("fingerprint", sa.String(64), nullable=False),
+            sa.Column("owner", sa.String(100)),
+            sa.Column("response", sa.JSON()),
+            sa.Column("expires_at", sa.TIMESTAMP(), nullable=False),
+        )
+        op.create_index("ix_idempotency_keys_expires_at", "idempotency_keys", ["expires_at"])
+
+
+def downgrade():
+    op.drop_table("idempotency_keys")
+    op.drop_table("rate_budget_slots")
+    op.drop_table("coordination_leases")
@@ -0,0 +1,58 @@
+"""hourly notification stats rollup
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 22:00:00
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def _month_start(value: date, offset: int = 0) -> date:
+    month = value.year * 12 + value.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    if "notification_stats_hourly" not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            "notification_stats_hourly",
+            sa.Column("bucket", sa.TIMESTAMP(), primary_key=True),
+            sa.Column("source_name", sa.String(50), primary_key=True),
+            sa.Column("channel_type", sa.String(20), primary_key=True),
+            sa.Column("channel_name", sa.String(50), primary_key=True),
+            sa.Column("success_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("failed_count", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+    # 用已有记录回填汇总行，每次汇总一个月（一个分区），避免长事务；重复执行时覆盖为重新汇总的值
+    first, last = bind.execute(sa.text("SELECT MIN(created_at), MAX(created_at) FROM notifications")).one()
+    if first is None:
+        return
+    month = _month_start(first.date())
+    while month <= last.date():
+        bind.execute(sa.text(
+            "INSERT INTO notification_stats_hourly "
+            "(bucket, source_name, channel_type, channel_name, success_count, failed_count) "
+            "SELECT DATE(created_at) + INTERVAL HOUR(created_at) HOUR, source_name, channel_type, channel_name, "
+            "SUM(status = 'SUCCESS'), SUM(status = 'FAILED') FROM notifications "
+            "WHERE created_at >= :start AND created_at < :end GROUP BY 1, 2, 3, 4 "
+            "ON DUPLICATE KEY UPDATE success_count = VALUES(success_count), failed_count = VALUES(failed_count)"
+        ), {"start": month, "end": _month_start(month, 1)})
+        month = _month_start(month, 1)
+
+
+def downgrade():
+    op.drop_table("notification_stats_hourly")
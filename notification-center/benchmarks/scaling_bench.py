@@ -0,0 +1,142 @@
+"""
+多进程扩展性测试
+
+依次用 1、2、4 … 个 gunicorn worker 启动服务，用多个压测进程请求 /templates/{name}/render
+（模板渲染只占CPU，不访问数据库和SMTP），输出每秒请求数、相对单进程的加速比和并行效率：
+    python -m benchmarks.scaling_bench --workers 1,2,4,8 --duration 20
+
+压测进程和服务在同一台机器上时会争用CPU，测到的扩展性偏低；
+可以在另一台机器上运行压测（--url 指定已启动的服务，只测当前进程数）：
+    python -m benchmarks.scaling_bench --url http://10.0.0.5:8000 --clients 8
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+import subprocess
+import multiprocessing
+
+import httpx
+
+
+PAYLOAD = {
+    "data": {"level": "error", "message": "磁盘使用率超过90%", "timestamp": "2026-10-19 12:00:00"},
+    "variants": ["text", "html", "wechat"],
+}
+
+
+async def _client(url: str, duration: float, concurrency: int) -> int:
+    done = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        async def loop():
+            nonlocal done
+            while time.perf_counter() < deadline:
+                response = await client.post("/templates/alert/render", json=PAYLOAD)
+                response.raise_for_status()
+                done += 1
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return done
+
+
+def _client_process(url: str, duration: float, concurrency: int, results):
+    results.put(asyncio.run(_client(url, duration, concurrency)))
+
+
+def run_load(url: str, clients: int, concurrency: int, duration: float) -> float:
+    """clients 个压测进程、每个 concurrency 个并发连接，返回每秒请求数"""
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_client_process, args=(url, duration, concurrency, results))
+        for _ in range(clients)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    total = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return total / (time.perf_counter() - started)
+
+
+def wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服务未在 {timeout} 秒内启动: {url}")
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        API_HOST="127.0.0.1",
+        API_PORT=str(port),
+        API_WORKERS=str(workers),
+        # 只测请求处理，不启动依赖数据库的后台任务
+        RETENTION_ENABLED="false",
+        RETRY_ENABLED="false",
+        TEMPLATE_AUTO_RELOAD="false",
+        ACCESS_LOG="",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "src.main:app"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程扩展性测试")
+    parser.add_argument("--workers", default=None, help="依次测试的进程数，逗号分隔（默认 1,2,4…CPU核数）")
+    parser.add_argument("--url", default=None, help="压测已启动的服务（不启动 gunicorn）")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--clients", type=int, default=None, help="压测进程数（默认为CPU核数）")
+    parser.add_argument("--concurrency", type=int, default=16, help="每个压测进程的并发连接数")
+    parser.add_argument("--duration", type=float, default=20, help="每轮压测秒数")
+    args = parser.parse_args()
+
+    cpus = multiprocessing.cpu_count()
+    clients = args.clients or cpus
+
+    if args.url:
+        wait_ready(args.url)
+        run_load(args.url, clients, args.concurrency, 2)  # 预热
+        rps = run_load(args.url, clients, args.concurrency, args.duration)
+        print(f"{args.url}: {rps:.0f} 请求/秒")
+        return
+
+    if args.workers:
+        counts = [int(n) for n in args.workers.split(",")]
+    else:
+        counts = [n for n in (1, 2, 4, 8, 16, 32, 64) if n < cpus] + [cpus]
+
+    url = f"http://127.0.0.1:{args.port}"
+    print(f"CPU核数 {cpus}，压测进程 {clients} × 并发 {args.concurrency}，每轮 {args.duration:.0f} 秒")
+    print(f"{'进程数':>6} {'请求/秒':>10} {'加速比':>8} {'并行效率':>8}")
+    baseline = None
+    for workers in counts:
+        server = start_server(workers, args.port)
+        try:
+            wait_ready(url)
+            run_load(url, clients, args.concurrency, 2)  # 预热（各进程首次编译模板）
+            rps = run_load(url, clients, args.concurrency, args.duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+        baseline = baseline or rps / workers
+        speedup = rps / baseline
+        print(f"{workers:>6} {rps:>10.0f} {speedup:>8.2f} {speedup / workers:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
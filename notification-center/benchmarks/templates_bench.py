@@ -0,0 +1,79 @@
+"""
+模板渲染性能测试
+
+对比旧实现（每次调用重建模板字典 + str.format）与 Jinja2 模板引擎在不同缓存配置下的单次渲染耗时：
+    python -m benchmarks.templates_bench --iterations 20000
+"""
+import argparse
+import time
+from datetime import datetime
+
+from src.templates import TemplateRenderer
+
+
+DATA = {
+    "task_name": "数据分析任务",
+    "execution_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    "result": "处理了1000条记录",
+}
+
+
+def legacy_render(template_name, data):
+    """旧实现：每次调用都重建模板字典并用 str.format 渲染"""
+    templates = {
+        "task_success": """
+任务执行成功！
+
+任务详情：
+- 任务名称: {task_name}
+- 执行时间: {execution_time}
+- 结果: {result}
+
+系统自动通知
+            """,
+        "alert": """
+⚠️ 告警通知
+
+告警详情：
+- 告警级别: {level}
+- 告警内容: {message}
+- 时间: {timestamp}
+
+请及时处理！
+            """
+    }
+    template = templates.get(template_name, templates["task_success"])
+    return {"text": template.format(**data)}
+
+
+def bench(name, render, iterations):
+    render()  # 预热（首次编译）
+    started = time.perf_counter()
+    for _ in range(iterations):
+        render()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<36} {elapsed:>8.3f}s {elapsed / iterations * 1e6:>10.1f} µs/次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模板渲染性能测试")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--template", default="task_success")
+    parser.add_argument("--variants", default="text,html", help="渲染的变体，逗号分隔")
+    args = parser.parse_args()
+
+    renderers = {
+        "Jinja2 无缓存（每次重新编译）": TemplateRenderer(cache_size=0),
+        "Jinja2 LRU缓存 + 修改时间检查": TemplateRenderer(auto_reload=True),
+        "Jinja2 LRU缓存（不检查修改时间）": TemplateRenderer(auto_reload=False),
+    }
+
+    variants = args.variants.split(",")
+    print(f"模板: {args.template}，渲染 {' + '.join(variants)}，{args.iterations} 次")
+    bench("旧实现 dict + str.format（仅text）", lambda: legacy_render(args.template, DATA), args.iterations)
+    for name, renderer in renderers.items():
+        bench(name, lambda: renderer.render(args.template, DATA, variants), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+gunicorn 配置（多进程部署）
+
+    gunicorn -c gunicorn.conf.py src.main:app
+
+每个 worker 是一个独立的 uvicorn 事件循环，进程内的状态（连接池、缓存）各自独立，
+需要跨进程一致的状态（后台任务租约、发送频率预算、失败重试的领取、幂等键）都保存在 MySQL 中，见 src/coordination.py。
+"""
+import os
+import multiprocessing
+
+bind = f"{os.getenv('API_HOST', '0.0.0.0')}:{os.getenv('API_PORT', '8000')}"
+workers = int(os.getenv("API_WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# 发送邮件的请求可能等待SMTP超时和发送频率预算
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# ACCESS_LOG 为空时不记录访问日志
+accesslog = os.getenv("ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
@@ -20,6 +20,17 @@ async def init_db():
     print("数据库表创建成功！")
 
 
+def upgrade_db():
+    """执行 Alembic 迁移（索引、按月分区等，已执行过的迁移会跳过）"""
+    import subprocess
+    result = subprocess.run(["alembic", "upgrade", "head"], capture_output=True, text=True)
+    if result.returncode == 0:
+        print("数据库迁移完成！")
+    else:
+        print("数据库迁移失败！")
+        print(result.stderr)
+
+
 async def create_migration():
     """创建 Alembic 迁移"""
     import subprocess
@@ -48,5 +59,6 @@ if __name__ == "__main__":
 
     # 初始化数据库
     asyncio.run(init_db())
+    upgrade_db()
 
     print("初始化完成！")
\ No newline at end of file
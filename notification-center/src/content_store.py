@@ -0,0 +1,120 @@
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy import func, select, delete, exists, text
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .metrics import registry
+from .models import Notification, NotificationContent
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = 1000
+
+
+def content_hash(content: str) -> str:
+    """正文的 SHA-256（与 MySQL 的 SHA2(content, 256) 在 utf8mb4 连接下一致）"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ContentStore:
+    """按内容寻址的通知正文存储
+
+    同一份正文只在 notification_contents 中保存一次，通知记录通过 content_id 引用。
+    写入用 INSERT ... ON DUPLICATE KEY UPDATE，一条语句完成“查找或插入”并拿到 id，并发写入同一正文也是安全的。
+    进程内按哈希缓存最近用到的 id（LRU），缓存命中时不访问数据库；
+    条目超过 ttl 后重新执行一次写入确认，同时刷新 last_used_at，保证清理任务不会删掉缓存中的正文。
+    """
+
+    def __init__(self, cache_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.cache_size = cache_size or settings.content_cache_size
+        self.ttl = ttl or settings.content_cache_ttl
+        self._cache: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_create(self, db: AsyncSession, content: str) -> int:
+        """返回正文的 id，不存在时插入（在调用方的事务中执行）"""
+        digest = content_hash(content)
+        now = time.monotonic()
+
+        cached = self._cache.get(digest)
+        if cached is not None and now - cached[1] < self.ttl:
+            self._cache.move_to_end(digest)
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+
+        stmt = insert(NotificationContent).values(
+            content_hash=digest,
+            content=content,
+            content_length=len(content),
+            created_at=func.now(),
+            last_used_at=func.now()
+        )
+        stmt = stmt.on_duplicate_key_update(
+            id=func.last_insert_id(NotificationContent.id),
+            last_used_at=func.now()
+        )
+        result = await db.execute(stmt)
+        content_id = result.lastrowid
+
+        self._cache[digest] = (content_id, now)
+        self._cache.move_to_end(digest)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return content_id
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+def purge_orphan_contents(conn: Connection, grace: Optional[float] = None) -> int:
+    """
+    删除没有任何通知记录引用、且超过宽限期未被使用的正文（同步连接，由分区维护任务在删除分区后调用）
+
+    Returns:
+        删除的条数
+    """
+    grace = settings.content_orphan_grace if grace is None else grace
+    # 用数据库时间计算，与 last_used_at 的写入方一致
+    cutoff = func.date_sub(func.now(), text(f"INTERVAL {int(grace)} SECOND"))
+    orphan = ~exists().where(Notification.content_id == NotificationContent.id)
+
+    deleted = 0
+    while True:
+        ids = conn.execute(
+            select(NotificationContent.id)
+            .where(NotificationContent.last_used_at < cutoff, orphan)
+            .limit(PURGE_BATCH_SIZE)
+        ).scalars().all()
+        if not ids:
+            break
+        # 删除时再检查一次引用，期间新写入的通知不会丢正文
+        result = conn.execute(delete(NotificationContent).where(NotificationContent.id.in_(ids), orphan))
+        conn.commit()
+        deleted += result.rowcount
+        if len(ids) < PURGE_BATCH_SIZE:
+            break
+
+    if deleted:
+        logger.info(f"已清理无引用的通知正文 {deleted} 条")
+    return deleted
+
+
+# 全局正文存储
+content_store = ContentStore()
+
+registry.gauge(
+    "notification_content_cache", "通知正文id缓存（条目数、命中和未命中次数）", ("stat",),
+    callback=lambda: {(name,): value for name, value in content_store.stats().items()}
+)
@@ -0,0 +1,222 @@
+import os
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, func, or_, text
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .database import engine
+from .models import (
+    CoordinationLease,
+    RateBudgetSlot,
+    Notification,
+    NotificationContent,
+    NotificationStatus
+)
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id() -> str:
+    """当前进程的标识（主机名:pid），gunicorn 预加载应用后 fork 的子进程 pid 不同，因此每次调用时计算"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def expires_in(seconds: float):
+    """seconds 秒后的数据库时间：用数据库时间计算过期时间，多台机器的时钟不一致时也不会误判"""
+    return func.date_add(func.now(), text(f"INTERVAL {int(seconds)} SECOND"))
+
+
+async def acquire_lease(name: str, ttl: float) -> bool:
+    """
+    获取或续期后台任务租约
+
+    租约行被其他进程锁定（正在获取或续期）时用 SKIP LOCKED 直接跳过，不等待行锁。
+
+    Returns:
+        当前进程持有租约时返回 True，其他进程持有未过期的租约时返回 False
+    """
+    me = worker_id()
+    async with engine.begin() as conn:
+        await conn.execute(insert(CoordinationLease).prefix_with("IGNORE").values(name=name))
+        row = (await conn.execute(
+            select(
+                CoordinationLease.owner,
+                or_(CoordinationLease.expires_at.is_(None), CoordinationLease.expires_at < func.now())
+            ).where(CoordinationLease.name == name).with_for_update(skip_locked=True)
+        )).first()
+        if row is None:
+            return False
+        owner, expired = row
+        if owner != me and not expired:
+            return False
+        await conn.execute(
+            update(CoordinationLease)
+            .where(CoordinationLease.name == name)
+            .values(owner=me, expires_at=expires_in(ttl))
+        )
+    if owner != me:
+        logger.info(f"已获取租约 {name}（{me}）")
+    return True
+
+
+async def release_lease(name: str):
+    """释放当前进程持有的租约，其他进程下次检查时即可接手"""
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(CoordinationLease)
+            .where(CoordinationLease.name == name, CoordinationLease.owner == worker_id())
+            .values(expires_at=None)
+        )
+
+
+def parse_rate_limits(value: str) -> Dict[str, Tuple[int, int]]:
+    """解析 "wechat:20/60,feishu:100/60" 为 {渠道类型: (条数, 窗口秒数)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        try:
+            channel_type, budget = item.split(":", 1)
+            limit, window = budget.split("/", 1)
+            limits[channel_type.strip()] = (int(limit), int(window))
+        except ValueError:
+            raise ValueError(f"发送频率配置格式错误: {item}（应为 渠道类型:条数/秒数）")
+    return limits
+
+
+class RateLimiter:
+    """多进程共用的发送频率预算
+
+    每个渠道（渠道类型:渠道名）每个窗口最多发送 limit 条。预算拆成 slots 个槽位保存在 rate_budget_slots 中，
+    扣减时 SELECT ... FOR UPDATE SKIP LOCKED 取任一未用完的槽位：并发的进程各自锁住不同的行，
+    不会排队等同一行锁；窗口编号由数据库时间计算，窗口变化时槽位的余量重置。
+    """
+
+    def __init__(self, limits: Optional[str] = None, slots: Optional[int] = None, max_wait: Optional[float] = None):
+        self.limits = parse_rate_limits(settings.rate_limits if limits is None else limits)
+        self.slots = slots or settings.rate_limit_slots
+        self.max_wait = settings.rate_limit_max_wait if max_wait is None else max_wait
+        self._created = set()
+
+    def _shares(self, limit: int) -> List[int]:
+        """每个槽位在一个窗口内的配额，合计等于 limit"""
+        count = max(1, min(self.slots, limit))
+        return [limit // count + (1 if i < limit % count else 0) for i in range(count)]
+
+    async def _take(self, budget: str, limit: int, window: int) -> Optional[float]:
+        """扣减一次，成功返回 None，否则返回建议的等待秒数"""
+        shares = self._shares(limit)
+        current = func.floor(func.unix_timestamp() / window)
+        available = (RateBudgetSlot.budget == budget) & (
+            (RateBudgetSlot.window_start < current) | (RateBudgetSlot.remaining > 0)
+        )
+
+        async with engine.begin() as conn:
+            if budget not in self._created:
+                await conn.execute(insert(RateBudgetSlot).prefix_with("IGNORE").values([
+                    {"budget": budget, "slot": slot, "window_start": 0, "remaining": 0}
+                    for slot in range(len(shares))
+                ]))
+                self._created.add(budget)
+
+            row = (await conn.execute(
+                select(RateBudgetSlot.slot, RateBudgetSlot.window_start, current)
+                .where(available, RateBudgetSlot.slot < len(shares))
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )).first()
+            if row is not None:
+                slot, window_start, current_window = row
+                if window_start < current_window:
+                    values = {"window_start": int(current_window), "remaining": shares[slot] - 1}
+                else:
+                    values = {"remaining": RateBudgetSlot.remaining - 1}
+                await conn.execute(
+                    update(RateBudgetSlot)
+                    .where(RateBudgetSlot.budget == budget, RateBudgetSlot.slot == slot)
+                    .values(**values)
+                )
+                return None
+
+            # 没有领到槽位：有余量的槽位正被其他进程锁定时稍后重试，否则等到下一个窗口
+            busy = (await conn.execute(
+                select(func.count()).select_from(RateBudgetSlot).where(available, RateBudgetSlot.slot < len(shares))
+            )).scalar()
+            if busy:
+                return 0.05
+            elapsed = (await conn.execute(select(func.unix_timestamp() % window))).scalar()
+            return max(0.05, window - float(elapsed))
+
+    async def acquire(self, channel_type: str, channel_name: str) -> bool:
+        """
+        占用一次发送配额，预算用完时等待（最多 max_wait 秒）
+
+        Returns:
+            未配置频率限制或拿到配额时返回 True，等待超时返回 False。
+            数据库不可用时放行（记录警告），不因为计数失败而停发通知。
+        """
+        if channel_type not in self.limits:
+            return True
+        limit, window = self.limits[channel_type]
+        budget = f"{channel_type}:{channel_name}"
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while True:
+            try:
+                wait = await self._take(budget, limit, window)
+            except Exception as e:
+                logger.warning(f"发送频率预算 {budget} 扣减失败，直接发送: {e}")
+                return True
+            if wait is None:
+                return True
+            if loop.time() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+async def claim_failed_notifications(
+    db: AsyncSession,
+    max_attempts: int,
+    limit: int,
+    window: float,
+    channel_types: List[str]
+) -> List[Tuple[Notification, Optional[str]]]:
+    """
+    领取一批待重试的失败通知（SELECT ... FOR UPDATE SKIP LOCKED）
+
+    记录的行锁在调用方提交前一直持有：其他进程领取时跳过这些记录，
+    进程在重试过程中退出时事务回滚，记录保持失败状态，由其他进程重新领取。
+
+    Returns:
+        [(通知记录, 正文)]
+    """
+    # created_at 条件让查询只扫描最近的分区
+    since = datetime.now() - timedelta(seconds=window)
+    notifications = (await db.execute(
+        select(Notification)
+        .where(
+            Notification.status == NotificationStatus.FAILED,
+            Notification.retry_count < max_attempts,
+            Notification.channel_type.in_(channel_types),
+            Notification.created_at >= since
+        )
+        .order_by(Notification.created_at, Notification.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )).scalars().all()
+
+    # 正文单独查询（不加锁）：多条通知共用一行正文，锁住它会阻塞同一正文的新通知写入
+    content_ids = {n.content_id for n in notifications if n.content_id is not None}
+    contents = dict((await db.execute(
+        select(NotificationContent.id, NotificationContent.content).where(NotificationContent.id.in_(content_ids))
+    )).all()) if content_ids else {}
+    return [(n, contents.get(n.content_id, n.content)) for n in notifications]
+
+
+# 全局发送频率预算
+rate_limiter = RateLimiter()
@@ -1,14 +1,23 @@
-from sqlalchemy import create_engine, MetaData
+import time
+import logging
+
+from sqlalchemy import create_engine, MetaData, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from .config import settings
+from .metrics import registry, DB_QUERY_SECONDS, DB_SLOW_QUERIES
+
+logger = logging.getLogger(__name__)
 
 # 创建异步引擎
 engine = create_async_engine(
     settings.database_url,
-    echo=True,
-    pool_recycle=3600,
+    echo=settings.db_echo,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
     pool_pre_ping=True
 )
 
@@ -19,10 +28,15 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False
 )
 
-# 创建同步引擎用于Alembic
+# 创建同步引擎用于Alembic和后台维护任务（分区归档），连接用得很少，池保持较小
 sync_engine = create_engine(
     settings.database_url.replace("+aiomysql", "+pymysql"),
-    echo=True
+    echo=settings.db_echo,
+    pool_size=2,
+    max_overflow=2,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=True
 )
 
 SessionLocal = sessionmaker(
@@ -34,10 +48,53 @@ SessionLocal = sessionmaker(
 Base = declarative_base()
 
 
+def _operation(statement: str) -> str:
+    """语句类型（SELECT / INSERT / UPDATE ...），作为指标标签"""
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    operation = _operation(statement)
+    DB_QUERY_SECONDS.observe(elapsed, operation)
+    if elapsed * 1000 >= settings.db_slow_query_ms:
+        DB_SLOW_QUERIES.inc(operation)
+        # 只记录语句，不记录参数（可能包含通知正文）
+        logger.warning(f"慢查询 {elapsed * 1000:.1f}ms: {' '.join(statement.split())[:500]}")
+
+
+def _handle_error(exception_context):
+    # 执行失败时不会触发 after_cursor_execute，清掉对应的开始时间
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+for _engine in (engine.sync_engine, sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(_engine, "handle_error", _handle_error)
+
+
+registry.gauge(
+    "db_pool_connections", "数据库连接池状态（池大小、已借出、溢出连接数）", ("state",),
+    callback=lambda: {
+        ("size",): engine.pool.size(),
+        ("checked_out",): engine.pool.checkedout(),
+        ("overflow",): max(engine.pool.overflow(), 0)
+    }
+)
+
+
 async def get_db():
     """获取数据库会话"""
     async with AsyncSessionLocal() as session:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
@@ -0,0 +1,427 @@
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+
+from sqlalchemy import select, and_
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .models import (
+    NotificationChannel,
+    NotificationSource,
+    Notification,
+    SourceChannelMapping,
+    NotificationLevel,
+    NotificationStatus
+)
+from .content_store import content_store
+from .coordination import rate_limiter, claim_failed_notifications
+from .scheduler import PriorityScheduler, parse_weights
+from .stats import stats_rollup
+from .templates import template_renderer
+from .services.notification_service import NotificationService
+from .metrics import registry, NOTIFICATIONS, NOTIFICATIONS_IN_FLIGHT, span
+
+logger = logging.getLogger(__name__)
+
+# 未指定通知源时使用的来源名，渠道配置来自环境变量（SMTP_*、WECHAT_WEBHOOK_URL 等）
+DEFAULT_SOURCE = "default"
+
+# (渠道类型, 渠道名, 渠道配置)
+Channel = Tuple[str, str, Dict[str, Any]]
+
+
+class Dispatcher:
+    """通知分发引擎，所有接口的发送都经过这里
+
+    - 路由：按通知源从数据库读取启用的渠道映射（缓存 routing_cache_ttl 秒）；
+      未指定通知源（或通知源未登记）时使用环境变量中配置的默认渠道
+    - 发送：各渠道并发发送；邮件和 webhook 各有一组发送名额，按通知级别分优先级通道、同级按通知源权重公平分配
+      （见 scheduler.py），SMTP连接和 webhook HTTP 连接都来自连接池（见 transports.py）；
+      配置了发送频率的渠道先占用多进程共用的频率预算（见 coordination.py）
+    - 记录：每个渠道一条通知记录，正文去重保存；记录在发送前一次性写入（状态为处理中），
+      发送完成后一次性更新结果，发送过程中不占用数据库会话。写库失败不影响发送
+    - 统计：结果提交后把状态变化累加到按小时汇总的发送统计（见 stats.py）
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, routing_cache_ttl: Optional[float] = None):
+        self.concurrency = concurrency or settings.dispatch_concurrency
+        self.routing_cache_ttl = settings.routing_cache_ttl if routing_cache_ttl is None else routing_cache_ttl
+        self.service = NotificationService()
+        weights = parse_weights(settings.source_weights)
+        # 邮件的名额为同时进行的SMTP会话数，webhook 的名额与 HTTP 连接数一致
+        self.schedulers = {
+            "email": PriorityScheduler("email", settings.smtp_concurrency, settings.dispatch_bulk_share, weights),
+            "webhook": PriorityScheduler("webhook", self.concurrency, settings.dispatch_bulk_share, weights),
+        }
+        self._routes: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+
+    def scheduler(self, channel_type: str) -> PriorityScheduler:
+        return self.schedulers["email" if channel_type == "email" else "webhook"]
+
+    def default_channels(self, channel_types: Optional[List[str]] = None) -> List[Channel]:
+        """环境变量中配置的默认渠道，未指定时只发邮件"""
+        configs = {
+            "email": {
+                "host": settings.smtp_host,
+                "port": settings.smtp_port,
+                "username": settings.smtp_username,
+                "password": settings.smtp_password,
+                "recipients": [settings.default_recipient] if settings.default_recipient else []
+            },
+            "wechat": {"webhook_url": settings.wechat_webhook_url} if settings.wechat_webhook_url else None,
+            "feishu": {"webhook_url": settings.feishu_webhook_url} if settings.feishu_webhook_url else None,
+        }
+
+        channels = []
+        for channel_type in channel_types or ["email"]:
+            if configs.get(channel_type):
+                channels.append((channel_type, DEFAULT_SOURCE, configs[channel_type]))
+            else:
+                logger.warning(f"默认渠道未配置: {channel_type}")
+        return channels
+
+    async def _load_route(self, db, source_name: str) -> Optional[Dict[str, Any]]:
+        """读取通知源及其启用的渠道（按优先级），通知源不存在或未激活时返回 None"""
+        cached = self._routes.get(source_name)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        with span("db.load_route"):
+            source = (await db.execute(
+                select(NotificationSource).where(
+                    NotificationSource.source_name == source_name,
+                    NotificationSource.is_active == True
+                )
+            )).scalar_one_or_none()
+
+            route = None
+            if source is not None:
+                rows = (await db.execute(
+                    select(SourceChannelMapping, NotificationChannel).join(
+                        NotificationChannel,
+                        and_(
+                            SourceChannelMapping.channel_type == NotificationChannel.channel_type,
+                            SourceChannelMapping.channel_name == NotificationChannel.channel_name
+                        )
+                    ).where(
+                        SourceChannelMapping.source_name == source_name,
+                        SourceChannelMapping.is_enabled == True,
+                        NotificationChannel.is_active == True
+                    ).order_by(SourceChannelMapping.priority)
+                )).all()
+                route = {
+                    "default_channels": source.default_channels or [],
+                    "channels": [
+                        (channel.channel_type.value, channel.channel_name, channel.config_value)
+                        for _, channel in rows
+                    ]
+                }
+
+        self._routes[source_name] = (time.monotonic() + self.routing_cache_ttl, route)
+        return route
+
+    async def resolve_channels(self, db, source_name: str, channels: Optional[List[str]] = None) -> List[Channel]:
+        """
+        确定要发送的渠道
+
+        channels 中的每一项可以是渠道类型（email、wechat）或渠道名（work_email），为空时使用通知源的默认渠道
+        """
+        if source_name == DEFAULT_SOURCE:
+            return self.default_channels(channels)
+
+        try:
+            route = await self._load_route(db, source_name)
+        except Exception as e:
+            logger.error(f"读取通知源 {source_name} 的渠道配置失败，使用默认渠道: {e}")
+            await db.rollback()
+            return self.default_channels(channels)
+        if route is None:
+            logger.warning(f"通知源不存在或未激活: {source_name}，使用默认渠道")
+            return self.default_channels(channels)
+
+        wanted = set(channels or route["default_channels"])
+        return [c for c in route["channels"] if c[0] in wanted or c[1] in wanted]
+
+    def clear_routes(self):
+        """清空路由缓存（修改通知源或渠道配置后调用）"""
+        self._routes.clear()
+
+    async def dispatch(
+        self,
+        title: str,
+        content: str = "",
+        level: Any = NotificationLevel.INFO,
+        source_name: Optional[str] = None,
+        channels: Optional[List[str]] = None,
+        recipients: Optional[List[str]] = None,
+        **custom_data
+    ) -> Dict[str, Any]:
+        """
+        发送通知
+
+        Args:
+            title: 通知标题（邮件主题）
+            content: 通知内容；custom_data 中带 template_name/template_data 时由模板渲染
+            level: 通知级别
+            source_name: 通知源，为空时使用默认渠道
+            channels: 渠道类型或渠道名列表，为空时使用通知源的默认渠道
+            recipients: 收件人，为空时使用渠道配置中的收件人
+            custom_data: 渠道参数（html_content、attachments、sender_name、message_type 等）
+
+        Returns:
+            发送结果，success 表示所有渠道都发送成功
+
+        Raises:
+            TemplateNotFoundError / TemplateRenderError: 模板不存在或渲染失败（在发送前检查）
+        """
+        source_name = source_name or DEFAULT_SOURCE
+        level = NotificationLevel(level) if isinstance(level, str) else level
+
+        template_name = custom_data.get("template_name")
+        if template_name:
+            # 提前渲染一次，模板错误直接返回给调用方，记录中保存纯文本版本
+            content = template_renderer.render(template_name, custom_data.get("template_data") or {}, ["text"])["text"]
+
+        NOTIFICATIONS_IN_FLIGHT.inc(source_name)
+        try:
+            async with AsyncSessionLocal() as db:
+                targets = await self.resolve_channels(db, source_name, channels)
+                if not targets:
+                    return {
+                        "success": False,
+                        "overall_status": "failed",
+                        "message": f"未找到可用的通知渠道: {', '.join(channels or []) or '默认渠道'}",
+                        "timestamp": datetime.now().isoformat()
+                    }
+
+                records = await self._create_records(db, source_name, targets, title, content, level, recipients)
+
+                with span("send"):
+                    results = await asyncio.gather(*(
+                        self._send(source_name, channel_type, channel_name, config, title, content, level,
+                                   recipients, custom_data)
+                        for channel_type, channel_name, config in targets
+                    ))
+
+                if records:
+                    await self._save_results(db, records, results)
+        finally:
+            NOTIFICATIONS_IN_FLIGHT.dec(source_name)
+
+        for (channel_type, channel_name, _), result in zip(targets, results):
+            result.setdefault("channel_type", channel_type)
+            result.setdefault("channel_name", channel_name)
+            NOTIFICATIONS.inc(source_name, channel_type, "success" if result.get("success") else "failed")
+
+        success_count = sum(1 for r in results if r.get("success"))
+        failures = [f"{r['channel_name']}({r['channel_type']}): {r.get('message')}" for r in results if not r.get("success")]
+        return {
+            "success": not failures,
+            "overall_status": "success" if success_count > 0 else "failed",
+            "message": "; ".join(failures) if failures else f"{success_count} 个渠道发送成功",
+            "success_count": success_count,
+            "total_count": len(results),
+            "channel_results": results,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    async def _create_records(self, db, source_name: str, targets: List[Channel], title: str,
+                              content: str, level: NotificationLevel,
+                              recipients: Optional[List[str]] = None) -> List[Notification]:
+        """写入通知记录（各渠道共用一份正文，指定的收件人一并保存供重试使用），失败时返回空列表"""
+        try:
+            with span("db.save_content"):
+                content_id = await content_store.get_or_create(db, content)
+            records = [
+                Notification(
+                    source_name=source_name,
+                    channel_type=channel_type,
+                    channel_name=channel_name,
+                    notification_level=level,
+                    title=title[:200],
+                    content_id=content_id,
+                    status=NotificationStatus.PROCESSING,
+                    recipients=recipients,
+                    retry_count=0
+                )
+                for channel_type, channel_name, _ in targets
+            ]
+            db.add_all(records)
+            with span("db.create_notifications"):
+                await db.commit()
+            return records
+        except Exception as e:
+            await db.rollback()
+            content_store.clear_cache()
+            logger.error(f"通知记录写入失败（仍继续发送）: {e}")
+            return []
+
+    async def _save_results(self, db, records: List[Notification], results: List[Dict[str, Any]]):
+        previous = [notification.status for notification in records]
+        try:
+            for notification, result in zip(records, results):
+                if result.get("success"):
+                    notification.status = NotificationStatus.SUCCESS
+                    notification.recipients = result.get("recipients")
+                    notification.sent_at = datetime.now()
+                else:
+                    notification.status = NotificationStatus.FAILED
+                    notification.error_message = result.get("message")
+                notification.retry_count += 1
+            with span("db.save_results"):
+                await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"通知结果保存失败: {e}")
+            return
+
+        for notification, status in zip(records, previous):
+            stats_rollup.record(notification, status)
+
+    async def _send(self, source_name: str, channel_type: str, channel_name: str, config: Dict[str, Any],
+                    title: str, content: str, level: NotificationLevel, recipients: Optional[List[str]],
+                    custom_data: Dict[str, Any]) -> Dict[str, Any]:
+        """按优先级排队拿到发送名额后发送一个渠道（先占用发送频率预算，等待预算时不占发送名额）"""
+        if not await rate_limiter.acquire(channel_type, channel_name):
+            return {
+                "success": False,
+                "message": f"超出发送频率限制: {channel_type}:{channel_name}",
+                "timestamp": datetime.now().isoformat()
+            }
+
+        async with self.scheduler(channel_type).slot(level, source_name):
+            try:
+                return await self.service.send_notification(
+                    channel_type=channel_type,
+                    channel_config=config,
+                    title=title,
+                    content=content,
+                    level=level.value,
+                    recipients=recipients,
+                    **custom_data
+                )
+            except Exception as e:
+                logger.error(f"渠道 {channel_type} 发送失败: {e}")
+                return {
+                    "success": False,
+                    "message": str(e),
+                    "timestamp": datetime.now().isoformat()
+                }
+
+    async def retry_failed(self, max_attempts: int, batch_size: int, window: float,
+                           channel_types: List[str]) -> int:
+        """
+        领取一批失败的通知重新发送（多进程时各自领取不同的记录），返回领取的条数
+
+        记录在发送期间保持行锁，发送结果和锁在同一次提交中写入和释放。
+        """
+        async with AsyncSessionLocal() as db:
+            claimed = await claim_failed_notifications(db, max_attempts, batch_size, window, channel_types)
+            if not claimed:
+                return 0
+
+            records, sends = [], []
+            for notification, content in claimed:
+                channel = await self._retry_channel(db, notification)
+                if channel is None:
+                    # 渠道已删除或停用：不再领取这条记录
+                    logger.warning(f"通知 {notification.id} 的渠道 {notification.channel_name} 已不可用，不再重试")
+                    notification.retry_count = max_attempts
+                    continue
+                records.append(notification)
+                sends.append(self._send(
+                    notification.source_name, notification.channel_type, notification.channel_name, channel, notification.title,
+                    content or "", notification.notification_level, notification.recipients, {}
+                ))
+
+            with span("send"):
+                results = await asyncio.gather(*sends)
+            for notification, result in zip(records, results):
+                NOTIFICATIONS.inc(notification.source_name, notification.channel_type,
+                                  "success" if result.get("success") else "failed")
+            await self._save_results(db, records, results)
+            return len(claimed)
+
+    async def _retry_channel(self, db, notification: Notification) -> Optional[Dict[str, Any]]:
+        """重试时使用的渠道配置（按记录中的渠道名查找当前配置）"""
+        if notification.source_name == DEFAULT_SOURCE:
+            channels = self.default_channels([notification.channel_type])
+        else:
+            route = await self._load_route(db, notification.source_name)
+            channels = route["channels"] if route else []
+        for channel_type, channel_name, config in channels:
+            if channel_type == notification.channel_type and channel_name == notification.channel_name:
+                return config
+        return None
+
+
+class RetryWorker:
+    """失败重试的后台任务
+
+    每个进程都运行，每隔 interval 秒领取一批失败的通知（SELECT ... FOR UPDATE SKIP LOCKED）重新发送，
+    领满一批时继续领取下一批。进程之间不会领到同一条记录。
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        window: Optional[float] = None,
+        channel_types: Optional[str] = None
+    ):
+        self.interval = interval or settings.retry_interval
+        self.max_attempts = max_attempts or settings.retry_max_attempts
+        self.batch_size = batch_size or settings.retry_batch_size
+        self.window = window or settings.retry_window
+        self.channel_types = [t.strip() for t in (channel_types or settings.retry_channels).split(",") if t.strip()]
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        """重试直到没有待重试的记录，返回领取的条数"""
+        total = 0
+        while True:
+            claimed = await dispatcher.retry_failed(self.max_attempts, self.batch_size, self.window, self.channel_types)
+            total += claimed
+            if claimed < self.batch_size:
+                return total
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"失败重试出错: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局分发引擎
+dispatcher = Dispatcher()
+
+# 全局失败重试任务
+retry_worker = RetryWorker()
+
+registry.gauge(
+    "dispatch_queue", "发送名额的占用和各优先级通道的排队数", ("pool", "stat"),
+    callback=lambda: {
+        (pool, name): value
+        for pool, scheduler in dispatcher.schedulers.items()
+        for name, value in scheduler.stats().items()
+    }
+)
@@ -0,0 +1,162 @@
+import asyncio
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Any, Callable, Awaitable, Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy import text
+
+from .config import settings
+from .database import engine
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+async def probe_smtp():
+    """连接SMTP服务器并读取 220 欢迎信息（不登录）"""
+    reader, writer = await asyncio.open_connection(
+        settings.smtp_host, settings.smtp_port, ssl=settings.smtp_port == 465
+    )
+    try:
+        banner = await reader.readline()
+        if not banner.startswith(b"220"):
+            raise ConnectionError(f"SMTP响应异常: {banner.decode(errors='replace').strip()}")
+        writer.write(b"QUIT\r\n")
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def probe_database():
+    """执行 SELECT 1"""
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def webhook_probe(url: str) -> Callable[[], Awaitable[None]]:
+    """webhook 只检查 TCP 连通性，不发送消息"""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+
+    async def probe():
+        _, writer = await asyncio.open_connection(parts.hostname, port, ssl=parts.scheme == "https")
+        writer.close()
+
+    return probe
+
+
+class HealthMonitor:
+    """依赖健康检查
+
+    后台任务每隔 interval 秒并发探测 SMTP、数据库和已配置的 webhook（异步I/O，单项超时 timeout 秒），
+    结果缓存在内存中，/health 直接返回缓存，不在请求中做任何网络操作。
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        timeout: Optional[float] = None,
+        critical: Optional[set] = None
+    ):
+        self.interval = interval or settings.health_check_interval
+        self.timeout = timeout or settings.health_check_timeout
+        # 关键依赖失败时整体为 unhealthy（返回503），其他依赖失败时为 degraded
+        self.critical = critical or {"smtp", "database"}
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def probes(self) -> Dict[str, Callable[[], Awaitable[None]]]:
+        probes = {"smtp": probe_smtp, "database": probe_database}
+        if settings.wechat_webhook_url:
+            probes["wechat"] = webhook_probe(settings.wechat_webhook_url)
+        if settings.feishu_webhook_url:
+            probes["feishu"] = webhook_probe(settings.feishu_webhook_url)
+        return probes
+
+    async def _run_probe(self, probe: Callable[[], Awaitable[None]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(), timeout=self.timeout)
+            status, error = "ok", None
+        except asyncio.TimeoutError:
+            status, error = "failed", f"超时（{self.timeout}秒）"
+        except Exception as e:
+            status, error = "failed", f"{type(e).__name__}: {e}"
+        return {
+            "status": status,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            "error": error,
+            "checked_at": datetime.now().isoformat()
+        }
+
+    async def check_all(self) -> Dict[str, Dict[str, Any]]:
+        """并发探测所有依赖并更新缓存"""
+        probes = self.probes()
+        results = await asyncio.gather(*(self._run_probe(probe) for probe in probes.values()))
+        # 整体替换，读取方不会看到更新到一半的结果
+        self.results = dict(zip(probes, results))
+        self.checked_at = time.time()
+
+        for name, result in self.results.items():
+            if result["status"] != "ok":
+                logger.warning(f"健康检查失败: {name} - {result['error']}")
+        return self.results
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.error(f"健康检查异常: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回缓存的检查结果
+
+        status: healthy / degraded（非关键依赖失败）/ unhealthy（关键依赖失败或结果过期）/ starting
+        """
+        if self.checked_at is None:
+            status = "starting"
+        elif time.time() - self.checked_at > self.interval * 3:
+            status = "unhealthy"  # 后台检查已停止更新
+        elif any(r["status"] != "ok" for name, r in self.results.items() if name in self.critical):
+            status = "unhealthy"
+        elif any(r["status"] != "ok" for r in self.results.values()):
+            status = "degraded"
+        else:
+            status = "healthy"
+
+        return {
+            "status": status,
+            "checks": self.results,
+            "checked_at": datetime.fromtimestamp(self.checked_at).isoformat() if self.checked_at else None
+        }
+
+
+# 全局健康检查实例
+health_monitor = HealthMonitor()
+
+registry.gauge(
+    "dependency_up", "依赖最近一次探测是否成功", ("dependency",),
+    callback=lambda: {(name,): 1 if r["status"] == "ok" else 0 for name, r in health_monitor.results.items()}
+)
+registry.gauge(
+    "dependency_probe_latency_seconds", "依赖最近一次探测的耗时", ("dependency",),
+    callback=lambda: {(name,): r["latency_ms"] / 1000 for name, r in health_monitor.results.items()}
+)
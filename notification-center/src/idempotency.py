@@ -0,0 +1,274 @@
+import time
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.engine import Connection
+
+from .config import settings
+from .database import engine
+from .models import IdempotencyKey
+from .coordination import worker_id, expires_in
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+# 处理中的幂等键的占用时间（秒）：处理进程退出后，超过这个时间其他进程才能接手
+PROCESSING_TTL = 300
+PURGE_BATCH_SIZE = 1000
+
+
+def request_fingerprint(request: BaseModel) -> str:
+    """请求内容的摘要，同一个幂等键只能用于内容相同的请求"""
+    body = json.dumps(request.model_dump(mode="json"), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "future", "expires_at")
+
+    def __init__(self, fingerprint: str, future: asyncio.Future, expires_at: float):
+        self.fingerprint = fingerprint
+        self.future = future
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """幂等键存储（进程内 LRU + 数据库，带过期时间）
+
+    以 (接口, Idempotency-Key) 为键保存第一次请求的结果，ttl 内用同一个键重试时直接返回原结果，
+    不会重复发送，也不会重复写库。原请求还在处理中时，重试请求等待并共用它的结果。
+    处理失败（抛出异常）的结果不保存，客户端可以用同一个键重试。
+
+    多进程部署时重试请求可能落到其他进程，因此幂等键同时写入 idempotency_keys 表：
+    第一个插入成功的进程负责处理，其他进程等待结果（最多 idempotency_wait 秒）后重放。
+    数据库不可用时退化为只在进程内去重。
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl or settings.idempotency_ttl
+        self.max_entries = max_entries or settings.idempotency_max_entries
+        self.wait = settings.idempotency_wait
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self.replays = 0
+
+    def _get(self, key: Tuple[str, str]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def _evict(self):
+        # 只淘汰已完成的最旧条目，处理中的请求（数量受并发限制）保留
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            if self._entries[key].future.done():
+                del self._entries[key]
+
+    async def run(
+        self,
+        scope: str,
+        idempotency_key: Optional[str],
+        request: BaseModel,
+        handler: Callable[[], Awaitable[Any]],
+        response: Optional[Response] = None
+    ) -> Any:
+        """
+        按幂等键执行 handler
+
+        Args:
+            scope: 接口名，不同接口的幂等键互不影响
+            idempotency_key: 请求头中的幂等键，为空时直接执行
+            request: 请求体，用于校验重试请求与原请求一致
+            handler: 实际的处理逻辑
+            response: 重放时在响应头中加上 Idempotent-Replayed: true
+
+        Raises:
+            HTTPException(422): 同一个幂等键用于了内容不同的请求
+        """
+        if not idempotency_key:
+            return await handler()
+
+        key = (scope, idempotency_key)
+        fingerprint = request_fingerprint(request)
+
+        entry = self._get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail=f"幂等键 {idempotency_key} 已用于内容不同的请求")
+            self._entries.move_to_end(key)
+            self.replays += 1
+            if response is not None:
+                response.headers[REPLAYED_HEADER] = "true"
+            # shield：重试请求断开时不影响原请求
+            return await asyncio.shield(entry.future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = _Entry(fingerprint, future, time.monotonic() + self.ttl)
+        self._evict()
+
+        owned = False
+        try:
+            owned, stored = await self._claim(scope, idempotency_key, fingerprint)
+            if stored is not None:
+                self.replays += 1
+                if response is not None:
+                    response.headers[REPLAYED_HEADER] = "true"
+                result = stored
+            else:
+                result = await handler()
+                if owned:
+                    await self._complete(scope, idempotency_key, result)
+        except BaseException as e:
+            self._entries.pop(key, None)
+            if owned:
+                # 请求被取消时也要释放，放到独立的任务中执行
+                asyncio.ensure_future(self._release(scope, idempotency_key))
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 没有其他等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+            raise
+
+        future.set_result(result)
+        return result
+
+    async def _claim(self, scope: str, idempotency_key: str, fingerprint: str) -> Tuple[bool, Optional[Any]]:
+        """
+        在数据库中占用幂等键
+
+        Returns:
+            (是否由当前进程处理, 其他进程已保存的结果)
+
+        Raises:
+            HTTPException(422): 幂等键已用于内容不同的请求
+            HTTPException(409): 其他进程处理超时，仍未得到结果
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait
+        delay = 0.05
+        while True:
+            try:
+                async with engine.begin() as conn:
+                    inserted = await conn.execute(insert(IdempotencyKey).prefix_with("IGNORE").values(
+                        scope=scope,
+                        idempotency_key=idempotency_key,
+                        fingerprint=fingerprint,
+                        owner=worker_id(),
+                        expires_at=expires_in(PROCESSING_TTL)
+                    ))
+                    if inserted.rowcount:
+                        return True, None
+
+                    row = (await conn.execute(
+                        select(
+                            IdempotencyKey.fingerprint,
+                            IdempotencyKey.response,
+                            IdempotencyKey.expires_at < func.now()
+                        ).where(
+                            IdempotencyKey.scope == scope,
+                            IdempotencyKey.idempotency_key == idempotency_key
+                        ).with_for_update()
+                    )).first()
+                    if row is None:
+                        # 原请求失败，幂等键刚被释放
+                        continue
+                    stored_fingerprint, stored, expired = row
+                    if expired:
+                        # 结果已过期，或处理进程已退出：由当前进程接手
+                        await conn.execute(
+                            update(IdempotencyKey).where(
+                                IdempotencyKey.scope == scope,
+                                IdempotencyKey.idempotency_key == idempotency_key
+                            ).values(
+                                fingerprint=fingerprint,
+                                owner=worker_id(),
+                                response=None,
+                                expires_at=expires_in(PROCESSING_TTL)
+                            )
+                        )
+                        return True, None
+            except Exception as e:
+                logger.warning(f"幂等键 {idempotency_key} 写入数据库失败，只在进程内去重: {e}")
+                return False, None
+
+            if stored_fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail=f"幂等键 {idempotency_key} 已用于内容不同的请求")
+            if stored is not None:
+                return False, stored
+            if loop.time() + delay > deadline:
+                raise HTTPException(status_code=409, detail=f"幂等键 {idempotency_key} 对应的请求仍在处理中，请稍后重试")
+            # 原请求在其他进程中处理，等待它的结果
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    async def _complete(self, scope: str, idempotency_key: str, result: Any):
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(
+                    update(IdempotencyKey).where(
+                        IdempotencyKey.scope == scope,
+                        IdempotencyKey.idempotency_key == idempotency_key,
+                        IdempotencyKey.owner == worker_id()
+                    ).values(response=jsonable_encoder(result), expires_at=expires_in(self.ttl))
+                )
+        except Exception as e:
+            logger.warning(f"幂等键 {idempotency_key} 的结果保存失败: {e}")
+
+    async def _release(self, scope: str, idempotency_key: str):
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(
+                    delete(IdempotencyKey).where(
+                        IdempotencyKey.scope == scope,
+                        IdempotencyKey.idempotency_key == idempotency_key,
+                        IdempotencyKey.owner == worker_id(),
+                        IdempotencyKey.response.is_(None)
+                    )
+                )
+        except Exception as e:
+            logger.warning(f"幂等键 {idempotency_key} 释放失败（{PROCESSING_TTL} 秒后过期）: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "replays": self.replays}
+
+
+def purge_expired_keys(conn: Connection) -> int:
+    """删除已过期的幂等键（同步连接，由分区维护任务定期调用），返回删除的条数"""
+    deleted = 0
+    while True:
+        result = conn.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.expires_at < func.now())
+            .with_dialect_options(mysql_limit=PURGE_BATCH_SIZE)
+        )
+        conn.commit()
+        deleted += result.rowcount
+        if result.rowcount < PURGE_BATCH_SIZE:
+            break
+    if deleted:
+        logger.info(f"已清理过期的幂等键 {deleted} 条")
+    return deleted
+
+
+# 全局幂等键存储
+idempotency_store = IdempotencyStore()
+
+registry.gauge(
+    "idempotency_keys", "幂等键存储（条目数、重放次数）", ("stat",),
+    callback=lambda: {(name,): value for name, value in idempotency_store.stats().items()}
+)
@@ -1,11 +1,24 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+import time
+
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response, Depends, Query, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .notifier import notification_manager, EmailNotifier
+from .dispatcher import dispatcher, retry_worker
+from .transports import close_transports
+from .templates import template_renderer, TemplateNotFoundError, TemplateRenderError
+from .health import health_monitor
+from .retention import retention_manager
+from .stats import stats_rollup, query_stats, GRANULARITIES
+from .idempotency import idempotency_store, IDEMPOTENCY_HEADER
+from .metrics import registry, HTTP_REQUESTS, HTTP_REQUEST_SECONDS
 from .config import settings
+from .database import get_db
+from .models import NotificationStatus, NotificationLevel
+from .services.notification_manager import NotificationManager as HistoryManager
 
 app = FastAPI(
     title="Notification Center API",
@@ -14,6 +27,22 @@ app = FastAPI(
 )
 
 
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    """记录请求数和耗时，route 使用路由模板（如 /templates/{template_name}/render），避免标签无限增长"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.inc(request.method, path, str(status))
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, path)
+
+
 # 请求模型
 class EmailRequest(BaseModel):
     subject: str
@@ -31,10 +60,17 @@ class TemplateEmailRequest(BaseModel):
     to_emails: Optional[List[EmailStr]] = None
 
 
+class TemplateRenderRequest(BaseModel):
+    data: Dict[str, Any]
+    variants: Optional[List[str]] = None
+
+
 class NotificationRequest(BaseModel):
     message: str
     subject: str = "系统通知"
-    level: str = "info"
+    level: NotificationLevel = NotificationLevel.INFO
+    # 通知源（notification_sources 中登记的），为空时使用默认渠道
+    source: Optional[str] = None
     channels: Optional[List[str]] = None
     recipients: Optional[List[EmailStr]] = None
 
@@ -58,115 +94,273 @@ async def root():
 
 
 @app.post("/send-email", response_model=APIResponse)
-async def send_email(request: EmailRequest):
-    """发送邮件"""
-    try:
-        email_notifier = EmailNotifier()
-        result = await email_notifier.send_email(
-            subject=request.subject,
-            content=request.content,
-            to_emails=request.to_emails,
-            html_content=request.html_content,
-            attachments=request.attachments,
-            sender_name=request.sender_name
-        )
-
-        if result["success"]:
-            return APIResponse(
-                success=True,
-                message="邮件发送成功",
-                data=result,
-                timestamp=datetime.now().isoformat()
+async def send_email(
+    request: EmailRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """发送邮件（带 Idempotency-Key 请求头时，用同一个键重试不会重复发送）"""
+    async def handle():
+        try:
+            result = await dispatcher.dispatch(
+                title=request.subject,
+                content=request.content,
+                channels=["email"],
+                recipients=request.to_emails,
+                html_content=request.html_content,
+                attachments=request.attachments,
+                sender_name=request.sender_name
             )
-        else:
-            raise HTTPException(status_code=500, detail=result["message"])
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            if result["success"]:
+                return APIResponse(
+                    success=True,
+                    message="邮件发送成功",
+                    data=result,
+                    timestamp=datetime.now().isoformat()
+                )
+            else:
+                raise HTTPException(status_code=500, detail=result["message"])
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await idempotency_store.run("send-email", idempotency_key, request, handle, response)
 
 
 @app.post("/send-template-email", response_model=APIResponse)
-async def send_template_email(request: TemplateEmailRequest):
-    """发送模板邮件"""
+async def send_template_email(
+    request: TemplateEmailRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """发送模板邮件（支持 Idempotency-Key）"""
+    async def handle():
+        try:
+            result = await dispatcher.dispatch(
+                title=request.subject,
+                channels=["email"],
+                recipients=request.to_emails,
+                template_name=request.template_name,
+                template_data=request.data
+            )
+
+            if result["success"]:
+                return APIResponse(
+                    success=True,
+                    message="模板邮件发送成功",
+                    data=result,
+                    timestamp=datetime.now().isoformat()
+                )
+            else:
+                raise HTTPException(status_code=500, detail=result["message"])
+
+        except TemplateNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except TemplateRenderError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await idempotency_store.run("send-template-email", idempotency_key, request, handle, response)
+
+
+@app.get("/templates")
+async def list_templates():
+    """列出可用的模板及其渠道变体"""
+    return {
+        "templates": template_renderer.list_templates(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.post("/templates/{template_name}/render", response_model=APIResponse)
+async def render_template(template_name: str, request: TemplateRenderRequest):
+    """预览模板在各渠道的渲染结果"""
     try:
-        email_notifier = EmailNotifier()
-        result = await email_notifier.send_template_email(
-            template_name=request.template_name,
-            data=request.data,
-            subject=request.subject,
-            to_emails=request.to_emails
-        )
+        rendered = template_renderer.render(template_name, request.data, request.variants)
+    except TemplateNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TemplateRenderError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return APIResponse(
+        success=True,
+        message="模板渲染成功",
+        data=rendered,
+        timestamp=datetime.now().isoformat()
+    )
+
+
+@app.post("/notify", response_model=APIResponse)
+async def notify(
+    request: NotificationRequest,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """发送系统通知（支持 Idempotency-Key，重试时不会再次加入发送队列）"""
+    async def handle():
+        try:
+            # 后台任务发送通知
+            background_tasks.add_task(
+                dispatcher.dispatch,
+                title=f"[{request.level.value.upper()}] {request.subject}",
+                content=request.message,
+                level=request.level,
+                source_name=request.source,
+                channels=request.channels,
+                recipients=request.recipients
+            )
 
-        if result["success"]:
             return APIResponse(
                 success=True,
-                message="模板邮件发送成功",
-                data=result,
+                message="通知正在发送",
                 timestamp=datetime.now().isoformat()
             )
-        else:
-            raise HTTPException(status_code=500, detail=result["message"])
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
+    return await idempotency_store.run("notify", idempotency_key, request, handle, response)
 
-@app.post("/notify", response_model=APIResponse)
-async def notify(request: NotificationRequest, background_tasks: BackgroundTasks):
-    """发送系统通知"""
+
+@app.get("/notifications")
+async def list_notifications(
+    source_name: Optional[str] = None,
+    channel_type: Optional[str] = None,
+    status: Optional[NotificationStatus] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_content: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """查询通知历史（游标分页，下一页传入返回的 next_cursor）"""
     try:
-        # 后台任务发送通知
-        background_tasks.add_task(
-            notification_manager.notify,
-            message=request.message,
-            subject=request.subject,
-            level=request.level,
-            channels=request.channels,
-            recipients=request.recipients
+        return await HistoryManager(db).list_notifications(
+            source_name=source_name,
+            channel_type=channel_type,
+            status=status,
+            limit=limit,
+            cursor=cursor,
+            include_content=include_content
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        return APIResponse(
-            success=True,
-            message="通知正在发送",
-            timestamp=datetime.now().isoformat()
+
+@app.get("/stats")
+async def notification_stats(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = Query("hour", description=" / ".join(GRANULARITIES)),
+    source_name: Optional[str] = None,
+    channel_type: Optional[str] = None,
+    channel_name: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """按通知源、渠道统计发送成功和失败数（按小时汇总，默认最近24小时）"""
+    try:
+        result = await query_stats(
+            db,
+            since=since,
+            until=until,
+            granularity=granularity,
+            source_name=source_name,
+            channel_type=channel_type,
+            channel_name=channel_name
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**result, "timestamp": datetime.now().isoformat()}
+
+
+@app.on_event("startup")
+async def start_health_monitor():
+    """启动后台健康检查"""
+    health_monitor.start()
+
+
+@app.on_event("startup")
+async def start_retention():
+    """启动后台分区维护和归档"""
+    if settings.retention_enabled:
+        retention_manager.start()
+
+
+@app.on_event("startup")
+async def start_retry_worker():
+    """启动后台失败重试"""
+    if settings.retry_enabled:
+        retry_worker.start()
+
+
+@app.on_event("startup")
+async def start_stats_rollup():
+    """启动发送统计的后台写入"""
+    stats_rollup.start()
+
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.on_event("shutdown")
+async def stop_health_monitor():
+    await health_monitor.stop()
+
+
+@app.on_event("shutdown")
+async def stop_retention():
+    await retention_manager.stop()
+
+
+@app.on_event("shutdown")
+async def stop_retry_worker():
+    await retry_worker.stop()
+
+
+@app.on_event("shutdown")
+async def stop_stats_rollup():
+    """写入剩余的发送统计（在失败重试停止之后）"""
+    await stats_rollup.stop()
+
+
+@app.on_event("shutdown")
+async def close_connections():
+    """关闭SMTP连接池和 webhook HTTP 客户端"""
+    await close_transports()
 
 
 @app.get("/health")
 async def health_check():
-    """健康检查"""
-    try:
-        # 检查SMTP配置
-        import smtplib
-        with smtplib.SMTP(settings.smtp_host, settings.smtp_port) as server:
-            # 只是测试连接，不登录
-            server.ehlo()
-
-        return {
-            "status": "healthy",
-            "smtp_config": "ok",
-            "timestamp": datetime.now().isoformat()
-        }
-    except Exception as e:
-        return JSONResponse(
-            status_code=503,
-            content={
-                "status": "unhealthy",
-                "smtp_config": "failed",
-                "error": str(e),
-                "timestamp": datetime.now().isoformat()
-            }
-        )
+    """健康检查（返回后台探测的缓存结果，包含各依赖的延迟）"""
+    snapshot = health_monitor.snapshot()
+    smtp = snapshot["checks"].get("smtp", {})
+    content = {
+        **snapshot,
+        "smtp_config": "ok" if smtp.get("status") == "ok" else "failed",
+        "timestamp": datetime.now().isoformat()
+    }
+
+    if snapshot["status"] in ("healthy", "degraded"):
+        return content
+    return JSONResponse(status_code=503, content=content)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
     import uvicorn
+    # 开发用；生产环境多进程部署用 gunicorn -c gunicorn.conf.py src.main:app
     uvicorn.run(
-        "main:app",
+        "src.main:app",
         host=settings.api_host,
         port=settings.api_port,
-        reload=True
+        workers=settings.api_workers,
+        reload=settings.api_reload
     )
\ No newline at end of file
@@ -0,0 +1,192 @@
+import time
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """指标基类
+
+    所有更新都在事件循环线程中进行（单线程），只做字典读写，不加锁；
+    采集（/metrics）时按 Prometheus 文本格式输出。
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        lines += [f"{name}{labels} {value}" for name, labels, value in self.samples()]
+        return lines
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self):
+        return [(self.name, _format_labels(self.labelnames, k), v) for k, v in list(self.values.items())]
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[tuple, float]]] = None):
+        """callback 不为空时，采集时调用它获取当前值（标签元组 -> 值）"""
+        super().__init__(name, help_text, labelnames)
+        self.values: Dict[tuple, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        values = self.values
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.warning(f"指标 {self.name} 采集失败: {e}")
+                values = {}
+        return [(self.name, _format_labels(self.labelnames, k), v) for k, v in list(values.items())]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签元组 -> [各分桶计数（非累计）..., +Inf 计数, 总和]
+        self.values: Dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        samples = []
+        for labels, series in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, labels, f'le="{le}"'),
+                                cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, labels), series[-1]))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, labels), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# 通知处理
+NOTIFICATIONS = registry.counter(
+    "notifications_total", "按通知源、渠道类型和结果统计的通知数", ("source", "channel_type", "status"))
+NOTIFICATIONS_IN_FLIGHT = registry.gauge(
+    "notifications_in_flight", "已接收但尚未发送完成的通知数", ("source",))
+CHANNEL_SEND_SECONDS = registry.histogram(
+    "notification_channel_send_seconds", "各渠道通知器 send 的耗时", ("channel_type", "status"))
+
+# 发送排队（按优先级通道）
+DISPATCH_QUEUE_SECONDS = registry.histogram(
+    "dispatch_queue_seconds", "通知在发送队列中等待的时间", ("pool", "level"))
+
+# 处理阶段耗时（span）
+SPAN_SECONDS = registry.histogram(
+    "notification_span_seconds", "处理阶段耗时（发送、数据库操作等）", ("span", "status"))
+
+# 数据库语句
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_seconds", "SQL语句执行耗时", ("operation",))
+DB_SLOW_QUERIES = registry.counter(
+    "db_slow_queries_total", "超过慢查询阈值的SQL语句数", ("operation",))
+
+# HTTP 请求
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP请求数", ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_seconds", "HTTP请求耗时", ("method", "route"))
+
+
+@contextmanager
+def span(name: str):
+    """记录一个处理阶段的耗时，异常时 status 为 error（同步和异步代码中都用 with）"""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        SPAN_SECONDS.observe(time.perf_counter() - started, name, status)
@@ -0,0 +1,271 @@
+import os
+import re
+import base64
+import logging
+import mimetypes
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from email import policy
+from email.header import Header
+from email.utils import formataddr, formatdate, make_msgid
+from typing import List, Optional, Dict, Any, Iterator, Tuple
+from urllib.parse import quote
+from uuid import uuid4
+
+from .config import settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 每次读取 57 的整数倍字节，base64 编码后正好是完整的 76 字符行
+ENCODE_READ_SIZE = 57 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def encode_base64_lines(data: bytes) -> bytes:
+    """base64 编码并按 76 字符折行（CRLF）"""
+    return base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+
+class EncodedAttachment:
+    """已完成 base64 编码的附件
+
+    小文件的编码结果保存在内存中；超过 spill_bytes 的文件边读边编码写入临时文件，
+    发送时再从临时文件分块读取，整个过程不需要把文件完整读入内存。
+    临时文件在对象被回收时删除，正在发送中的邮件持有引用，不会被缓存淘汰影响。
+    """
+
+    def __init__(self, path: str, spill_bytes: int):
+        self.filename = os.path.basename(path)
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.data: Optional[bytes] = None
+        self.spool_path: Optional[str] = None
+
+        if os.path.getsize(path) <= spill_bytes:
+            with open(path, "rb") as f:
+                self.data = encode_base64_lines(f.read())
+            self.encoded_size = len(self.data)
+        else:
+            fd, self.spool_path = tempfile.mkstemp(prefix="attachment_", suffix=".b64")
+            weakref.finalize(self, _remove_file, self.spool_path)
+            self.encoded_size = 0
+            with open(path, "rb") as src, os.fdopen(fd, "wb") as dst:
+                while True:
+                    block = src.read(ENCODE_READ_SIZE)
+                    if not block:
+                        break
+                    encoded = encode_base64_lines(block)
+                    dst.write(encoded)
+                    self.encoded_size += len(encoded)
+
+    @property
+    def memory_size(self) -> int:
+        """占用的内存大小（落盘的附件不计）"""
+        return len(self.data) if self.data is not None else 0
+
+    def headers(self) -> bytes:
+        """附件的 MIME 头"""
+        try:
+            self.filename.encode("ascii")
+            filename_param = f'filename="{self.filename}"'
+        except UnicodeEncodeError:
+            filename_param = f"filename*=utf-8''{quote(self.filename)}"
+        return (
+            f"Content-Type: {self.content_type}\r\n"
+            f"Content-Transfer-Encoding: base64\r\n"
+            f"Content-Disposition: attachment; {filename_param}\r\n\r\n"
+        ).encode("ascii")
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """分块返回编码后的内容"""
+        if self.data is not None:
+            yield self.data
+            return
+        with open(self.spool_path, "rb") as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class AttachmentCache:
+    """附件编码缓存
+
+    以 (绝对路径, 修改时间, 文件大小) 为键，同一个文件只编码一次，文件变化后自动重新编码。
+    按最近使用淘汰，条目数和内存占用都有上限。
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_memory: Optional[int] = None,
+        spill_bytes: Optional[int] = None
+    ):
+        self.max_entries = max_entries or settings.attachment_cache_entries
+        self.max_memory = max_memory or settings.attachment_cache_memory
+        self.spill_bytes = spill_bytes or settings.attachment_spill_bytes
+        self._entries: "OrderedDict[Tuple[str, int, int], EncodedAttachment]" = OrderedDict()
+        self._memory = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str) -> EncodedAttachment:
+        """取附件的编码结果，未缓存时编码并加入缓存"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            attachment = self._entries.get(key)
+            if attachment is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return attachment
+            self.misses += 1
+
+        # 编码在锁外进行，不阻塞其他附件的读取
+        attachment = EncodedAttachment(path, self.spill_bytes)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = attachment
+                self._memory += attachment.memory_size
+                self._evict()
+        return attachment
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._memory > self.max_memory):
+            _, evicted = self._entries.popitem(last=False)
+            self._memory -= evicted.memory_size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._memory,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# 全局附件缓存
+attachment_cache = AttachmentCache()
+
+registry.gauge(
+    "email_attachment_cache", "附件编码缓存（条目数、内存占用、命中和未命中次数）", ("stat",),
+    callback=lambda: {(name,): value for name, value in attachment_cache.stats().items()}
+)
+
+
+class PreparedMessage:
+    """预先构建好的邮件
+
+    正文和附件只编码一次，按收件人分批发送时只重新生成邮件头（To 只包含当前批次的收件人）。
+    所有正文都使用 base64 编码，发送时按块输出，不需要在内存中拼出整封邮件。
+    """
+
+    def __init__(
+        self,
+        subject: str,
+        sender_address: str,
+        content: str,
+        html_content: Optional[str] = None,
+        attachments: Optional[List[str]] = None,
+        sender_name: Optional[str] = None,
+        cache: Optional[AttachmentCache] = None
+    ):
+        self.subject = subject
+        self.sender_address = sender_address
+        self.sender = formataddr((sender_name or "System", sender_address))
+
+        cache = cache or attachment_cache
+        self.attachments: List[EncodedAttachment] = []
+        for file_path in attachments or []:
+            try:
+                self.attachments.append(cache.get(file_path))
+            except Exception as e:
+                logger.error(f"添加附件失败: {file_path}, 错误: {e}")
+
+        alt_boundary = f"alt_{uuid4().hex}"
+        alternative = (
+            f"--{alt_boundary}\r\n".encode("ascii")
+            + self._text_part("plain", content)
+            + (f"--{alt_boundary}\r\n".encode("ascii") + self._text_part("html", html_content)
+               if html_content else b"")
+            + f"--{alt_boundary}--\r\n".encode("ascii")
+        )
+
+        if self.attachments:
+            self.boundary = f"mixed_{uuid4().hex}"
+            self.content_type = f'multipart/mixed; boundary="{self.boundary}"'
+            self._body = (
+                f"--{self.boundary}\r\n"
+                f'Content-Type: multipart/alternative; boundary="{alt_boundary}"\r\n\r\n'
+            ).encode("ascii") + alternative
+        else:
+            self.boundary = None
+            self.content_type = f'multipart/alternative; boundary="{alt_boundary}"'
+            self._body = alternative
+
+    @staticmethod
+    def _text_part(subtype: str, text: str) -> bytes:
+        return (
+            f"Content-Type: text/{subtype}; charset=\"utf-8\"\r\n"
+            f"Content-Transfer-Encoding: base64\r\n\r\n"
+        ).encode("ascii") + encode_base64_lines(text.encode("utf-8"))
+
+    def headers(self, to_emails: List[str]) -> bytes:
+        """生成邮件头（每个批次单独生成）"""
+        # 长主题、长收件人列表按 CRLF 折行：SMTP 不允许单独的 LF，每行不能超过998个字符
+        subject = Header(self.subject, "utf-8").encode(linesep="\r\n")
+        to = policy.SMTP.fold("To", ", ".join(to_emails))
+        return (
+            f"Subject: {subject}\r\n"
+            f"From: {self.sender}\r\n"
+            f"{to}"
+            f"Date: {formatdate(localtime=True)}\r\n"
+            f"Message-ID: {make_msgid()}\r\n"
+            f"MIME-Version: 1.0\r\n"
+            f"Content-Type: {self.content_type}\r\n\r\n"
+        ).encode("utf-8")
+
+    def iter_chunks(self, to_emails: List[str]) -> Iterator[bytes]:
+        """按块输出完整邮件（CRLF 换行）"""
+        yield self.headers(to_emails)
+        yield self._body
+        for attachment in self.attachments:
+            yield f"--{self.boundary}\r\n".encode("ascii") + attachment.headers()
+            yield from attachment.iter_chunks()
+        if self.boundary:
+            yield f"--{self.boundary}--\r\n".encode("ascii")
+
+    def as_bytes(self, to_emails: List[str]) -> bytes:
+        return b"".join(self.iter_chunks(to_emails))
+
+
+_LEADING_DOT = re.compile(rb"(?<=\n)\.")
+
+
+def dot_stuff(chunk: bytes, at_line_start: bool) -> Tuple[bytes, bool]:
+    """SMTP DATA 透明处理：行首的 '.' 前再加一个 '.'
+
+    Returns:
+        (处理后的内容, 下一块是否从行首开始)
+    """
+    if not chunk:
+        return chunk, at_line_start
+    stuffed = _LEADING_DOT.sub(b"..", chunk)
+    if at_line_start and stuffed.startswith(b"."):
+        stuffed = b"." + stuffed
+    return stuffed, chunk.endswith(b"\n")
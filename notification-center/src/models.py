@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, TIMESTAMP, BIGINT, JSON, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, TIMESTAMP, BIGINT, JSON, Enum, ForeignKey, Index
+from datetime import datetime
 from sqlalchemy.sql import func
 from .database import Base
 import enum
@@ -53,20 +54,50 @@ class NotificationSource(Base):
 class Notification(Base):
     __tablename__ = "notifications"
 
+    # 表按 created_at 按月分区（见 alembic/versions/0002、src/retention.py），
+    # MySQL 要求主键包含分区列，且分区表不支持外键，source_name 不再引用 notification_sources
     id = Column(BIGINT, primary_key=True, autoincrement=True)
-    source_name = Column(String(50), ForeignKey('notification_sources.source_name'), nullable=False)
+    source_name = Column(String(50), nullable=False)
     channel_type = Column(String(20), nullable=False)
     channel_name = Column(String(50), nullable=False)
     notification_level = Column(Enum(NotificationLevel), nullable=False)
     title = Column(String(200), nullable=False)
-    content = Column(Text, nullable=False)
+    # 正文保存在 notification_contents 中（按内容哈希去重），content 只保留迁移前的旧记录
+    content = Column(Text)
+    content_id = Column(BIGINT)
     status = Column(Enum(NotificationStatus), default=NotificationStatus.PENDING)
     recipients = Column(JSON)
     error_message = Column(Text)
     retry_count = Column(Integer, default=0)
-    created_at = Column(TIMESTAMP, default=func.now())
+    # 主键列需要在插入前确定值，这里用应用端时间，避免每次插入前多一次 SELECT now()；
+    # TIMESTAMP 只保存到秒，去掉微秒，否则 MySQL 舍入后的值与内存中的主键不一致，按主键更新时匹配不到记录
+    created_at = Column(TIMESTAMP, primary_key=True, nullable=False,
+                        default=lambda: datetime.now().replace(microsecond=0),
+                        server_default=func.current_timestamp())
     sent_at = Column(TIMESTAMP)
 
+    # 历史查询按 (created_at, id) 倒序做游标分页，各筛选条件都有对应的组合索引
+    __table_args__ = (
+        Index("ix_notifications_created_id", "created_at", "id"),
+        Index("ix_notifications_source_created_id", "source_name", "created_at", "id"),
+        Index("ix_notifications_channel_created_id", "channel_type", "created_at", "id"),
+        Index("ix_notifications_status_created_id", "status", "created_at", "id"),
+        Index("ix_notifications_content_id", "content_id"),
+    )
+
+
+class NotificationContent(Base):
+    """通知正文，按 SHA-256 去重，多条通知记录共用一份"""
+    __tablename__ = "notification_contents"
+
+    id = Column(BIGINT, primary_key=True, autoincrement=True)
+    content_hash = Column(String(64), nullable=False, unique=True)
+    content = Column(Text, nullable=False)
+    content_length = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP, default=func.now())
+    # 最近一次被引用的时间，清理无引用正文时据此留出宽限期
+    last_used_at = Column(TIMESTAMP, default=func.now(), index=True)
+
 
 class SourceChannelMapping(Base):
     __tablename__ = "source_channel_mapping"
@@ -77,4 +108,48 @@ class SourceChannelMapping(Base):
     channel_name = Column(String(50), nullable=False)
     is_enabled = Column(Boolean, default=True)
     priority = Column(Integer, default=1)
-    created_at = Column(TIMESTAMP, default=func.now())
\ No newline at end of file
+    created_at = Column(TIMESTAMP, default=func.now())
+
+
+class CoordinationLease(Base):
+    """后台任务租约，多进程部署时同一时间只有持有租约的进程执行（如分区维护）"""
+    __tablename__ = "coordination_leases"
+
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(100))
+    expires_at = Column(TIMESTAMP, nullable=True)
+
+
+class RateBudgetSlot(Base):
+    """发送频率预算，一个预算拆成多个槽位（行），各进程用 SKIP LOCKED 扣减不同的槽位，不争抢同一行锁"""
+    __tablename__ = "rate_budget_slots"
+
+    budget = Column(String(100), primary_key=True)
+    slot = Column(Integer, primary_key=True, autoincrement=False)
+    # 当前窗口编号（UNIX_TIMESTAMP() DIV 窗口秒数），窗口变化时重置 remaining
+    window_start = Column(BIGINT, nullable=False, default=0)
+    remaining = Column(Integer, nullable=False, default=0)
+
+
+class IdempotencyKey(Base):
+    """幂等键及其结果，多进程共用；response 为空表示原请求还在处理中"""
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String(50), primary_key=True)
+    idempotency_key = Column(String(200), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    owner = Column(String(100))
+    response = Column(JSON)
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
+
+
+class NotificationStatHourly(Base):
+    """按小时汇总的发送结果（按通知记录的创建时间归入小时），由 src/stats.py 随通知状态变化增量更新"""
+    __tablename__ = "notification_stats_hourly"
+
+    bucket = Column(TIMESTAMP, primary_key=True)
+    source_name = Column(String(50), primary_key=True)
+    channel_type = Column(String(20), primary_key=True)
+    channel_name = Column(String(50), primary_key=True)
+    success_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,222 @@
+import os
+import gzip
+import json
+import asyncio
+import logging
+import argparse
+from datetime import datetime, date
+from decimal import Decimal
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .config import settings
+from .database import sync_engine
+from .content_store import purge_orphan_contents
+from .coordination import acquire_lease, release_lease
+from .idempotency import purge_expired_keys
+
+logger = logging.getLogger(__name__)
+
+TABLE = "notifications"
+# 兜底分区，接收超出已建月份分区的数据
+MAXVALUE_PARTITION = "pmax"
+ARCHIVE_BATCH_SIZE = 1000
+# 多进程部署时只有持有这个租约的进程执行分区维护
+LEASE_NAME = "retention"
+
+
+def month_start(value: date, offset: int = 0) -> date:
+    """value 所在月份往后第 offset 个月的第一天"""
+    month = value.year * 12 + value.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """保存 month 当月数据的分区名，如 p202610"""
+    return f"p{month:%Y%m}"
+
+
+def partition_clause(month: date) -> str:
+    """month 当月的分区定义（上界为下月第一天）"""
+    return (f"PARTITION {partition_name(month)} VALUES LESS THAN "
+            f"(UNIX_TIMESTAMP('{month_start(month, 1):%Y-%m-%d} 00:00:00'))")
+
+
+def list_partitions(conn: Connection) -> List[Dict[str, Any]]:
+    """按顺序列出 notifications 的分区，未分区时返回空列表"""
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"table": TABLE}).all()
+    return [{"name": name, "less_than": description, "rows": table_rows} for name, description, table_rows in rows]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def _archive_row(row) -> Dict[str, Any]:
+    record = dict(row)
+    shared_content = record.pop("shared_content")
+    if record.get("content") is None:
+        record["content"] = shared_content
+    return record
+
+
+class RetentionManager:
+    """通知记录的分区维护和归档
+
+    notifications 按 created_at 按月做 RANGE 分区（迁移 0002 完成分区改造），后台任务定期：
+    1. 为当前月及之后 premake_months 个月预建分区（从 pmax 中拆分，pmax 为空时不搬数据）
+    2. 把早于保留期限的分区逐行导出为 gzip JSONL（先写临时文件，完成后改名），再 DROP PARTITION
+    3. 清理不再被任何通知记录引用的正文（notification_contents）和过期的幂等键
+
+    删除分区是元数据操作，不产生逐行删除的 undo/binlog，也不会在热数据上留下碎片。
+    所有数据库和文件操作都在线程池中用同步连接执行，不阻塞事件循环。
+    多进程部署时各进程都会启动后台任务，但只有持有 retention 租约的进程执行，其余进程只检查租约。
+    """
+
+    def __init__(
+        self,
+        retention_months: Optional[int] = None,
+        archive_dir: Optional[str] = None,
+        premake_months: Optional[int] = None,
+        interval: Optional[float] = None,
+        engine=None
+    ):
+        self.retention_months = retention_months or settings.retention_months
+        self.archive_dir = archive_dir or settings.archive_dir
+        self.premake_months = settings.retention_premake_months if premake_months is None else premake_months
+        self.interval = interval or settings.retention_check_interval
+        self.engine = engine or sync_engine
+        self._task: Optional[asyncio.Task] = None
+
+    def ensure_partitions(self, conn: Connection, today: Optional[date] = None) -> List[str]:
+        """预建分区，返回新建的分区名"""
+        partitions = list_partitions(conn)
+        if not partitions:
+            logger.warning(f"{TABLE} 表未分区，请先执行 alembic upgrade head")
+            return []
+
+        existing = {p["name"] for p in partitions}
+        today = today or date.today()
+        missing = [month_start(today, i) for i in range(self.premake_months + 1)]
+        missing = [m for m in missing if partition_name(m) not in existing]
+        # 只能在最后一个月份分区之后追加
+        last = max((p["name"] for p in partitions if p["name"] != MAXVALUE_PARTITION), default=None)
+        missing = [m for m in missing if last is None or partition_name(m) > last]
+        if not missing:
+            return []
+
+        clauses = ", ".join([partition_clause(m) for m in missing]
+                            + [f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE"])
+        conn.execute(text(f"ALTER TABLE {TABLE} REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO ({clauses})"))
+        created = [partition_name(m) for m in missing]
+        logger.info(f"已创建分区: {', '.join(created)}")
+        return created
+
+    def expired_partitions(self, conn: Connection, today: Optional[date] = None) -> List[str]:
+        """上界早于保留期限的月份分区（保留当前月在内的 retention_months 个月）"""
+        cutoff = partition_name(month_start(today or date.today(), -(self.retention_months - 1)))
+        return [p["name"] for p in list_partitions(conn)
+                if p["name"] != MAXVALUE_PARTITION and p["name"] < cutoff]
+
+    def archive_partition(self, conn: Connection, name: str) -> Dict[str, Any]:
+        """把分区导出为 gzip JSONL 并删除分区"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{TABLE}_{name}.jsonl.gz")
+        tmp_path = f"{path}.tmp"
+
+        rows = 0
+        # 正文在 notification_contents 中，归档时一并写入，归档文件不依赖数据库中的正文
+        result = conn.execution_options(stream_results=True, max_row_buffer=ARCHIVE_BATCH_SIZE).execute(text(
+            f"SELECT n.*, c.content AS shared_content FROM {TABLE} PARTITION ({name}) n "
+            f"LEFT JOIN notification_contents c ON c.id = n.content_id ORDER BY n.id"
+        ))
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for batch in result.mappings().partitions(ARCHIVE_BATCH_SIZE):
+                f.write("".join(
+                    json.dumps(_archive_row(row), ensure_ascii=False, default=_json_default) + "\n" for row in batch
+                ))
+                rows += len(batch)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        # 归档文件落盘后才删除分区
+        conn.execute(text(f"ALTER TABLE {TABLE} DROP PARTITION {name}"))
+        logger.info(f"分区 {name} 已归档到 {path}（{rows} 条）并删除")
+        return {"partition": name, "rows": rows, "archive": path}
+
+    def run_once(self, today: Optional[date] = None) -> Dict[str, Any]:
+        """执行一次分区维护和归档"""
+        if self.engine.dialect.name != "mysql":
+            logger.warning(f"分区维护只支持 MySQL，当前数据库: {self.engine.dialect.name}")
+            return {"created": [], "archived": [], "purged_contents": 0, "purged_idempotency_keys": 0}
+
+        with self.engine.connect() as conn:
+            created = self.ensure_partitions(conn, today)
+            archived = [self.archive_partition(conn, name) for name in self.expired_partitions(conn, today)]
+            # 删除分区后，只被这些记录引用的正文不再需要
+            purged = purge_orphan_contents(conn) if archived else 0
+            purged_keys = purge_expired_keys(conn)
+        return {"created": created, "archived": archived, "purged_contents": purged,
+                "purged_idempotency_keys": purged_keys}
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # 租约在下次检查前不会过期；持有租约的进程退出后，其他进程最多两个周期后接手
+                if await acquire_lease(LEASE_NAME, self.interval * 2):
+                    await loop.run_in_executor(None, self.run_once)
+            except Exception as e:
+                logger.error(f"分区维护失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            try:
+                await release_lease(LEASE_NAME)
+            except Exception as e:
+                logger.warning(f"释放分区维护租约失败: {e}")
+
+
+# 全局分区维护实例
+retention_manager = RetentionManager()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="通知记录分区维护和归档")
+    parser.add_argument("--retention-months", type=int, default=None, help="保留的月数（含当前月）")
+    parser.add_argument("--archive-dir", default=None, help="归档目录")
+    parser.add_argument("--list", action="store_true", help="只列出分区")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    manager = RetentionManager(retention_months=args.retention_months, archive_dir=args.archive_dir)
+    if args.list:
+        with manager.engine.connect() as connection:
+            for partition in list_partitions(connection):
+                print(f"{partition['name']:<10} {partition['less_than']:<12} {partition['rows']}")
+    else:
+        print(json.dumps(manager.run_once(), ensure_ascii=False, indent=2))
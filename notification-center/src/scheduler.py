@@ -0,0 +1,142 @@
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from .models import NotificationLevel
+from .metrics import DISPATCH_QUEUE_SECONDS
+
+# 优先级通道，按顺序调度
+LANES = (NotificationLevel.ERROR, NotificationLevel.WARNING, NotificationLevel.SUCCESS, NotificationLevel.INFO)
+# 批量通道：最多占用发送池的 bulk_share，其余名额留给告警
+BULK_LANES = (NotificationLevel.SUCCESS, NotificationLevel.INFO)
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """解析 "system_alert:4,beijing_permit:2" 为 {通知源: 权重}，未列出的通知源权重为1"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        try:
+            source, weight = item.rsplit(":", 1)
+            weights[source.strip()] = float(weight)
+        except ValueError:
+            raise ValueError(f"通知源权重配置格式错误: {item}（应为 通知源:权重）")
+        if weights[source.strip()] <= 0:
+            raise ValueError(f"通知源权重必须大于0: {item}")
+    return weights
+
+
+class _Lane:
+    __slots__ = ("heap", "virtual_time", "finish")
+
+    def __init__(self):
+        # (完成标签, 序号, 等待者)
+        self.heap: List[Tuple[float, int, asyncio.Future]] = []
+        self.virtual_time = 0.0
+        # 各通知源最后一个排队通知的完成标签
+        self.finish: Dict[str, float] = {}
+
+
+class PriorityScheduler:
+    """按优先级通道和通知源权重分配发送名额（代替 asyncio.Semaphore）
+
+    - 通道：error > warning > success > info，严格按优先级调度，有更高优先级的通知在等待时，低优先级的拿不到名额
+    - 预留：success/info 最多占用 capacity 的 bulk_share，批量通知占满发送池时，告警仍能立即拿到名额
+    - 同一通道内按通知源加权公平排队（WFQ）：通知的完成标签 = max(通道虚拟时间, 该通知源上一个标签) + 1/权重，
+      按标签从小到大调度。某个通知源一次提交大量通知时，其他通知源不用排在它们全部后面
+
+    只在事件循环线程中使用，不加锁。
+    """
+
+    def __init__(self, name: str, capacity: int, bulk_share: float = 1.0, weights: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.capacity = capacity
+        self.bulk_capacity = max(1, min(capacity, int(capacity * bulk_share)))
+        self.weights = weights or {}
+        self._lanes = {level: _Lane() for level in LANES}
+        self._in_use = 0
+        self._bulk_in_use = 0
+        self._seq = itertools.count()
+
+    def _can_run(self, level: NotificationLevel) -> bool:
+        if self._in_use >= self.capacity:
+            return False
+        return level not in BULK_LANES or self._bulk_in_use < self.bulk_capacity
+
+    def _has_waiters(self, level: NotificationLevel) -> bool:
+        """该通道或更高优先级的通道中有等待的通知"""
+        for lane_level in LANES:
+            if self._lanes[lane_level].heap:
+                return True
+            if lane_level == level:
+                return False
+        return False
+
+    def _grant(self, level: NotificationLevel):
+        self._in_use += 1
+        if level in BULK_LANES:
+            self._bulk_in_use += 1
+
+    def _release(self, level: NotificationLevel):
+        self._in_use -= 1
+        if level in BULK_LANES:
+            self._bulk_in_use -= 1
+        self._wake()
+
+    def _wake(self):
+        """按通道优先级分配空出的名额"""
+        for level in LANES:
+            lane = self._lanes[level]
+            while lane.heap and self._can_run(level):
+                tag, _, future = heapq.heappop(lane.heap)
+                if future.done():  # 等待中被取消
+                    continue
+                lane.virtual_time = tag
+                self._grant(level)
+                future.set_result(None)
+
+            while lane.heap and lane.heap[0][2].done():
+                heapq.heappop(lane.heap)
+            if lane.heap:
+                # 这个通道还有通知在等，不调度更低优先级的通道
+                return
+            lane.finish.clear()
+            lane.virtual_time = 0.0
+
+    @asynccontextmanager
+    async def slot(self, level: NotificationLevel, source: str):
+        """占用一个发送名额，退出时释放"""
+        if level not in self._lanes:
+            level = NotificationLevel.INFO
+        started = time.perf_counter()
+
+        if self._can_run(level) and not self._has_waiters(level):
+            self._grant(level)
+        else:
+            lane = self._lanes[level]
+            tag = max(lane.virtual_time, lane.finish.get(source, 0.0)) + 1.0 / self.weights.get(source, 1.0)
+            lane.finish[source] = tag
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(lane.heap, (tag, next(self._seq), future))
+            self._wake()
+            try:
+                await future
+            except asyncio.CancelledError:
+                # 名额已分配但等待者被取消，把名额还回去
+                if future.done() and not future.cancelled():
+                    self._release(level)
+                raise
+
+        DISPATCH_QUEUE_SECONDS.observe(time.perf_counter() - started, self.name, level.value)
+        try:
+            yield
+        finally:
+            self._release(level)
+
+    def stats(self) -> Dict[str, int]:
+        stats = {"in_use": self._in_use, "capacity": self.capacity}
+        for level, lane in self._lanes.items():
+            stats[f"waiting_{level.value}"] = sum(1 for _, _, future in lane.heap if not future.done())
+        return stats
@@ -1,9 +1,10 @@
 from typing import List, Dict, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, and_, or_, func
+from sqlalchemy.orm import joinedload, defer
 from datetime import datetime
-import asyncio
+import base64
+import json
 import logging
 
 from ..models import (
@@ -12,9 +13,29 @@ from ..models import (
     Notification,
     SourceChannelMapping,
     NotificationLevel,
-    NotificationStatus
+    NotificationStatus,
+    NotificationContent
 )
-from .notification_service import NotificationService
+from ..metrics import span
+from ..dispatcher import dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+def encode_cursor(created_at: datetime, notification_id: int) -> str:
+    """把 (created_at, id) 编码为分页游标"""
+    raw = json.dumps([created_at.isoformat(), notification_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """解析分页游标，格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, notification_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(notification_id)
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor}")
 
 
 class NotificationManager:
@@ -22,7 +43,6 @@ class NotificationManager:
 
     def __init__(self, db: AsyncSession):
         self.db = db
-        self.notification_service = NotificationService()
 
     async def send_notification(
         self,
@@ -34,7 +54,7 @@ class NotificationManager:
         custom_data: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
-        发送通知
+        发送通知（由分发引擎按通知源的渠道配置发送并记录）
 
         Args:
             source_name: 通知源名称
@@ -47,223 +67,138 @@ class NotificationManager:
         Returns:
             发送结果
         """
-        results = []
-        notifications_created = []
-
-        try:
-            # 1. 获取通知源信息
-            source_query = select(NotificationSource).where(
-                NotificationSource.source_name == source_name,
-                NotificationSource.is_active == True
-            )
-            source_result = await self.db.execute(source_query)
-            source = source_result.scalar_one_or_none()
-
-            if not source:
-                return {
-                    "success": False,
-                    "message": f"通知源不存在或未激活: {source_name}"
-                }
-
-            # 2. 确定要使用的渠道
-            if channels:
-                # 使用指定的渠道
-                channel_names = channels
-            else:
-                # 使用默认渠道
-                channel_names = source.default_channels or []
-
-            if not channel_names:
-                return {
-                    "success": False,
-                    "message": "未指定通知渠道"
-                }
-
-            # 3. 获取渠道配置
-            mappings_query = select(SourceChannelMapping, NotificationChannel).join(
-                NotificationChannel,
-                and_(
-                    SourceChannelMapping.channel_type == NotificationChannel.channel_type,
-                    SourceChannelMapping.channel_name == NotificationChannel.channel_name
-                )
-            ).where(
-                SourceChannelMapping.source_name == source_name,
-                SourceChannelMapping.is_enabled == True,
-                NotificationChannel.channel_name.in_(channel_names),
-                NotificationChannel.is_active == True
-            ).order_by(SourceChannelMapping.priority)
-
-            mappings_result = await self.db.execute(mappings_query)
-            channel_mappings = mappings_result.all()
-
-            if not channel_mappings:
-                return {
-                    "success": False,
-                    "message": f"未找到可用的通知渠道: {', '.join(channel_names)}"
-                }
-
-            # 4. 并行发送通知
-            tasks = []
-            for mapping, channel in channel_mappings:
-                # 创建通知记录
-                notification = Notification(
-                    source_name=source_name,
-                    channel_type=channel.channel_type.value,
-                    channel_name=channel.channel_name,
-                    notification_level=level,
-                    title=title,
-                    content=content,
-                    status=NotificationStatus.PENDING
-                )
-                self.db.add(notification)
-                notifications_created.append(notification)
-                await self.db.flush()
-
-                # 发送任务
-                task = self._send_and_update(
-                    notification_id=notification.id,
-                    channel_type=channel.channel_type.value,
-                    channel_config=channel.config_value,
-                    title=title,
-                    content=content,
-                    level=level,
-                    custom_data=custom_data
-                )
-                tasks.append(task)
-
-            await self.db.commit()
-
-            # 5. 执行所有发送任务
-            send_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # 6. 汇总结果
-            success_count = sum(1 for r in send_results if isinstance(r, dict) and r.get('success'))
-
-            return {
-                "overall_status": "success" if success_count > 0 else "failed",
-                "success_count": success_count,
-                "total_count": len(send_results),
-                "channel_results": send_results,
-                "timestamp": datetime.now().isoformat()
-            }
-
-        except Exception as e:
-            await self.db.rollback()
-            logger.error(f"通知发送失败: {e}")
-            return {
-                "success": False,
-                "message": f"通知发送失败: {str(e)}",
-                "timestamp": datetime.now().isoformat()
-            }
-
-    async def _send_and_update(
+        return await dispatcher.dispatch(
+            title=title,
+            content=content,
+            level=level,
+            source_name=source_name,
+            channels=channels,
+            **(custom_data or {})
+        )
+
+    def _history_conditions(
         self,
-        notification_id: int,
-        channel_type: str,
-        channel_config: Dict[str, Any],
-        title: str,
-        content: str,
-        level: NotificationLevel,
-        custom_data: Optional[Dict[str, Any]] = None
-    ) -> Dict[str, Any]:
-        """发送通知并更新记录"""
-        try:
-            # 更新状态为处理中
-            update_query = select(Notification).where(Notification.id == notification_id)
-            result = await self.db.execute(update_query)
-            notification = result.scalar_one()
-            notification.status = NotificationStatus.PROCESSING
-            await self.db.commit()
-
-            # 发送通知
-            send_result = await self.notification_service.send_notification(
-                channel_type=channel_type,
-                channel_config=channel_config,
-                title=title,
-                content=content,
-                level=level.value,
-                **(custom_data or {})
-            )
+        source_name: Optional[str] = None,
+        channel_type: Optional[str] = None,
+        status: Optional[NotificationStatus] = None
+    ) -> list:
+        conditions = []
+        if source_name:
+            conditions.append(Notification.source_name == source_name)
+        if channel_type:
+            conditions.append(Notification.channel_type == channel_type)
+        if status:
+            conditions.append(Notification.status == status)
+        return conditions
+
+    @staticmethod
+    def _history_query(include_content: bool):
+        """通知记录查询，需要正文时关联 notification_contents（迁移前的旧记录正文仍在 content 列）"""
+        if not include_content:
+            return select(Notification).options(defer(Notification.content))
+        return select(
+            Notification, func.coalesce(Notification.content, NotificationContent.content)
+        ).outerjoin(
+            NotificationContent, NotificationContent.id == Notification.content_id
+        ).options(defer(Notification.content))
+
+    @staticmethod
+    def _to_dict(n: Notification, content: Optional[str] = None, include_content: bool = True) -> Dict[str, Any]:
+        item = {
+            "id": n.id,
+            "source_name": n.source_name,
+            "channel_type": n.channel_type,
+            "channel_name": n.channel_name,
+            "level": n.notification_level.value,
+            "title": n.title,
+            "status": n.status.value,
+            "recipients": n.recipients,
+            "error_message": n.error_message,
+            "retry_count": n.retry_count,
+            "created_at": n.created_at.isoformat(),
+            "sent_at": n.sent_at.isoformat() if n.sent_at else None
+        }
+        if include_content:
+            item["content"] = content
+        return item
 
-            # 更新发送结果
-            if send_result.get('success'):
-                notification.status = NotificationStatus.SUCCESS
-                notification.recipients = send_result.get('recipients')
-                notification.sent_at = datetime.now()
-            else:
-                notification.status = NotificationStatus.FAILED
-                notification.error_message = send_result.get('message')
+    async def get_notifications(
+        self,
+        source_name: Optional[str] = None,
+        channel_type: Optional[str] = None,
+        status: Optional[NotificationStatus] = None,
+        limit: int = 100,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """获取通知记录（偏移分页，翻页较深时请使用 list_notifications）"""
+        query = self._history_query(include_content=True)
 
-            notification.retry_count += 1
-            await self.db.commit()
+        conditions = self._history_conditions(source_name, channel_type, status)
+        if conditions:
+            query = query.where(and_(*conditions))
 
-            return send_result
+        query = query.order_by(Notification.created_at.desc(), Notification.id.desc()).offset(offset).limit(limit)
 
-        except Exception as e:
-            # 更新失败状态
-            logger.error(f"渠道 {channel_type} 发送失败: {e}")
-            try:
-                update_query = select(Notification).where(Notification.id == notification_id)
-                result = await self.db.execute(update_query)
-                notification = result.scalar_one()
-                notification.status = NotificationStatus.FAILED
-                notification.error_message = str(e)
-                notification.retry_count += 1
-                await self.db.commit()
-            except:
-                pass
+        with span("db.get_notifications"):
+            result = await self.db.execute(query)
+            rows = result.all()
 
-            return {
-                "success": False,
-                "message": str(e),
-                "timestamp": datetime.now().isoformat()
-            }
+        return [self._to_dict(n, content) for n, content in rows]
 
-    async def get_notifications(
+    async def list_notifications(
         self,
         source_name: Optional[str] = None,
         channel_type: Optional[str] = None,
         status: Optional[NotificationStatus] = None,
         limit: int = 100,
-        offset: int = 0
-    ) -> List[Dict[str, Any]]:
-        """获取通知记录"""
-        query = select(Notification)
+        cursor: Optional[str] = None,
+        include_content: bool = False
+    ) -> Dict[str, Any]:
+        """
+        按游标分页查询通知记录（按创建时间倒序）
 
-        conditions = []
-        if source_name:
-            conditions.append(Notification.source_name == source_name)
-        if channel_type:
-            conditions.append(Notification.channel_type == channel_type)
-        if status:
-            conditions.append(Notification.status == status)
+        以上一页最后一条的 (created_at, id) 作为游标，配合 (筛选列, created_at, id) 组合索引，
+        每页只读取 limit 条，翻到多深都不需要扫描和跳过前面的记录。
+
+        Args:
+            cursor: 上一页返回的 next_cursor，为空时从最新的记录开始
+            include_content: 是否返回通知正文，默认不加载 content 列
+
+        Returns:
+            {"items": [...], "next_cursor": 下一页游标（没有更多记录时为 None）}
 
+        Raises:
+            ValueError: 游标格式不正确
+        """
+        query = self._history_query(include_content)
+
+        conditions = self._history_conditions(source_name, channel_type, status)
+        if cursor:
+            created_at, last_id = decode_cursor(cursor)
+            conditions.append(or_(
+                Notification.created_at < created_at,
+                and_(Notification.created_at == created_at, Notification.id < last_id)
+            ))
         if conditions:
             query = query.where(and_(*conditions))
 
-        query = query.order_by(Notification.created_at.desc()).offset(offset).limit(limit)
-
-        result = await self.db.execute(query)
-        notifications = result.scalars().all()
-
-        return [
-            {
-                "id": n.id,
-                "source_name": n.source_name,
-                "channel_type": n.channel_type,
-                "channel_name": n.channel_name,
-                "level": n.notification_level.value,
-                "title": n.title,
-                "content": n.content,
-                "status": n.status.value,
-                "recipients": n.recipients,
-                "error_message": n.error_message,
-                "retry_count": n.retry_count,
-                "created_at": n.created_at.isoformat(),
-                "sent_at": n.sent_at.isoformat() if n.sent_at else None
-            }
-            for n in notifications
-        ]
+        # 多取一条判断是否还有下一页
+        query = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1)
+
+        with span("db.list_notifications"):
+            result = await self.db.execute(query)
+            rows = result.all() if include_content else [(n, None) for n in result.scalars().all()]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1][0]
+            next_cursor = encode_cursor(last.created_at, last.id)
+
+        return {
+            "items": [self._to_dict(n, content, include_content) for n, content in rows],
+            "next_cursor": next_cursor
+        }
 
     async def add_notification_source(
         self,
@@ -291,6 +226,7 @@ class NotificationManager:
             )
             self.db.add(source)
             await self.db.commit()
+            dispatcher.clear_routes()
 
             return {
                 "success": True,
@@ -318,11 +254,12 @@ class NotificationManager:
                     NotificationChannel.channel_name == channel_name
                 )
             )
-            if existing.scalar_one_or_none():
+            channel = existing.scalar_one_or_none()
+            if channel:
                 # 更新配置
-                channel = existing.scalar_one()
                 channel.config_value = config_value
                 await self.db.commit()
+                dispatcher.clear_routes()
                 return {
                     "success": True,
                     "message": "通知渠道配置更新成功"
@@ -335,6 +272,7 @@ class NotificationManager:
             )
             self.db.add(channel)
             await self.db.commit()
+            dispatcher.clear_routes()
 
             return {
                 "success": True,
@@ -376,6 +314,7 @@ class NotificationManager:
                 self.db.add(mapping)
 
             await self.db.commit()
+            dispatcher.clear_routes()
             return {
                 "success": True,
                 "message": "通知源渠道配置成功"
@@ -2,14 +2,16 @@ from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import asyncio
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-import httpx
+import functools
 import json
+import time
 import logging
 
+from ..templates import template_renderer
+from ..mime_cache import PreparedMessage
+from ..metrics import CHANNEL_SEND_SECONDS
+from ..transports import smtp_pool, http_client
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -37,49 +39,39 @@ class EmailNotifier(BaseNotifier):
     async def send(self, title: str, content: str, recipients: List[str], **kwargs) -> Dict[str, Any]:
         """发送邮件"""
         try:
+            if not recipients:
+                raise ValueError("未设置收件人地址")
+
             html_content = kwargs.get('html_content')
             attachments = kwargs.get('attachments', [])
 
-            # 创建邮件
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = title
-            msg['From'] = f"Notification System <{self.config['username']}>"
-            msg['To'] = ', '.join(recipients)
-            msg['Date'] = datetime.now().strftime('%a, %d %b %Y %H:%M:%S %z')
-
-            # 添加文本内容
-            text_part = MIMEText(content, 'plain', 'utf-8')
-            msg.attach(text_part)
-
-            # 添加HTML内容
-            if html_content:
-                html_part = MIMEText(html_content, 'html', 'utf-8')
-                msg.attach(html_part)
-
-            # 添加附件
+            # 正文和附件只编码一次，收件人按批次复用同一份内容；附件需要读文件和编码，放到线程池中
+            build = functools.partial(
+                PreparedMessage,
+                subject=title,
+                sender_address=self.config['username'],
+                content=content,
+                html_content=html_content,
+                attachments=attachments,
+                sender_name=kwargs.get('sender_name') or "Notification System"
+            )
             if attachments:
-                for file_path in attachments:
-                    try:
-                        with open(file_path, 'rb') as f:
-                            part = MIMEApplication(f.read())
-                            part.add_header(
-                                'Content-Disposition',
-                                'attachment',
-                                filename=file_path.split('/')[-1]
-                            )
-                            msg.attach(part)
-                    except Exception as e:
-                        logger.error(f"添加附件失败: {file_path}, 错误: {e}")
-
-            # 发送邮件
-            result = await asyncio.get_event_loop().run_in_executor(
-                None, self._send_sync, msg, recipients
+                message = await asyncio.get_running_loop().run_in_executor(None, build)
+            else:
+                message = build()
+
+            # 异步发送（连接池中已登录的连接，支持 PIPELINING），不占用线程
+            refused = await smtp_pool.send(
+                self.config['host'], int(self.config['port']), self.config['username'], self.config['password'],
+                message, recipients, self.config.get('batch_size')
             )
 
             return {
                 "success": True,
                 "message": "邮件发送成功",
-                "recipients": recipients,
+                "recipients": [r for r in recipients if r not in refused],
+                "refused": list(refused),
+                "subject": title,
                 "timestamp": datetime.now().isoformat()
             }
 
@@ -91,14 +83,6 @@ class EmailNotifier(BaseNotifier):
                 "timestamp": datetime.now().isoformat()
             }
 
-    def _send_sync(self, msg: MIMEMultipart, recipients: List[str]) -> str:
-        """同步发送邮件"""
-        with smtplib.SMTP(self.config['host'], self.config['port']) as server:
-            server.starttls()
-            server.login(self.config['username'], self.config['password'])
-            server.send_message(msg, to_addrs=recipients)
-            return "Email sent successfully"
-
     def get_recipients(self) -> List[str]:
         return self.config.get('recipients', [])
 
@@ -139,14 +123,9 @@ class WeChatNotifier(BaseNotifier):
                     }
                 }
 
-            # 发送请求
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.config['webhook_url'],
-                    json=data,
-                    timeout=10.0
-                )
-                result = response.json()
+            # 发送请求（共用连接池）
+            response = await http_client().post(self.config['webhook_url'], json=data)
+            result = response.json()
 
             if result.get('errcode') == 0:
                 return {
@@ -220,14 +199,9 @@ class FeishuNotifier(BaseNotifier):
                     "content": {"text": text}
                 }
 
-            # 发送请求
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.config['webhook_url'],
-                    json=data,
-                    timeout=10.0
-                )
-                result = response.json()
+            # 发送请求（共用连接池）
+            response = await http_client().post(self.config['webhook_url'], json=data)
+            result = response.json()
 
             if result.get('StatusCode') == 0 or result.get('code') == 0:
                 return {
@@ -264,13 +238,19 @@ class NotificationService:
             'wechat': WeChatNotifier,
             'feishu': FeishuNotifier
         }
+        # 通知器实例按 (渠道类型, 配置) 复用
+        self._instances: Dict[tuple, BaseNotifier] = {}
 
     def get_notifier(self, channel_type: str, config: Dict[str, Any]) -> BaseNotifier:
         """根据类型获取通知器"""
         if channel_type not in self.notifiers:
             raise ValueError(f"不支持的通知类型: {channel_type}")
 
-        return self.notifiers[channel_type](config)
+        key = (channel_type, json.dumps(config, sort_keys=True, default=str))
+        notifier = self._instances.get(key)
+        if notifier is None:
+            notifier = self._instances[key] = self.notifiers[channel_type](config)
+        return notifier
 
     async def send_notification(
         self,
@@ -280,13 +260,48 @@ class NotificationService:
         content: str,
         **kwargs
     ) -> Dict[str, Any]:
-        """发送通知"""
+        """发送通知，传入 template_name/template_data 时按渠道渲染模板作为内容，传入 recipients 时代替渠道配置的接收者"""
         notifier = self.get_notifier(channel_type, channel_config)
-        recipients = notifier.get_recipients()
+        recipients = kwargs.pop('recipients', None) or notifier.get_recipients()
+
+        template_name = kwargs.pop('template_name', None)
+        if template_name:
+            content = self.render_template(channel_type, template_name, kwargs.pop('template_data', {}), kwargs)
 
-        return await notifier.send(
+        started = time.perf_counter()
+        result = await notifier.send(
             title=title,
             content=content,
             recipients=recipients,
             **kwargs
-        )
\ No newline at end of file
+        )
+        CHANNEL_SEND_SECONDS.observe(time.perf_counter() - started, channel_type,
+                                     "success" if result.get("success") else "failed")
+        return result
+
+    def render_template(
+        self,
+        channel_type: str,
+        template_name: str,
+        data: Dict[str, Any],
+        kwargs: Dict[str, Any]
+    ) -> str:
+        """
+        按渠道渲染模板，返回正文，并把渠道相关的参数写入 kwargs
+
+        - email: 纯文本正文，有 html 变体时作为 html_content
+        - wechat: 有 wechat 变体时以 markdown 消息发送
+        - feishu: 有 feishu 变体时以 rich_text 消息发送
+        """
+        variant = {'email': 'html'}.get(channel_type, channel_type)
+        rendered = template_renderer.render(template_name, data, [variant])
+
+        if channel_type == 'email':
+            if 'html' in rendered:
+                kwargs['html_content'] = rendered['html']
+            return rendered['text']
+
+        if variant in rendered:
+            kwargs['message_type'] = 'markdown' if channel_type == 'wechat' else 'rich_text'
+            return rendered[variant]
+        return rendered['text']
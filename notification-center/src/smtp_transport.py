@@ -0,0 +1,369 @@
+import ssl
+import time
+import base64
+import socket
+import asyncio
+import logging
+import smtplib
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .config import settings
+from .mime_cache import PreparedMessage, dot_stuff
+
+logger = logging.getLogger(__name__)
+
+# 单行响应的长度上限（RFC 5321 为512字节，留足余量）
+MAX_LINE_LENGTH = 8192
+# 写缓冲超过这个大小时暂停写出，等待对端读取
+WRITE_HIGH_WATER = 256 * 1024
+
+
+class _SMTPProtocol(asyncio.Protocol):
+    """SMTP 客户端协议：把收到的数据拆成响应（支持多行响应），按顺序交给等待者"""
+
+    def __init__(self):
+        self.transport: Optional[asyncio.Transport] = None
+        self._buffer = bytearray()
+        self._lines: List[bytes] = []
+        self._replies: Deque[Tuple[int, bytes]] = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._drain_waiter: Optional[asyncio.Future] = None
+        self._paused = False
+        self.closed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+
+    def data_received(self, data: bytes):
+        self._buffer += data
+        while True:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                break
+            line = bytes(self._buffer[:end + 1]).rstrip(b"\r\n")
+            del self._buffer[:end + 1]
+            self._lines.append(line[4:])
+            # "250-..." 为多行响应的中间行，"250 ..." 为最后一行
+            if line[3:4] != b"-":
+                try:
+                    code = int(line[:3])
+                except ValueError:
+                    code = -1
+                self._replies.append((code, b"\n".join(self._lines)))
+                self._lines = []
+        if len(self._buffer) > MAX_LINE_LENGTH:
+            self.transport.abort()
+            return
+        self._wake(self._waiter)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._wake(self._waiter)
+        self._wake(self._drain_waiter)
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        self._wake(self._drain_waiter)
+
+    @staticmethod
+    def _wake(waiter: Optional[asyncio.Future]):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def reply(self) -> Tuple[int, bytes]:
+        while not self._replies:
+            if self.closed:
+                raise smtplib.SMTPServerDisconnected("SMTP连接已断开")
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+        return self._replies.popleft()
+
+    async def drain(self):
+        while self._paused and not self.closed:
+            self._drain_waiter = asyncio.get_running_loop().create_future()
+            await self._drain_waiter
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected("SMTP连接已断开")
+
+
+class AsyncSMTPConnection:
+    """基于 asyncio 的 SMTP 客户端连接
+
+    不占用线程：连接、TLS 握手、认证和发送都在事件循环中完成。
+    服务器支持 PIPELINING（RFC 2920）时，MAIL FROM、所有 RCPT TO 和 DATA 一次写出、按顺序读取响应，
+    一个事务只需要一次往返加上正文的发送；不支持时逐条等待响应。
+    """
+
+    def __init__(self, host: str, port: int, timeout: Optional[float] = None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout or settings.smtp_timeout
+        self.extensions: Dict[str, str] = {}
+        self.last_used = time.monotonic()
+        self._transport: Optional[asyncio.Transport] = None
+        self._protocol: Optional[_SMTPProtocol] = None
+
+    @property
+    def closed(self) -> bool:
+        return self._protocol is None or self._protocol.closed
+
+    async def connect(self, username: str = "", password: str = "", tls_context: Optional[ssl.SSLContext] = None):
+        """建立连接：465 端口直接用 TLS，其他端口 EHLO 后 STARTTLS；username 不为空时登录"""
+        loop = asyncio.get_running_loop()
+        tls_context = tls_context or ssl.create_default_context()
+        implicit_tls = self.port == 465
+
+        self._transport, self._protocol = await asyncio.wait_for(loop.create_connection(
+            _SMTPProtocol, self.host, self.port,
+            ssl=tls_context if implicit_tls else None,
+            server_hostname=self.host if implicit_tls else None
+        ), self.timeout)
+        try:
+            await self._expect(220)
+            await self.ehlo()
+            if not implicit_tls:
+                if "starttls" not in self.extensions:
+                    raise smtplib.SMTPNotSupportedError("SMTP服务器不支持 STARTTLS")
+                await self.command("STARTTLS", 220)
+                self._transport = await asyncio.wait_for(loop.start_tls(
+                    self._transport, self._protocol, tls_context, server_hostname=self.host
+                ), self.timeout)
+                self._protocol.transport = self._transport
+                await self.ehlo()
+            if username:
+                await self.login(username, password)
+        except BaseException:
+            self.close()
+            raise
+        self.last_used = time.monotonic()
+
+    async def _reply(self) -> Tuple[int, bytes]:
+        return await asyncio.wait_for(self._protocol.reply(), self.timeout)
+
+    async def _expect(self, *codes: int) -> Tuple[int, bytes]:
+        code, message = await self._reply()
+        if code not in codes:
+            raise smtplib.SMTPResponseException(code, message)
+        return code, message
+
+    def _write(self, data: bytes):
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected("SMTP连接已断开")
+        self._transport.write(data)
+
+    async def command(self, line: str, *expected: int) -> Tuple[int, bytes]:
+        """发送一条命令并读取响应，expected 不为空时响应码不符合则抛出 SMTPResponseException"""
+        self._write(f"{line}\r\n".encode("utf-8"))
+        if expected:
+            return await self._expect(*expected)
+        return await self._reply()
+
+    async def ehlo(self):
+        _, message = await self.command(f"EHLO {socket.gethostname()}", 250)
+        self.extensions = {}
+        for line in message.decode("utf-8", errors="replace").split("\n")[1:]:
+            keyword, _, params = line.partition(" ")
+            self.extensions[keyword.lower()] = params
+
+    async def login(self, username: str, password: str):
+        methods = self.extensions.get("auth", "").upper().split()
+        try:
+            if "PLAIN" in methods or "LOGIN" not in methods:
+                token = base64.b64encode(f"\0{username}\0{password}".encode("utf-8")).decode("ascii")
+                await self.command(f"AUTH PLAIN {token}", 235)
+            else:
+                await self.command("AUTH LOGIN", 334)
+                await self.command(base64.b64encode(username.encode("utf-8")).decode("ascii"), 334)
+                await self.command(base64.b64encode(password.encode("utf-8")).decode("ascii"), 235)
+        except smtplib.SMTPResponseException as e:
+            raise smtplib.SMTPAuthenticationError(e.smtp_code, e.smtp_error)
+
+    async def noop(self) -> bool:
+        try:
+            code, _ = await self.command("NOOP")
+            return code == 250
+        except (smtplib.SMTPException, OSError, asyncio.TimeoutError):
+            return False
+
+    async def send_message(
+        self,
+        message: PreparedMessage,
+        recipients: List[str],
+        batch_size: Optional[int] = None
+    ) -> Dict[str, Tuple[int, bytes]]:
+        """
+        发送预先构建好的邮件，每个事务携带最多 batch_size 个收件人，同一份正文和附件在各批次间复用
+
+        Returns:
+            被拒绝的收件人 -> (状态码, 响应)
+
+        Raises:
+            SMTPRecipientsRefused: 所有收件人都被拒绝
+            SMTPSenderRefused / SMTPDataError: 发件人被拒绝或邮件内容被拒绝
+        """
+        batch_size = batch_size or settings.smtp_batch_size
+        refused: Dict[str, Tuple[int, bytes]] = {}
+
+        for start in range(0, len(recipients), batch_size):
+            batch = recipients[start:start + batch_size]
+            accepted = await self._envelope(message.sender_address, batch, refused)
+            if accepted:
+                await self._data(message, accepted)
+
+        if len(refused) == len(recipients):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        self.last_used = time.monotonic()
+        return refused
+
+    async def _envelope(self, sender: str, batch: List[str], refused: Dict[str, Tuple[int, bytes]]) -> List[str]:
+        """发送 MAIL FROM、RCPT TO 和 DATA，返回被接受的收件人（为空时事务已重置）"""
+        commands = [f"MAIL FROM:<{sender}>"] + [f"RCPT TO:<{recipient}>" for recipient in batch]
+
+        if "pipelining" in self.extensions:
+            self._write("".join(f"{line}\r\n" for line in commands + ["DATA"]).encode("utf-8"))
+            replies = [await self._reply() for _ in range(len(commands) + 1)]
+        else:
+            replies = []
+            for line in commands:
+                replies.append(await self.command(line))
+                if replies[0][0] != 250:
+                    break
+            accepted_any = any(code in (250, 251) for code, _ in replies[1:])
+            if replies[0][0] == 250 and accepted_any:
+                replies.append(await self.command("DATA"))
+
+        (mail_code, mail_message), rcpt_replies = replies[0], replies[1:len(commands)]
+        data_reply = replies[len(commands)] if len(replies) > len(commands) else None
+
+        accepted = []
+        if mail_code == 250:
+            for recipient, (code, rcpt_message) in zip(batch, rcpt_replies):
+                if code in (250, 251):
+                    accepted.append(recipient)
+                else:
+                    refused[recipient] = (code, rcpt_message)
+
+        if data_reply is not None and data_reply[0] == 354 and not accepted:
+            # 流水线中 DATA 已被接受但没有有效收件人：发送空正文结束事务
+            self._write(b".\r\n")
+            await self._reply()
+            data_reply = None
+
+        if mail_code != 250:
+            await self.command("RSET")
+            raise smtplib.SMTPSenderRefused(mail_code, mail_message, sender)
+        if not accepted:
+            await self.command("RSET")
+            return []
+        if data_reply[0] != 354:
+            await self.command("RSET")
+            raise smtplib.SMTPDataError(*data_reply)
+        return accepted
+
+    async def _data(self, message: PreparedMessage, accepted: List[str]):
+        """写出邮件内容（分块，遵守写缓冲的流量控制）并等待服务器确认"""
+        at_line_start = True
+        for chunk in message.iter_chunks(accepted):
+            stuffed, at_line_start = dot_stuff(chunk, at_line_start)
+            self._write(stuffed)
+            await asyncio.wait_for(self._protocol.drain(), self.timeout)
+        self._write(b".\r\n" if at_line_start else b"\r\n.\r\n")
+
+        code, reply = await self._reply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, reply)
+
+    async def quit(self):
+        if not self.closed:
+            try:
+                await asyncio.wait_for(self.command("QUIT"), 1)
+            except Exception:
+                pass
+        self.close()
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+
+
+class SMTPConnectionPool:
+    """异步SMTP连接池
+
+    按 (host, port, username) 保存已完成 TLS 和登录的连接，发送完成后放回池中，
+    下一封邮件不需要重新建立TCP连接、TLS握手和认证。对端关闭的连接在取出时直接丢弃；
+    空闲超过 noop_after 秒的连接先发 NOOP 确认可用，空闲超过 idle_timeout 的连接直接关闭。
+    连接只在事件循环中使用，不需要加锁。
+    """
+
+    def __init__(self, max_idle: Optional[int] = None, idle_timeout: Optional[float] = None, noop_after: float = 10):
+        self.max_idle = max_idle or settings.smtp_pool_size
+        self.idle_timeout = idle_timeout or settings.smtp_idle_timeout
+        self.noop_after = noop_after
+        self._idle: Dict[Tuple[str, int, str], Deque[AsyncSMTPConnection]] = {}
+        self.created = 0
+        self.reused = 0
+
+    async def _checkout(self, key) -> Optional[AsyncSMTPConnection]:
+        idle = self._idle.get(key)
+        while idle:
+            connection = idle.pop()
+            idle_for = time.monotonic() - connection.last_used
+            if connection.closed or idle_for >= self.idle_timeout:
+                connection.close()
+                continue
+            if idle_for >= self.noop_after and not await connection.noop():
+                connection.close()
+                continue
+            self.reused += 1
+            return connection
+        return None
+
+    def _checkin(self, key, connection: AsyncSMTPConnection):
+        idle = self._idle.setdefault(key, deque())
+        if connection.closed or len(idle) >= self.max_idle:
+            asyncio.ensure_future(connection.quit())
+            return
+        idle.append(connection)
+
+    async def send(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        message: PreparedMessage,
+        recipients: List[str],
+        batch_size: Optional[int] = None
+    ) -> Dict[str, Tuple[int, bytes]]:
+        """取一个已登录的连接发送邮件，正常结束（含部分收件人被拒绝）后放回池中，出错时关闭"""
+        key = (host, port, username)
+        connection = await self._checkout(key)
+        if connection is None:
+            connection = AsyncSMTPConnection(host, port)
+            await connection.connect(username, password)
+            self.created += 1
+
+        try:
+            refused = await connection.send_message(message, recipients, batch_size)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused):
+            # 事务已重置，连接仍可用
+            self._checkin(key, connection)
+            raise
+        except BaseException:
+            connection.close()
+            raise
+        self._checkin(key, connection)
+        return refused
+
+    async def close_all(self):
+        idle, self._idle = self._idle, {}
+        await asyncio.gather(*(connection.quit() for connections in idle.values() for connection in connections))
+
+    def stats(self) -> Dict[str, int]:
+        idle = sum(len(connections) for connections in self._idle.values())
+        return {"idle": idle, "created": self.created, "reused": self.reused}
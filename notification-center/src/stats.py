@@ -0,0 +1,211 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Any
+
+from sqlalchemy import select, func, and_
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .database import engine
+from .models import Notification, NotificationStatHourly, NotificationStatus
+from .metrics import registry, span
+
+logger = logging.getLogger(__name__)
+
+# (小时, 通知源, 渠道类型, 渠道名)
+StatKey = Tuple[datetime, str, str, str]
+GRANULARITIES = ("hour", "day", "total")
+
+
+def hour_bucket(value: datetime) -> datetime:
+    """value 所在的小时"""
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class StatsRollup:
+    """按小时汇总的发送结果计数（notification_stats_hourly）
+
+    通知记录的状态变化（处理中 -> 成功/失败，重试后 失败 -> 成功）提交后，把计数增量累加到进程内的缓冲区，
+    每隔 flush_interval 秒用一条 INSERT ... ON DUPLICATE KEY UPDATE 合并写入：写入次数只和通知源、渠道的数量有关，
+    与发送量无关，也不在发送事务中持有汇总行的锁。统计查询只读汇总表，不扫描 notifications。
+
+    汇总行按通知记录的创建时间归入小时，计数为各记录的当前状态，与按小时 GROUP BY notifications 的结果一致；
+    未写入的增量最多滞后 flush_interval 秒，进程异常退出时丢失。
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None):
+        self.flush_interval = flush_interval or settings.stats_flush_interval
+        # 键 -> [成功数增量, 失败数增量]
+        self._pending: Dict[StatKey, List[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.flush_errors = 0
+
+    def record(self, notification: Notification, previous: Optional[NotificationStatus]):
+        """记录一条通知从 previous 变为当前状态（只在状态已提交后调用）"""
+        delta = [0, 0]
+        for status, sign in ((previous, -1), (notification.status, 1)):
+            if status == NotificationStatus.SUCCESS:
+                delta[0] += sign
+            elif status == NotificationStatus.FAILED:
+                delta[1] += sign
+        if delta == [0, 0]:
+            return
+
+        key = (hour_bucket(notification.created_at), notification.source_name,
+               notification.channel_type, notification.channel_name)
+        pending = self._pending.setdefault(key, [0, 0])
+        pending[0] += delta[0]
+        pending[1] += delta[1]
+
+    async def flush(self) -> int:
+        """写入缓冲的增量，返回写入的汇总行数；失败时增量放回缓冲区，下次再写"""
+        pending = {key: delta for key, delta in self._pending.items() if delta != [0, 0]}
+        self._pending = {}
+        if not pending:
+            return 0
+
+        # 按主键顺序写入，多个进程同时写同一批汇总行时不会互相死锁
+        stmt = insert(NotificationStatHourly).values([
+            {"bucket": bucket, "source_name": source_name, "channel_type": channel_type,
+             "channel_name": channel_name, "success_count": success, "failed_count": failed}
+            for (bucket, source_name, channel_type, channel_name), (success, failed) in sorted(pending.items())
+        ])
+        stmt = stmt.on_duplicate_key_update(
+            success_count=NotificationStatHourly.success_count + stmt.inserted.success_count,
+            failed_count=NotificationStatHourly.failed_count + stmt.inserted.failed_count
+        )
+        try:
+            with span("db.flush_stats"):
+                async with engine.begin() as conn:
+                    await conn.execute(stmt)
+        except Exception:
+            self.flush_errors += 1
+            for key, (success, failed) in pending.items():
+                delta = self._pending.setdefault(key, [0, 0])
+                delta[0] += success
+                delta[1] += failed
+            raise
+        self.flushed += len(pending)
+        return len(pending)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"发送统计写入失败（稍后重试）: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """停止后台写入，并写入剩余的增量"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"发送统计写入失败，{len(self._pending)} 行增量丢失: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._pending), "flushed": self.flushed, "flush_errors": self.flush_errors}
+
+
+async def query_stats(
+    db: AsyncSession,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: str = "hour",
+    source_name: Optional[str] = None,
+    channel_type: Optional[str] = None,
+    channel_name: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    按通知源、渠道查询发送成功和失败数（只读汇总表，读取的行数与时间段内的小时数成正比）
+
+    Args:
+        since: 起始时间（按所在小时取整），默认为 until 前24小时
+        until: 结束时间（不含），默认为当前时间
+        granularity: hour（每小时）、day（每天）或 total（整个时间段合计）
+
+    Returns:
+        {"items": [...], "totals": {"success": .., "failed": ..}}
+
+    Raises:
+        ValueError: 时间段或 granularity 不正确
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity 只能是 {', '.join(GRANULARITIES)}: {granularity}")
+    until = until or datetime.now()
+    since = hour_bucket(since or until - timedelta(hours=24))
+    if since >= until:
+        raise ValueError("since 必须早于 until")
+    if until - since > timedelta(days=settings.stats_max_range_days):
+        raise ValueError(f"查询的时间段不能超过 {settings.stats_max_range_days} 天")
+
+    dimensions = [NotificationStatHourly.source_name, NotificationStatHourly.channel_type,
+                  NotificationStatHourly.channel_name]
+    if granularity == "hour":
+        dimensions.insert(0, NotificationStatHourly.bucket)
+    elif granularity == "day":
+        dimensions.insert(0, func.date(NotificationStatHourly.bucket).label("bucket"))
+
+    conditions = [NotificationStatHourly.bucket >= since, NotificationStatHourly.bucket < until]
+    if source_name:
+        conditions.append(NotificationStatHourly.source_name == source_name)
+    if channel_type:
+        conditions.append(NotificationStatHourly.channel_type == channel_type)
+    if channel_name:
+        conditions.append(NotificationStatHourly.channel_name == channel_name)
+
+    query = select(
+        *dimensions,
+        func.sum(NotificationStatHourly.success_count).label("success"),
+        func.sum(NotificationStatHourly.failed_count).label("failed")
+    ).where(and_(*conditions)).group_by(*dimensions).order_by(*dimensions)
+
+    with span("db.query_stats"):
+        rows = (await db.execute(query)).mappings().all()
+
+    items = []
+    for row in rows:
+        item = {
+            "source_name": row["source_name"],
+            "channel_type": row["channel_type"],
+            "channel_name": row["channel_name"],
+            "success": int(row["success"] or 0),
+            "failed": int(row["failed"] or 0),
+        }
+        if granularity != "total":
+            item = {"bucket": row["bucket"].isoformat(), **item}
+        items.append(item)
+
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "granularity": granularity,
+        "items": items,
+        "totals": {
+            "success": sum(item["success"] for item in items),
+            "failed": sum(item["failed"] for item in items)
+        }
+    }
+
+
+# 全局发送统计
+stats_rollup = StatsRollup()
+
+registry.gauge(
+    "notification_stats_rollup", "发送统计（待写入的汇总行数、累计写入行数和写入失败次数）", ("stat",),
+    callback=lambda: {(name,): value for name, value in stats_rollup.stats().items()}
+)
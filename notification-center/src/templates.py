@@ -0,0 +1,132 @@
+import os
+import logging
+from typing import List, Optional, Dict, Any
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+from jinja2 import TemplateNotFound, UndefinedError
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# 各渠道对应的模板文件后缀，text 为必需，其余可选
+TEMPLATE_VARIANTS = {
+    "text": ".txt.j2",
+    "html": ".html.j2",
+    "wechat": ".wechat.md.j2",
+    "feishu": ".feishu.j2",
+}
+
+
+class TemplateNotFoundError(LookupError):
+    """模板不存在"""
+
+
+class TemplateRenderError(ValueError):
+    """模板渲染失败（如缺少模板变量）"""
+
+
+class TemplateRenderer:
+    """基于 Jinja2 的模板引擎
+
+    模板存放在模板目录中，文件名为 <模板名><渠道后缀>（见 TEMPLATE_VARIANTS）。
+    编译后的模板保存在 Environment 的 LRU 缓存中（cache_size），
+    auto_reload 开启时每次取用都会比对文件修改时间，模板文件更新后自动重新编译。
+    """
+
+    def __init__(
+        self,
+        template_dir: Optional[str] = None,
+        cache_size: Optional[int] = None,
+        auto_reload: Optional[bool] = None
+    ):
+        self.template_dir = template_dir or settings.template_dir
+        self.env = Environment(
+            loader=FileSystemLoader(self.template_dir),
+            autoescape=select_autoescape(enabled_extensions=("html.j2",), default_for_string=False),
+            undefined=StrictUndefined,
+            cache_size=settings.template_cache_size if cache_size is None else cache_size,
+            auto_reload=settings.template_auto_reload if auto_reload is None else auto_reload,
+            trim_blocks=True,
+            lstrip_blocks=True
+        )
+
+        # 不存在的变体也记录下来，避免每次渲染都去文件系统查找；目录有变化时清空
+        self._missing = set()
+        self._dir_mtime = None
+
+    def list_templates(self) -> Dict[str, List[str]]:
+        """列出所有模板及其可用的渠道变体"""
+        templates: Dict[str, List[str]] = {}
+        for filename in self.env.list_templates():
+            for variant, suffix in TEMPLATE_VARIANTS.items():
+                if filename.endswith(suffix):
+                    templates.setdefault(filename[:-len(suffix)], []).append(variant)
+                    break
+        return {name: sorted(variants) for name, variants in sorted(templates.items())}
+
+    def render(
+        self,
+        template_name: str,
+        data: Dict[str, Any],
+        variants: Optional[List[str]] = None
+    ) -> Dict[str, str]:
+        """
+        渲染模板
+
+        Args:
+            template_name: 模板名称
+            data: 模板数据
+            variants: 需要渲染的渠道变体，默认 text 和 html
+
+        Returns:
+            变体 -> 渲染结果，模板没有提供的变体不返回（由调用方回退到 text）
+        """
+        variants = ["text"] + [v for v in (variants or ["html"]) if v != "text"]
+
+        rendered: Dict[str, str] = {}
+        for variant in variants:
+            if variant not in TEMPLATE_VARIANTS:
+                raise TemplateRenderError(f"不支持的模板变体: {variant}")
+
+            template = self._get_template(f"{template_name}{TEMPLATE_VARIANTS[variant]}")
+            if template is None:
+                if variant == "text":
+                    raise TemplateNotFoundError(f"模板不存在: {template_name}")
+                continue
+
+            try:
+                rendered[variant] = template.render(**data).strip()
+            except UndefinedError as e:
+                raise TemplateRenderError(f"模板 {template_name} 渲染失败: {e.message}")
+
+        return rendered
+
+    def _get_template(self, filename: str):
+        """取已编译的模板，不存在时返回 None"""
+        if self.env.auto_reload:
+            try:
+                dir_mtime = os.stat(self.template_dir).st_mtime
+            except OSError:
+                dir_mtime = None
+            if dir_mtime != self._dir_mtime:
+                self._missing.clear()
+                self._dir_mtime = dir_mtime
+
+        if filename in self._missing:
+            return None
+        try:
+            return self.env.get_template(filename)
+        except TemplateNotFound:
+            self._missing.add(filename)
+            return None
+
+    def clear_cache(self):
+        """清空已编译模板的缓存"""
+        if self.env.cache is not None:
+            self.env.cache.clear()
+        self._missing.clear()
+
+
+# 全局模板引擎实例
+template_renderer = TemplateRenderer()
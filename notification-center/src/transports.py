@@ -0,0 +1,44 @@
+import logging
+from typing import Optional
+
+import httpx
+
+from .config import settings
+from .metrics import registry
+from .smtp_transport import SMTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# 全局SMTP连接池
+smtp_pool = SMTPConnectionPool()
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def http_client() -> httpx.AsyncClient:
+    """webhook 共用的 HTTP 客户端（连接池、keep-alive），首次使用时创建"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_connections
+            )
+        )
+    return _http_client
+
+
+async def close_transports():
+    """关闭 HTTP 客户端和所有空闲的SMTP连接"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    await smtp_pool.close_all()
+
+
+registry.gauge(
+    "smtp_pool_connections", "SMTP连接池（空闲连接数、累计新建和复用次数）", ("stat",),
+    callback=lambda: {(name,): value for name, value in smtp_pool.stats().items()}
+)
@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+
+from src.idempotency import REPLAYED_HEADER, IdempotencyStore
+
+
+class SendRequest(BaseModel):
+    title: str
+    content: str = ""
+
+
+class FakeKeyTable:
+    """代替 idempotency_keys 表：记录占用、保存结果和释放，claims 中预置其他进程的处理结果"""
+
+    def __init__(self, store: IdempotencyStore):
+        self.claims = {}
+        self.completed = {}
+        self.released = []
+        store._claim = self.claim
+        store._complete = self.complete
+        store._release = self.release
+
+    async def claim(self, scope, idempotency_key, fingerprint):
+        return self.claims.get((scope, idempotency_key), (True, None))
+
+    async def complete(self, scope, idempotency_key, result):
+        self.completed[(scope, idempotency_key)] = result
+
+    async def release(self, scope, idempotency_key):
+        self.released.append((scope, idempotency_key))
+
+
+class Handler:
+    def __init__(self, result=None, error: Exception = None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+@pytest.fixture
+def store():
+    store = IdempotencyStore(ttl=60, max_entries=10)
+    store.table = FakeKeyTable(store)
+    return store
+
+
+def test_without_key_always_runs(store):
+    async def main():
+        handler = Handler({"id": 1})
+        request = SendRequest(title="a")
+        await store.run("send", None, request, handler)
+        await store.run("send", "", request, handler)
+        assert handler.calls == 2
+        assert store.table.completed == {}
+
+    asyncio.run(main())
+
+
+def test_retry_replays_result(store):
+    async def main():
+        handler = Handler({"id": 1})
+        request = SendRequest(title="a")
+        assert await store.run("send", "k1", request, handler) == {"id": 1}
+        assert store.table.completed == {("send", "k1"): {"id": 1}}
+
+        response = Response()
+        assert await store.run("send", "k1", SendRequest(title="a"), handler, response) == {"id": 1}
+        assert handler.calls == 1
+        assert response.headers[REPLAYED_HEADER] == "true"
+        assert store.replays == 1
+
+        # 不同接口的同名幂等键互不影响
+        await store.run("notify", "k1", request, handler)
+        assert handler.calls == 2
+
+    asyncio.run(main())
+
+
+def test_concurrent_retry_shares_result(store):
+    async def main():
+        handler = Handler({"id": 1})
+        handler.gate.clear()
+        request = SendRequest(title="a")
+        first = asyncio.ensure_future(store.run("send", "k1", request, handler))
+        second = asyncio.ensure_future(store.run("send", "k1", request, handler))
+        await asyncio.sleep(0)
+        handler.gate.set()
+        assert await asyncio.gather(first, second) == [{"id": 1}, {"id": 1}]
+        assert handler.calls == 1
+
+    asyncio.run(main())
+
+
+def test_key_reused_with_different_request(store):
+    async def main():
+        await store.run("send", "k1", SendRequest(title="a"), Handler({"id": 1}))
+        with pytest.raises(HTTPException) as error:
+            await store.run("send", "k1", SendRequest(title="b"), Handler({"id": 2}))
+        assert error.value.status_code == 422
+
+    asyncio.run(main())
+
+
+def test_failure_releases_key(store):
+    async def main():
+        request = SendRequest(title="a")
+        with pytest.raises(RuntimeError):
+            await store.run("send", "k1", request, Handler(error=RuntimeError("smtp down")))
+        await asyncio.sleep(0)
+        assert store.table.released == [("send", "k1")]
+        assert store.table.completed == {}
+
+        # 失败的结果不保存，可以用同一个键重试
+        handler = Handler({"id": 1})
+        assert await store.run("send", "k1", request, handler) == {"id": 1}
+        assert handler.calls == 1
+
+    asyncio.run(main())
+
+
+def test_cancelled_request_releases_key(store):
+    async def main():
+        handler = Handler({"id": 1})
+        handler.gate.clear()
+        task = asyncio.ensure_future(store.run("send", "k1", SendRequest(title="a"), handler))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        assert store.table.released == [("send", "k1")]
+        assert store.stats()["entries"] == 0
+
+    asyncio.run(main())
+
+
+def test_replays_result_stored_by_other_process(store):
+    async def main():
+        store.table.claims[("send", "k1")] = (False, {"id": 7})
+        handler = Handler({"id": 1})
+        response = Response()
+        assert await store.run("send", "k1", SendRequest(title="a"), handler, response) == {"id": 7}
+        assert handler.calls == 0
+        assert response.headers[REPLAYED_HEADER] == "true"
+        assert store.table.completed == {}
+
+    asyncio.run(main())
+
+
+def test_database_unavailable_dedupes_in_process(store):
+    async def main():
+        # _claim 在数据库不可用时返回 (False, None)：照常处理，不写库也不释放
+        store.table.claims[("send", "k1")] = (False, None)
+        handler = Handler({"id": 1})
+        await store.run("send", "k1", SendRequest(title="a"), handler)
+        await store.run("send", "k1", SendRequest(title="a"), handler)
+        assert handler.calls == 1
+        assert store.table.completed == {}
+
+        store.table.claims[("send", "k2")] = (False, None)
+        with pytest.raises(RuntimeError):
+            await store.run("send", "k2", SendRequest(title="a"), Handler(error=RuntimeError()))
+        await asyncio.sleep(0)
+        assert store.table.released == []
+
+    asyncio.run(main())
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from src.models import NotificationLevel
+from src.scheduler import PriorityScheduler, parse_weights
+
+ERROR = NotificationLevel.ERROR
+WARNING = NotificationLevel.WARNING
+INFO = NotificationLevel.INFO
+
+
+async def settle():
+    """让已创建的任务都运行到等待名额处"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class Holder:
+    """占用一个名额直到 release() 被调用"""
+
+    def __init__(self, scheduler: PriorityScheduler, level: NotificationLevel, source: str = "test"):
+        self.acquired = asyncio.Event()
+        self._released = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run(scheduler, level, source))
+
+    async def _run(self, scheduler, level, source):
+        async with scheduler.slot(level, source):
+            self.acquired.set()
+            await self._released.wait()
+
+    async def release(self):
+        self._released.set()
+        await self.task
+
+
+def enqueue(scheduler: PriorityScheduler, order: list, level: NotificationLevel, source: str, label=None):
+    async def run():
+        async with scheduler.slot(level, source):
+            order.append(label or source)
+    return asyncio.ensure_future(run())
+
+
+def test_parse_weights():
+    assert parse_weights("system_alert:4, beijing_permit:2,") == {"system_alert": 4.0, "beijing_permit": 2.0}
+    assert parse_weights("") == {}
+    with pytest.raises(ValueError):
+        parse_weights("system_alert")
+    with pytest.raises(ValueError):
+        parse_weights("system_alert:0")
+
+
+def test_bulk_lanes_leave_room_for_alerts():
+    async def main():
+        scheduler = PriorityScheduler("test", capacity=4, bulk_share=0.5)
+        bulk = [Holder(scheduler, INFO) for _ in range(3)]
+        await settle()
+        assert [holder.acquired.is_set() for holder in bulk] == [True, True, False]
+
+        alert = Holder(scheduler, ERROR)
+        await settle()
+        assert alert.acquired.is_set()
+        assert scheduler.stats()["waiting_info"] == 1
+
+        await bulk[0].release()
+        await settle()
+        assert bulk[2].acquired.is_set()
+
+        for holder in (alert, *bulk[1:]):
+            await holder.release()
+        assert scheduler.stats()["in_use"] == 0
+
+    asyncio.run(main())
+
+
+def test_higher_priority_lane_first():
+    async def main():
+        scheduler = PriorityScheduler("test", capacity=1)
+        holder = Holder(scheduler, INFO)
+        await settle()
+
+        order = []
+        tasks = [enqueue(scheduler, order, level, "test", level.value) for level in (INFO, WARNING, ERROR)]
+        await settle()
+        assert order == []
+
+        await holder.release()
+        await asyncio.gather(*tasks)
+        assert order == ["error", "warning", "info"]
+
+    asyncio.run(main())
+
+
+def test_fair_queueing_within_lane():
+    async def main():
+        scheduler = PriorityScheduler("test", capacity=1)
+        holder = Holder(scheduler, INFO)
+        await settle()
+
+        # 通知源 a 先提交一批，b 后提交，按完成标签交替调度
+        order = []
+        tasks = [enqueue(scheduler, order, INFO, "a") for _ in range(4)]
+        await settle()
+        tasks += [enqueue(scheduler, order, INFO, "b") for _ in range(2)]
+        await settle()
+
+        await holder.release()
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "a", "b", "a", "a"]
+
+    asyncio.run(main())
+
+
+def test_weighted_fair_queueing():
+    async def main():
+        scheduler = PriorityScheduler("test", capacity=1, weights={"alert": 3})
+        holder = Holder(scheduler, INFO)
+        await settle()
+
+        order = []
+        tasks = [enqueue(scheduler, order, INFO, "bulk") for _ in range(3)]
+        await settle()
+        tasks += [enqueue(scheduler, order, INFO, "alert") for _ in range(6)]
+        await settle()
+
+        await holder.release()
+        await asyncio.gather(*tasks)
+        # 权重为3的通知源每轮得到3个名额
+        assert order[:4].count("alert") == 3
+        assert order[4:8].count("alert") == 3
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_releases_slot():
+    async def main():
+        scheduler = PriorityScheduler("test", capacity=1)
+        holding = scheduler.slot(INFO, "test")
+        await holding.__aenter__()
+
+        # 排队中被取消
+        order = []
+        waiting = enqueue(scheduler, order, INFO, "a")
+        await settle()
+        waiting.cancel()
+        await settle()
+        assert scheduler.stats()["waiting_info"] == 0
+
+        # 名额已分配、但等待者还没运行就被取消
+        granted = enqueue(scheduler, order, INFO, "b")
+        await settle()
+        await holding.__aexit__(None, None, None)
+        granted.cancel()
+        await asyncio.gather(waiting, granted, return_exceptions=True)
+
+        assert order == []
+        assert scheduler.stats()["in_use"] == 0
+        late = Holder(scheduler, INFO)
+        await settle()
+        assert late.acquired.is_set()
+        await late.release()
+
+    asyncio.run(main())
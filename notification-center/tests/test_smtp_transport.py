@@ -0,0 +1,170 @@
+import asyncio
+import smtplib
+from email import message_from_bytes
+
+import pytest
+
+from src.mime_cache import PreparedMessage, dot_stuff
+from src.smtp_transport import AsyncSMTPConnection, _SMTPProtocol
+
+
+class FakeSMTPServer:
+    """本地明文 SMTP 服务器，记录收到的命令和邮件
+
+    pipelining 为 True 时声明 PIPELINING，并且在收到 DATA 之前不回复 MAIL/RCPT：
+    客户端如果逐条等待响应就会超时，以此确认命令确实是一次写出的。
+    """
+
+    def __init__(self, pipelining: bool = True, reject_sender: bool = False, lenient_data: bool = False):
+        self.pipelining = pipelining
+        self.reject_sender = reject_sender
+        # 没有有效收件人时仍对 DATA 回复 354
+        self.lenient_data = lenient_data
+        self.commands = []
+        self.messages = []
+
+    async def handle(self, reader, writer):
+        writer.write(b"220 fake\r\n")
+        pending = []
+        recipients = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].split(":", 1)[0].upper()
+            self.commands.append(verb)
+
+            if verb == "EHLO":
+                extensions = [b"250-fake"] + ([b"250-PIPELINING"] if self.pipelining else []) + [b"250 8BITMIME"]
+                writer.write(b"\r\n".join(extensions) + b"\r\n")
+            elif verb == "MAIL":
+                recipients = []
+                pending.append(b"550 sender refused\r\n" if self.reject_sender else b"250 ok\r\n")
+            elif verb == "RCPT":
+                if "BAD" in command.upper():
+                    pending.append(b"550 no such user\r\n")
+                else:
+                    recipients.append(command[9:-1])
+                    pending.append(b"250 ok\r\n")
+            elif verb == "DATA":
+                writer.write(b"".join(pending))
+                pending = []
+                if not recipients and not self.lenient_data:
+                    writer.write(b"503 no valid recipients\r\n")
+                    continue
+                writer.write(b"354 go ahead\r\n")
+                data = b""
+                while (line := await reader.readline()) != b".\r\n":
+                    data += line[1:] if line.startswith(b"..") else line
+                if recipients:
+                    self.messages.append((recipients, data))
+                writer.write(b"250 queued\r\n")
+            elif verb == "QUIT":
+                writer.write(b"221 bye\r\n")
+                break
+            else:
+                writer.write(b"250 ok\r\n")
+
+            if not self.pipelining:
+                writer.write(b"".join(pending))
+                pending = []
+            await writer.drain()
+        writer.close()
+
+
+async def open_connection(server: FakeSMTPServer):
+    """连接到本地服务器（跳过 STARTTLS 和登录）"""
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    connection = AsyncSMTPConnection("127.0.0.1", port, timeout=2)
+    connection._transport, connection._protocol = await asyncio.get_running_loop().create_connection(
+        _SMTPProtocol, "127.0.0.1", port
+    )
+    await connection._expect(220)
+    await connection.ehlo()
+    return listener, connection
+
+
+async def close(listener, connection):
+    await connection.quit()
+    listener.close()
+    await listener.wait_closed()
+
+
+def make_message() -> PreparedMessage:
+    return PreparedMessage("测试邮件", "sender@example.com", "正文\n.第二行", html_content="<p>正文</p>")
+
+
+@pytest.mark.parametrize("pipelining", [True, False])
+def test_refused_recipients_are_reported(pipelining):
+    async def main():
+        server = FakeSMTPServer(pipelining=pipelining)
+        listener, connection = await open_connection(server)
+        assert ("pipelining" in connection.extensions) == pipelining
+
+        refused = await connection.send_message(make_message(), ["a@example.com", "BAD@example.com", "b@example.com"])
+        await close(listener, connection)
+
+        assert list(refused) == ["BAD@example.com"]
+        assert refused["BAD@example.com"][0] == 550
+        recipients, data = server.messages[0]
+        assert recipients == ["a@example.com", "b@example.com"]
+        message = message_from_bytes(data)
+        assert message["To"] == "a@example.com, b@example.com"
+        assert message.get_payload()[0].get_payload(decode=True).decode("utf-8") == "正文\n.第二行"
+
+    asyncio.run(main())
+
+
+def test_recipients_split_into_batches():
+    async def main():
+        server = FakeSMTPServer()
+        listener, connection = await open_connection(server)
+        recipients = [f"user{i}@example.com" for i in range(5)]
+        await connection.send_message(make_message(), recipients, batch_size=2)
+        await close(listener, connection)
+
+        assert [len(batch) for batch, _ in server.messages] == [2, 2, 1]
+        assert server.commands.count("MAIL") == 3
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("pipelining,lenient_data", [(True, False), (True, True), (False, False)])
+def test_all_recipients_refused_resets_transaction(pipelining, lenient_data):
+    async def main():
+        server = FakeSMTPServer(pipelining=pipelining, lenient_data=lenient_data)
+        listener, connection = await open_connection(server)
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            await connection.send_message(make_message(), ["BAD1@example.com", "BAD2@example.com"])
+        assert server.commands[-1] == "RSET"
+        if not pipelining:
+            assert "DATA" not in server.commands
+
+        # 事务已重置，连接可以继续使用
+        await connection.send_message(make_message(), ["ok@example.com"])
+        await close(listener, connection)
+        assert [batch for batch, _ in server.messages] == [["ok@example.com"]]
+
+    asyncio.run(main())
+
+
+def test_sender_refused_resets_transaction():
+    async def main():
+        server = FakeSMTPServer(reject_sender=True)
+        listener, connection = await open_connection(server)
+        with pytest.raises(smtplib.SMTPSenderRefused):
+            await connection.send_message(make_message(), ["a@example.com"])
+        assert server.commands[-1] == "RSET"
+        assert await connection.noop()
+        await close(listener, connection)
+
+    asyncio.run(main())
+
+
+def test_dot_stuff_across_chunks():
+    stuffed, at_line_start = dot_stuff(b".a\r\n.b\r\nc", True)
+    assert (stuffed, at_line_start) == (b"..a\r\n..b\r\nc", False)
+    assert dot_stuff(b".d\r\n", at_line_start) == (b".d\r\n", True)
+    assert dot_stuff(b".e", True) == (b"..e", False)